@@ -1,26 +1,248 @@
 import streamlit as st
 import requests
+import calendar
 import json
 import uuid
 import pandas as pd
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 
 API_ENDPOINT = "YOUR_API_GATEWAY_URL"
+# Version of the JSON request envelope the Lambda validates (request_envelope.py)
+ENVELOPE_VERSION = 1
+# Function URL of the streaming front end (stream_server.py); leave as-is to use API_ENDPOINT
+STREAM_ENDPOINT = "YOUR_STREAMING_FUNCTION_URL"
+SCHEDULE_COLUMNS = ['time', 'task', 'reasoning', 'wellness_note']
+# DataFrames kept for reruns: the current schedule, unscheduled tasks and up to 10 history entries
+MAX_CACHED_FRAMES = 16
+# Cognito user pool app client (no secret, USER_PASSWORD_AUTH enabled) of the API's authorizer.
+# Left as-is, the app does not sign in and every request is the Lambda's DEFAULT_USER_ID (one user)
+COGNITO_CLIENT_ID = "YOUR_COGNITO_APP_CLIENT_ID"
+COGNITO_REGION = "us-east-1"
+USE_AUTH = not COGNITO_CLIENT_ID.startswith("YOUR_")
+# A Function URL has no Cognito authorizer, so signed-in users plan through API_ENDPOINT
+USE_STREAMING = not STREAM_ENDPOINT.startswith("YOUR_") and not USE_AUTH
 
 st.set_page_config(page_title="MoodFlow", page_icon="🌊", layout="wide")
 
-if 'session_id' not in st.session_state:
+def reset_session():
+    """Start a new conversation with no schedule loaded and nothing cached"""
     st.session_state.session_id = str(uuid.uuid4())
     st.session_state.messages = []
     st.session_state.current_schedule = None
     st.session_state.current_mood = None
     st.session_state.unscheduled_tasks = []
+    st.session_state.suggested_dates = []
     st.session_state.schedule_history = []
     st.session_state.current_schedule_date = None
+    st.session_state.schedule_version = None
+    st.session_state.calendar_cache = {}
+    st.session_state.schedule_cache = {}
+    st.session_state.frame_cache = {}
+
+if 'session_id' not in st.session_state:
+    reset_session()
+
+@st.cache_resource
+def http_session():
+    """One pooled HTTP session per app process, so requests reuse TCP/TLS connections"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=10)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Content-Type'] = 'application/json'
+    return session
+
+def cognito_auth(flow, parameters):
+    """Run a Cognito InitiateAuth flow; returns its AuthenticationResult"""
+    response = http_session().post(
+        f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/",
+        headers={'Content-Type': 'application/x-amz-json-1.1',
+                 'X-Amz-Target': 'AWSCognitoIdentityProviderService.InitiateAuth'},
+        data=json.dumps({'AuthFlow': flow, 'ClientId': COGNITO_CLIENT_ID, 'AuthParameters': parameters}),
+        timeout=10
+    )
+    if response.status_code != 200:
+        raise RuntimeError(response.json().get('message', 'Sign-in failed'))
+    result = response.json().get('AuthenticationResult')
+    if result is None:
+        raise RuntimeError("This account needs another sign-in step (e.g. a new password) first")
+    return result
+
+def store_tokens(result):
+    st.session_state.id_token = result['IdToken']
+    st.session_state.token_expires = datetime.now() + timedelta(seconds=result['ExpiresIn'] - 60)
+    st.session_state.refresh_token = result.get('RefreshToken', st.session_state.get('refresh_token'))
+
+def auth_headers():
+    """The signed-in user's ID token for the API Gateway authorizer, refreshed shortly before it expires"""
+    if not USE_AUTH or not st.session_state.get('id_token'):
+        return {}
+    if datetime.now() >= st.session_state.token_expires:
+        store_tokens(cognito_auth('REFRESH_TOKEN_AUTH', {'REFRESH_TOKEN': st.session_state.refresh_token}))
+    return {'Authorization': st.session_state.id_token}
+
+def sign_out():
+    for key in ('id_token', 'token_expires', 'refresh_token'):
+        st.session_state.pop(key, None)
+    reset_session()
+
+def api_post(payload, url=API_ENDPOINT, **kwargs):
+    """POST a request envelope for this conversation and user over the pooled session"""
+    kwargs.setdefault('timeout', 30)
+    kwargs['headers'] = {**auth_headers(), **kwargs.get('headers', {})}
+    return http_session().post(url, params={'session_id': st.session_state.session_id}, json=payload, **kwargs)
+
+def invalidate_schedules():
+    """Forget cached dates and calendar ranges after a save (a plan can also move tasks to another date)"""
+    st.session_state.schedule_cache = {}
+    st.session_state.calendar_cache = {}
+
+def fetch_schedule(day):
+    """The stored schedule for a date as a view response, cached per date until the next save"""
+    key = day.isoformat()
+    if key not in st.session_state.schedule_cache:
+        response = api_post(envelope('view', date=key))
+        response.raise_for_status()
+        st.session_state.schedule_cache[key] = response.json()
+    return st.session_state.schedule_cache[key]
+
+def schedule_frame(rows, columns=None):
+    """DataFrame for a list of rows, built once per list so reruns do not rebuild unchanged tables"""
+    cache = st.session_state.frame_cache
+    key = (id(rows), tuple(columns or ()))
+    entry = cache.get(key)
+    # The cached entry holds the list itself, so its id cannot be reused by another list
+    if entry is None or entry[0] is not rows:
+        df = pd.DataFrame(rows)
+        if columns:
+            df = df[[col for col in columns if col in df.columns]]
+        entry = cache[key] = (rows, df)
+        while len(cache) > MAX_CACHED_FRAMES:
+            cache.pop(next(iter(cache)))
+    return entry[1]
+
+class PlanError(RuntimeError):
+    """An error answer from the planner with its HTTP status (and Retry-After seconds for a 429)"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status or 500
+        self.retry_after = retry_after
+
+def post_plan(payload):
+    """POST a plan request; returns the response body or raises PlanError"""
+    response = api_post(payload)
+    if response.status_code != 200:
+        try:
+            error = response.json().get('error', response.text)
+        except ValueError:
+            error = response.text
+        raise PlanError(error, response.status_code, response.headers.get('Retry-After'))
+    return response.json()
+
+def stream_plan(payload):
+    """Post to the streaming endpoint, rendering rows as they arrive; returns the final response"""
+    message_placeholder = st.empty()
+    table_placeholder = st.empty()
+    rows = []
+    
+    with api_post(payload, STREAM_ENDPOINT, stream=True, timeout=(5, 30)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            
+            if event['event'] == 'item':
+                item = event['data']
+                if event['name'] == 'tasks':
+                    # Local scheduling engine: times are filled in once all tasks are known
+                    item = {'time': 'planning...', 'task': item.get('task', ''), 'reasoning': item.get('reasoning', '')}
+                rows.append(item)
+                table_placeholder.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            elif event['event'] == 'field' and event['name'] == 'response_message':
+                message_placeholder.info(event['data'])
+            elif event['event'] == 'error':
+                error = event['data']
+                raise PlanError(error['error'], error.get('status'), error.get('retry_after'))
+            elif event['event'] == 'done':
+                message_placeholder.empty()
+                table_placeholder.empty()
+                return event['data']
+    
+    raise RuntimeError("Stream ended before the plan was complete")
+
+def envelope(action, **fields):
+    """Versioned request body for the Lambda"""
+    return {'version': ENVELOPE_VERSION, 'action': action, 'session_id': st.session_state.session_id, **fields}
+
+def calendar_weeks(anchor, view):
+    """Rows of 7 dates (Monday first) for the week or month containing anchor"""
+    if view == "Week":
+        monday = anchor - timedelta(days=anchor.weekday())
+        return [[monday + timedelta(days=i) for i in range(7)]]
+    return calendar.Calendar().monthdatescalendar(anchor.year, anchor.month)
+
+def fetch_calendar(start_date, end_date):
+    """All stored schedules between two dates in one request, cached per range"""
+    key = (start_date.isoformat(), end_date.isoformat())
+    if key not in st.session_state.calendar_cache:
+        response = api_post(envelope('calendar', start_date=key[0], end_date=key[1]))
+        response.raise_for_status()
+        st.session_state.calendar_cache[key] = response.json()['days']
+    return st.session_state.calendar_cache[key]
+
+def render_calendar(weeks, days, month=None):
+    """Draw one column per weekday with each date's mood and tasks"""
+    mood_emoji = {
+        'stressed': '😰',
+        'energized': '⚡',
+        'anxious': '😟',
+        'focused': '🎯',
+        'tired': '😴',
+        'sad': '😢',
+        'happy': '😊',
+        'unknown': '❓'
+    }
+    for week in weeks:
+        for column, day in zip(st.columns(7), week):
+            with column:
+                if month is not None and day.month != month:
+                    st.caption(day.strftime('%b %d'))
+                    continue
+                st.markdown(f"**{day.strftime('%a %d')}**")
+                entry = days.get(day.isoformat())
+                if entry is None:
+                    st.caption("—")
+                    continue
+                mood = entry.get('mood', 'unknown')
+                st.caption(f"{mood_emoji.get(mood, '❓')} {mood}")
+                for row in entry['schedule']:
+                    if row['task'] != 'Break':
+                        st.caption(f"{row['time']} · {row['task']}")
+                if entry['unscheduled_count']:
+                    st.caption(f"⚠️ {entry['unscheduled_count']} unscheduled")
+                if entry.get('free_minutes') is not None:
+                    st.caption(f"🕒 {entry['free_minutes'] / 60:.1f}h free")
 
 st.title("🌊 MoodFlow: Emotion-Aware AI Planner")
 st.caption("AWS Bedrock + Knowledge Base + Guardrails | UCLA Gen AI Hackathon 2025")
 
+# Each user's schedules are stored under their Cognito user id
+if USE_AUTH and not st.session_state.get('id_token'):
+    with st.form("sign_in"):
+        st.subheader("Sign in")
+        username = st.text_input("Email")
+        password = st.text_input("Password", type="password")
+        if st.form_submit_button("Sign in"):
+            try:
+                store_tokens(cognito_auth('USER_PASSWORD_AUTH', {'USERNAME': username, 'PASSWORD': password}))
+                reset_session()
+                st.rerun()
+            except Exception as e:
+                st.error(f"Sign-in failed: {str(e)}")
+    st.stop()
+
 with st.sidebar:
     st.header("Planning Parameters")
     
@@ -33,31 +255,20 @@ with st.sidebar:
     
     # Quick view button
     if st.button("📅 View Schedule for This Date"):
-        date_display = selected_date.strftime('%A, %B %d, %Y')
-        view_message = f"show me schedule\n\n[Planning for {date_display} | Start: {st.session_state.get('start_work_time', time(9, 0)).strftime('%I:%M %p')} | End by: {st.session_state.get('work_until', time(17, 0)).strftime('%I:%M %p')}]"
-        
         with st.spinner("Fetching schedule..."):
             try:
-                response = requests.post(
-                    API_ENDPOINT,
-                    params={'session_id': st.session_state.session_id},
-                    json={'message': view_message},
-                    headers={'Content-Type': 'application/json'},
-                    timeout=30
-                )
+                data = fetch_schedule(selected_date)
+                schedule = data.get('schedule', [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    schedule = data.get('schedule', [])
-                    
-                    if schedule:
-                        st.session_state.current_schedule = schedule
-                        st.session_state.current_mood = data.get('mood_detected', 'unknown')
-                        st.session_state.current_schedule_date = selected_date
-                        st.success(f"Loaded schedule for {selected_date.strftime('%B %d')}")
-                        st.rerun()
-                    else:
-                        st.warning("No schedule found for this date")
+                if schedule:
+                    st.session_state.current_schedule = schedule
+                    st.session_state.current_mood = data.get('mood_detected', 'unknown')
+                    st.session_state.current_schedule_date = selected_date
+                    st.session_state.schedule_version = data.get('schedule_version')
+                    st.success(f"Loaded schedule for {selected_date.strftime('%B %d')}")
+                    st.rerun()
+                else:
+                    st.warning("No schedule found for this date")
             except Exception as e:
                 st.error(f"Error: {str(e)}")
     
@@ -92,13 +303,11 @@ with st.sidebar:
     st.divider()
     
     if st.button("Reset Session"):
-        st.session_state.session_id = str(uuid.uuid4())
-        st.session_state.messages = []
-        st.session_state.current_schedule = None
-        st.session_state.current_mood = None
-        st.session_state.unscheduled_tasks = []
-        st.session_state.schedule_history = []
-        st.session_state.current_schedule_date = None
+        reset_session()
+        st.rerun()
+    
+    if USE_AUTH and st.button("Sign out"):
+        sign_out()
         st.rerun()
 
 st.warning(f"⏰ Planning for **{selected_date.strftime('%A, %B %d')}** | Start: **{start_work_time.strftime('%I:%M %p')}** | End by: **{work_until.strftime('%I:%M %p')}**")
@@ -110,8 +319,16 @@ for msg in st.session_state.messages:
 user_input = st.chat_input("Tell me about your tasks and how you're feeling...")
 
 if user_input:
-    date_display = selected_date.strftime('%A, %B %d, %Y')
-    enhanced_message = f"{user_input}\n\n[Planning for {date_display} | Start: {start_work_time.strftime('%I:%M %p')} | End by: {work_until.strftime('%I:%M %p')}]"
+    payload = envelope(
+        'plan',
+        message=user_input,
+        date=selected_date.isoformat(),
+        start=start_work_time.strftime('%H:%M'),
+        end=work_until.strftime('%H:%M')
+    )
+    # Edits are applied only if nobody changed the schedule since we loaded it (409 otherwise)
+    if st.session_state.current_schedule_date == selected_date and st.session_state.schedule_version is not None:
+        payload['schedule_version'] = st.session_state.schedule_version
     
     st.session_state.messages.append({"role": "user", "content": user_input})
     
@@ -120,17 +337,27 @@ if user_input:
     
     with st.spinner("Planning your day..."):
         try:
-            response = requests.post(
-                API_ENDPOINT,
-                params={'session_id': st.session_state.session_id},
-                json={'message': enhanced_message},
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
+            # Streamed and plain answers fail the same way, so 409 and 429 are handled once
+            try:
+                data = stream_plan(payload) if USE_STREAMING else post_plan(payload)
+                failure = None
+            except PlanError as e:
+                data, failure = None, e
+            succeeded = failure is None
             
-            if response.status_code == 200:
-                data = response.json()
-                
+            # A typed "show my schedule for oct 8" answers for another date than the one being planned
+            shown_date = datetime.fromisoformat(data['date']).date() if succeeded and data.get('date') else selected_date
+            if succeeded and shown_date != selected_date:
+                bot_message = data.get('response_message', '')
+                st.session_state.messages.append({"role": "assistant", "content": bot_message})
+                # Keep planning selected_date: its schedule and version stay as they are
+                st.session_state.schedule_cache[shown_date.isoformat()] = data
+                with st.chat_message("assistant"):
+                    st.write(bot_message)
+                    if data.get('schedule'):
+                        st.dataframe(schedule_frame(data['schedule'], SCHEDULE_COLUMNS),
+                                     use_container_width=True, hide_index=True)
+            elif succeeded:
                 bot_message = data.get('response_message', 'Schedule created!')
                 schedule = data.get('schedule', [])
                 mood = data.get('mood_detected', 'unknown')
@@ -144,7 +371,14 @@ if user_input:
                 st.session_state.current_schedule = schedule
                 st.session_state.current_mood = mood
                 st.session_state.unscheduled_tasks = unscheduled
+                st.session_state.suggested_dates = data.get('suggested_dates', [])
                 st.session_state.current_schedule_date = selected_date
+                st.session_state.schedule_version = data.get('schedule_version')
+                # Saved schedules changed; refetch dates and the calendar, but the
+                # planning date's fresh state is this response
+                invalidate_schedules()
+                if data.get('conversation_state') != 'viewing':
+                    st.session_state.schedule_cache[selected_date.isoformat()] = data
                 
                 # Add to history
                 st.session_state.schedule_history.append({
@@ -173,8 +407,18 @@ if user_input:
                     }
                     st.write(f"**Detected mood:** {mood_emoji.get(mood, '❓')} {mood}")
                 
+            elif failure.status == 409:
+                st.session_state.schedule_version = None
+                st.session_state.schedule_cache.pop(selected_date.isoformat(), None)
+                st.warning("This schedule was changed in another tab or request. "
+                           "Click \"View Schedule for This Date\" to load the latest version, then try again.")
+            elif failure.status == 401:
+                sign_out()
+                st.warning("Your sign-in has expired. Please sign in again.")
+            elif failure.status == 429:
+                st.warning(f"{failure or 'Too many requests.'} (retry in {failure.retry_after or 'a few'} seconds)")
             else:
-                st.error(f"API Error: {response.status_code} - {response.text}")
+                st.error(f"API Error: {failure.status} - {failure}")
                 
         except requests.exceptions.Timeout:
             st.error("Request timed out.")
@@ -188,14 +432,8 @@ if st.session_state.current_schedule:
     schedule_date = st.session_state.current_schedule_date if st.session_state.current_schedule_date else selected_date
     st.header(f"📅 Your Optimized Schedule for {schedule_date.strftime('%A, %B %d, %Y')}")
     
-    df = pd.DataFrame(st.session_state.current_schedule)
-    
-    column_order = ['time', 'task', 'reasoning', 'wellness_note']
-    existing_cols = [col for col in column_order if col in df.columns]
-    df = df[existing_cols]
-    
     st.dataframe(
-        df,
+        schedule_frame(st.session_state.current_schedule, SCHEDULE_COLUMNS),
         use_container_width=True,
         hide_index=True,
         column_config={
@@ -225,7 +463,7 @@ if st.session_state.current_schedule:
         with st.expander("📜 Previous versions"):
             for idx, hist in enumerate(reversed(st.session_state.schedule_history[:-1])):
                 st.caption(f"{hist['date'].strftime('%A, %B %d')} - Version {len(st.session_state.schedule_history) - idx - 1} ({hist['timestamp'].strftime('%I:%M %p')}) - Mood: {hist['mood']}")
-                hist_df = pd.DataFrame(hist['schedule'])
+                hist_df = schedule_frame(hist['schedule'])
                 if not hist_df.empty:
                     st.dataframe(hist_df, use_container_width=True, hide_index=True)
                 st.divider()
@@ -233,7 +471,28 @@ if st.session_state.current_schedule:
 if st.session_state.unscheduled_tasks:
     st.divider()
     st.warning("⚠️ These tasks didn't fit in today's schedule:")
-    unscheduled_df = pd.DataFrame(st.session_state.unscheduled_tasks)
+    unscheduled_df = schedule_frame(st.session_state.unscheduled_tasks)
     st.dataframe(unscheduled_df, use_container_width=True, hide_index=True)
 
+    if st.session_state.suggested_dates:
+        free_days = ', '.join(
+            f"{datetime.fromisoformat(s['date']).strftime('%a, %b %d')} ({s['free_minutes'] / 60:.1f}h free)"
+            for s in st.session_state.suggested_dates
+        )
+        st.success(f"📆 Dates with room for these: {free_days}")
+
     st.info("💬 Tell me which date you'd like to schedule these for (e.g., 'Schedule documentation for Oct 8')")
+
+st.divider()
+st.header("🗓️ Calendar")
+calendar_view = st.radio("View", ["Week", "Month"], horizontal=True, label_visibility="collapsed")
+weeks = calendar_weeks(selected_date, calendar_view)
+
+if st.button("🔄 Refresh calendar"):
+    invalidate_schedules()
+
+try:
+    days = fetch_calendar(weeks[0][0], weeks[-1][-1])
+    render_calendar(weeks, days, month=selected_date.month if calendar_view == "Month" else None)
+except Exception as e:
+    st.error(f"Could not load calendar: {str(e)}")
@@ -0,0 +1,120 @@
+"""Shared AWS clients, created on first use.
+
+boto3 and botocore are only imported when a client is first needed, so
+importing lambda_function stays cheap and a cold start that serves a
+cached or local response never pays for them. Each client is created
+once per container (and region) with explicit connection-pool, timeout
+and retry settings and then reused by every invocation and prefetch thread.
+bedrock-runtime has botocore retries off: model_client retries with its
+own rate limiter, backoff and deadline.
+
+DynamoDB is used through the low-level client with the small serializer
+below instead of the resource API: numbers come back as int/float rather
+than Decimal, and no TypeDeserializer runs on every attribute.
+"""
+import threading
+
+REGION = 'us-east-1'
+
+# botocore Config per service
+CLIENT_CONFIGS = {
+    'bedrock-runtime': {
+        'connect_timeout': 3,
+        # Within the 29 s API Gateway limit, leaving time for a degraded answer
+        'read_timeout': 25,
+        'max_pool_connections': 10,
+        'retries': {'mode': 'standard', 'total_max_attempts': 1}
+    },
+    'bedrock-agent-runtime': {
+        'connect_timeout': 3,
+        'read_timeout': 10,
+        'max_pool_connections': 10,
+        'retries': {'mode': 'standard', 'max_attempts': 2}
+    },
+    'dynamodb': {
+        'connect_timeout': 2,
+        'read_timeout': 5,
+        'max_pool_connections': 10,
+        'retries': {'mode': 'standard', 'max_attempts': 3}
+    },
+    'sqs': {
+        'connect_timeout': 2,
+        'read_timeout': 5,
+        'max_pool_connections': 10,
+        'retries': {'mode': 'standard', 'max_attempts': 3}
+    },
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+def _client_key(service, region):
+    return service if region in (None, REGION) else f'{service}@{region}'
+
+def client(service, region=None):
+    """The shared client for a service (in REGION unless given), created on first use"""
+    key = _client_key(service, region)
+    if key not in _clients:
+        with _lock:
+            if key not in _clients:
+                import boto3
+                from botocore.config import Config
+                _clients[key] = boto3.client(
+                    service, region_name=region or REGION, config=Config(**CLIENT_CONFIGS[service])
+                )
+    return _clients[key]
+
+def set_client(service, instance, region=None):
+    """Use `instance` for a service (fakes in benchmarks, or a pre-built client)"""
+    with _lock:
+        _clients[_client_key(service, region)] = instance
+
+def reset_clients():
+    """Forget all clients so the next call creates them again"""
+    with _lock:
+        _clients.clear()
+
+def to_attribute(value):
+    """Python value -> DynamoDB attribute value"""
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float)):
+        return {'N': repr(value)}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bytes):
+        return {'B': value}
+    if isinstance(value, dict):
+        return {'M': {key: to_attribute(item) for key, item in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'L': [to_attribute(item) for item in value]}
+    raise TypeError(f"Unsupported DynamoDB value: {type(value).__name__}")
+
+def from_attribute(attribute):
+    """DynamoDB attribute value -> Python value (numbers as int or float)"""
+    (kind, value), = attribute.items()
+    if kind == 'S':
+        return value
+    if kind == 'N':
+        return float(value) if any(c in value for c in '.eE') else int(value)
+    if kind == 'M':
+        return {key: from_attribute(item) for key, item in value.items()}
+    if kind == 'L':
+        return [from_attribute(item) for item in value]
+    if kind == 'B':
+        return value
+    if kind == 'BOOL':
+        return value
+    if kind == 'NULL':
+        return None
+    raise TypeError(f"Unsupported DynamoDB attribute type: {kind}")
+
+def serialize_item(item):
+    """Plain dict -> DynamoDB item"""
+    return {key: to_attribute(value) for key, value in item.items()}
+
+def deserialize_item(item):
+    """DynamoDB item -> plain dict"""
+    return {key: from_attribute(value) for key, value in item.items()}
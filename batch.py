@@ -0,0 +1,254 @@
+"""Batch planning: many days, or many users' days, planned in the background.
+
+submit() validates a list of jobs (a date, a window and a message or a
+task list each), records the batch in BATCH_TABLE and sends the jobs to
+the SQS queue BATCH_QUEUE_URL, JOBS_PER_MESSAGE jobs per message, so the
+caller gets a batch id at once instead of waiting on the model.
+lambda_function.batch_handler is the queue's Lambda consumer: it plans the
+jobs of a delivery concurrently and writes their results here with
+BatchWriteItem. status() reports progress from those result items, so
+clients poll instead of blocking.
+
+The table has partition key batch_id and sort key job_key: one "batch"
+item (owner, total, creation time) and one "job#<index>" item per finished
+job. Results are keyed by job, so a redelivered message overwrites its own
+results and progress is never counted twice. Every item has the TTL
+attribute expires_at.
+
+Jobs submitted through the API always plan for the caller. A trusted
+producer (a scheduled Lambda planning everyone's week) calls
+submit(..., trusted=True) and may name a user_id per job.
+"""
+import json
+import os
+import time
+import uuid
+
+import aws_clients
+import metrics
+import request_envelope
+
+TABLE = os.environ.get('BATCH_TABLE', 'moodflow_jobs')
+QUEUE_URL = os.environ.get('BATCH_QUEUE_URL', '')
+MAX_JOBS = int(os.environ.get('BATCH_MAX_JOBS', '100'))
+# Jobs planned at once per consumer; the model's own rate limit still applies
+CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+# Model deadline per job (a queue consumer is not held to API Gateway's 29 s)
+JOB_SECONDS = float(os.environ.get('BATCH_JOB_SECONDS', '120'))
+TTL_SECONDS = int(os.environ.get('BATCH_TTL', str(7 * 24 * 3600)))
+
+JOBS_PER_MESSAGE = 10
+# SendMessageBatch and BatchWriteItem request limits
+SEND_BATCH_SIZE = 10
+WRITE_BATCH_SIZE = 25
+MAX_WRITE_ATTEMPTS = 5
+SUMMARY_KEY = 'batch'
+JOB_PREFIX = 'job#'
+
+class BatchNotFound(LookupError):
+    """No batch with that id belongs to the caller; answered with a 404"""
+
+def _job_key(index):
+    return f'{JOB_PREFIX}{index:05d}'
+
+def _task_text(task):
+    if isinstance(task, dict):
+        minutes = task.get('duration_minutes')
+        return f"{task.get('task', '')} ({minutes} min)" if minutes else str(task.get('task', ''))
+    return str(task)
+
+def job_message(job):
+    """The planning message of a job: its own, or one written from its mood and tasks"""
+    if job.get('message'):
+        return job['message']
+    parts = []
+    if job.get('mood'):
+        parts.append(f"I'm feeling {job['mood']}.")
+    tasks = job.get('tasks')
+    if isinstance(tasks, list) and tasks:
+        parts.append('Plan these tasks: ' + ', '.join(_task_text(task) for task in tasks) + '.')
+    return ' '.join(parts)
+
+def job_request(job):
+    """The validated plan request for a job, as parse_request builds it for the API"""
+    request = request_envelope.parse_envelope({
+        'version': request_envelope.ENVELOPE_VERSION,
+        'action': 'plan',
+        'message': job_message(job),
+        'date': job.get('date'),
+        'start': job.get('start', '09:00'),
+        'end': job.get('end', '17:00')
+    }, None)
+    request['user_id'] = job['user_id']
+    return request
+
+def validate_jobs(user_id, jobs, trusted=False):
+    """The jobs as queued: validated, numbered and assigned to a user"""
+    if not isinstance(jobs, list) or not jobs:
+        raise request_envelope.RequestError('jobs must be a non-empty list')
+    if len(jobs) > MAX_JOBS:
+        raise request_envelope.RequestError(f'A batch can have at most {MAX_JOBS} jobs')
+
+    queued = []
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise request_envelope.RequestError(f'jobs[{index}] must be an object')
+        job_user = job.get('user_id', user_id) if trusted else user_id
+        if job.get('user_id', job_user) != job_user:
+            raise request_envelope.RequestError(f'jobs[{index}] can only plan for the signed-in user')
+        job = {**job, 'index': index, 'user_id': job_user}
+        try:
+            request = job_request(job)
+        except request_envelope.RequestError as e:
+            raise request_envelope.RequestError(f'jobs[{index}]: {e}')
+        queued.append({
+            'index': index,
+            'user_id': job_user,
+            'date': request['date_str'],
+            'start': job.get('start', '09:00'),
+            'end': job.get('end', '17:00'),
+            'message': request['user_message']
+        })
+    return queued
+
+def _send(batch_id, jobs):
+    """Queue the jobs JOBS_PER_MESSAGE to a message, SEND_BATCH_SIZE messages per call"""
+    bodies = [
+        json.dumps({'batch_id': batch_id, 'jobs': jobs[i:i + JOBS_PER_MESSAGE]}, sort_keys=True)
+        for i in range(0, len(jobs), JOBS_PER_MESSAGE)
+    ]
+    sqs = aws_clients.client('sqs')
+    for start in range(0, len(bodies), SEND_BATCH_SIZE):
+        entries = []
+        for offset, body in enumerate(bodies[start:start + SEND_BATCH_SIZE]):
+            entry = {'Id': str(start + offset), 'MessageBody': body}
+            if QUEUE_URL.endswith('.fifo'):
+                entry['MessageGroupId'] = batch_id
+                entry['MessageDeduplicationId'] = f'{batch_id}-{start + offset}'
+            entries.append(entry)
+        response = sqs.send_message_batch(QueueUrl=QUEUE_URL, Entries=entries)
+        if response.get('Failed'):
+            raise RuntimeError(f"Could not queue batch {batch_id}: {response['Failed'][0].get('Message')}")
+    return len(bodies)
+
+@metrics.timed('batch_submit')
+def submit(user_id, jobs, trusted=False):
+    """Record and queue a batch; returns its id and size for the 202 response"""
+    queued = validate_jobs(user_id, jobs, trusted)
+    batch_id = uuid.uuid4().hex
+    now = int(time.time())
+    aws_clients.client('dynamodb').put_item(
+        TableName=TABLE,
+        Item=aws_clients.serialize_item({
+            'batch_id': batch_id,
+            'job_key': SUMMARY_KEY,
+            'owner_id': user_id,
+            'total': len(queued),
+            'created_at': now,
+            'expires_at': now + TTL_SECONDS
+        })
+    )
+    messages = _send(batch_id, queued)
+    metrics.record('batch_jobs_queued', len(queued))
+    return {'batch_id': batch_id, 'status': 'queued', 'total': len(queued), 'messages': messages}
+
+def job_result(job, response=None, error=None):
+    """The stored result item of a finished job"""
+    now = int(time.time())
+    result = {
+        'job_key': _job_key(job['index']),
+        'index': job['index'],
+        'user_id': job['user_id'],
+        'schedule_date': job.get('date', ''),
+        'job_status': 'failed' if error is not None else 'done',
+        'finished_at': now,
+        'expires_at': now + TTL_SECONDS
+    }
+    if error is not None:
+        result['error'] = str(error)
+    else:
+        # As JSON text: the response is only ever read back whole
+        result['response'] = json.dumps(response)
+    return result
+
+@metrics.timed('batch_write')
+def write_results(batch_id, results):
+    """Put result items WRITE_BATCH_SIZE per BatchWriteItem call, retrying unprocessed items"""
+    dynamodb = aws_clients.client('dynamodb')
+    requests = [
+        {'PutRequest': {'Item': aws_clients.serialize_item({'batch_id': batch_id, **result})}}
+        for result in results
+    ]
+    for start in range(0, len(requests), WRITE_BATCH_SIZE):
+        pending = {TABLE: requests[start:start + WRITE_BATCH_SIZE]}
+        for attempt in range(MAX_WRITE_ATTEMPTS):
+            pending = dynamodb.batch_write_item(RequestItems=pending).get('UnprocessedItems') or {}
+            if not pending:
+                break
+            metrics.record('batch_write_retries', 1)
+            time.sleep(min(1.0, 0.05 * 2 ** attempt))
+        else:
+            raise RuntimeError(f'{len(pending[TABLE])} results of batch {batch_id} were not written')
+
+def _query(batch_id, attributes):
+    names = {f'#a{i}': attribute for i, attribute in enumerate(attributes)}
+    query_args = {
+        'TableName': TABLE,
+        'KeyConditionExpression': 'batch_id = :batch AND job_key BETWEEN :first AND :last',
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': aws_clients.serialize_item({
+            ':batch': batch_id,
+            ':first': JOB_PREFIX,
+            ':last': JOB_PREFIX + '~'
+        })
+    }
+    items = []
+    while True:
+        response = aws_clients.client('dynamodb').query(**query_args)
+        items.extend(aws_clients.deserialize_item(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+@metrics.timed('batch_status')
+def status(user_id, batch_id, include_results=False):
+    """Progress of one of the user's batches, and the finished jobs' results if asked"""
+    if not isinstance(batch_id, str) or not batch_id:
+        raise request_envelope.RequestError('batch_id is required')
+    response = aws_clients.client('dynamodb').get_item(
+        TableName=TABLE,
+        Key=aws_clients.serialize_item({'batch_id': batch_id, 'job_key': SUMMARY_KEY})
+    )
+    summary = aws_clients.deserialize_item(response.get('Item', {}))
+    # Someone else's batch looks the same as a missing one
+    if summary.get('owner_id') != user_id:
+        raise BatchNotFound(f'No batch {batch_id}')
+
+    attributes = ['index', 'job_status']
+    if include_results:
+        attributes += ['user_id', 'schedule_date', 'response', 'error']
+    finished = _query(batch_id, attributes)
+    failed = sum(1 for item in finished if item['job_status'] == 'failed')
+    total = summary['total']
+    payload = {
+        'batch_id': batch_id,
+        'status': 'complete' if len(finished) >= total else 'running' if finished else 'queued',
+        'total': total,
+        'done': len(finished) - failed,
+        'failed': failed,
+        'pending': max(0, total - len(finished)),
+        'created_at': summary['created_at']
+    }
+    if include_results:
+        payload['results'] = [
+            {
+                'index': item['index'],
+                'user_id': item['user_id'],
+                'date': item['schedule_date'],
+                'status': item['job_status'],
+                **({'response': json.loads(item['response'])} if 'response' in item else {'error': item.get('error', '')})
+            }
+            for item in finished
+        ]
+    return payload
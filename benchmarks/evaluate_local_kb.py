@@ -0,0 +1,101 @@
+"""Offline comparison of the local BM25 index against the Bedrock Knowledge Base.
+
+For each query, the remote top-k chunks are mapped onto the closest local
+chunk (by token overlap, since the two sides chunk the documents
+differently) and compared with the local top-k.
+
+    # Record remote results once (needs AWS credentials and KB_ID)
+    python benchmarks/evaluate_local_kb.py --live --record remote.json
+
+    # Re-run the comparison offline any number of times
+    python benchmarks/evaluate_local_kb.py --remote-results remote.json
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_kb
+
+SAMPLE_QUERIES = [
+    "I'm feeling stressed. I need to finish the dashboard (3 hours) and prepare slides (1 hour)",
+    "I'm so tired today, just emails and a code review",
+    "Feeling energized! Refactor the backend, system design doc, team sync at 2pm",
+    "I'm anxious about my client presentation at 11",
+    "Feeling a bit down, need to write documentation and fix some bugs",
+    "I'm happy and motivated, brainstorming session and learning a new framework",
+    "Focused today: deep debugging of the payment service for 3 hours",
+    "Exhausted after a long week, organize files and plan tomorrow",
+    "Overwhelmed with deadlines, how should I take breaks?",
+    "What should I do for lunch breaks when I'm sad?",
+]
+
+def best_local_match(text, chunks):
+    """Index of the local chunk sharing the most tokens with a remote chunk"""
+    remote_tokens = set(local_kb.tokenize(text))
+    best, best_score = None, 0.0
+    for i, chunk in enumerate(chunks):
+        chunk_tokens = set(local_kb.tokenize(chunk['text']))
+        union = remote_tokens | chunk_tokens
+        score = len(remote_tokens & chunk_tokens) / len(union) if union else 0.0
+        if score > best_score:
+            best, best_score = i, score
+    return best
+
+def evaluate(queries, remote_results, k):
+    """Per-query overlap@k between local and (mapped) remote results"""
+    index = local_kb.get_index()
+    chunk_ids = {id(chunk): i for i, chunk in enumerate(index.chunks)}
+    rows = []
+    for query in queries:
+        local_ids = [chunk_ids[id(chunk)] for _, chunk in index.search(query, k)]
+        remote_ids = {
+            best_local_match(text, index.chunks) for text in remote_results.get(query, [])[:k]
+        }
+        overlap = len(set(local_ids) & remote_ids) / k
+        rows.append({
+            'query': query,
+            'overlap': overlap,
+            'top1_match': bool(local_ids) and local_ids[0] in remote_ids
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', help='JSON file with a list of queries (default: built-in samples)')
+    parser.add_argument('--remote-results', help='JSON file mapping query -> list of remote chunk texts')
+    parser.add_argument('--live', action='store_true', help='Query the Bedrock Knowledge Base directly')
+    parser.add_argument('--record', help='Write the remote results used to this JSON file')
+    parser.add_argument('-k', type=int, default=3)
+    args = parser.parse_args()
+
+    queries = SAMPLE_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = json.load(f)
+
+    if args.live:
+        from lambda_function import retrieve_bedrock_chunks
+        remote_results = {query: retrieve_bedrock_chunks(query) for query in queries}
+    elif args.remote_results:
+        with open(args.remote_results) as f:
+            remote_results = json.load(f)
+    else:
+        parser.error('either --live or --remote-results is required')
+
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(remote_results, f, indent=2)
+
+    rows = evaluate(queries, remote_results, args.k)
+    for row in rows:
+        print(f"{row['overlap']:.2f}  {'top1' if row['top1_match'] else '    '}  {row['query'][:70]}")
+
+    mean_overlap = sum(row['overlap'] for row in rows) / len(rows)
+    top1_rate = sum(row['top1_match'] for row in rows) / len(rows)
+    print(f"\nmean overlap@{args.k}: {mean_overlap:.2f}   top-1 agreement: {top1_rate:.2f}   queries: {len(rows)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+"""In-process stand-ins for the AWS services the Lambda calls.
+
+Each fake answers the same low-level client calls lambda_function makes,
+after sleeping for a configurable latency, so the pipeline can be driven
+without AWS credentials. Install them with install(); they are injected
+through aws_clients.set_client.
+"""
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aws_clients
+import local_kb
+
+# Canned model output for each scheduling engine
+LOCAL_ENGINE_OUTPUT = {
+    "mood_detected": "stressed",
+    "conversation_state": "scheduling_new",
+    "response_message": "I've planned your day around short focused blocks with breaks, starting with a quick win.",
+    "tasks": [
+        {"task": "Reply to emails", "duration_minutes": 45, "difficulty": "easy", "fixed_start": None,
+         "reasoning": "A quick win builds momentum.", "wellness_note": "Close other tabs."},
+        {"task": "Project proposal", "duration_minutes": 180, "difficulty": "hard", "fixed_start": None,
+         "reasoning": "Tackled in blocks while energy is steady.", "wellness_note": "Breathe between blocks."},
+        {"task": "Team sync", "duration_minutes": 30, "difficulty": "medium", "fixed_start": "2:00 PM",
+         "reasoning": "Fixed meeting.", "wellness_note": "Stretch first."},
+        {"task": "Code review", "duration_minutes": 90, "difficulty": "medium", "fixed_start": None,
+         "reasoning": "Review after the hardest work.", "wellness_note": "Hydrate."}
+    ],
+    "schedule": [],
+    "unscheduled_tasks": []
+}
+MODEL_ENGINE_OUTPUT = {
+    "mood_detected": "stressed",
+    "conversation_state": "scheduling_new",
+    "response_message": "I've planned your day around short focused blocks with breaks, starting with a quick win.",
+    "schedule": [
+        {"time": "9:00-9:45 AM", "task": "Reply to emails", "reasoning": "A quick win builds momentum.",
+         "wellness_note": "Close other tabs."},
+        {"time": "9:45-10:30 AM", "task": "Project proposal (part 1/3)", "reasoning": "Short block.",
+         "wellness_note": "Breathe between blocks."},
+        {"time": "10:30-10:45 AM", "task": "Break", "reasoning": "Recovery.", "wellness_note": "Walk."},
+        {"time": "10:45-11:30 AM", "task": "Project proposal (part 2/3)", "reasoning": "Short block.",
+         "wellness_note": "Breathe between blocks."},
+        {"time": "2:00-2:30 PM", "task": "Team sync", "reasoning": "Fixed meeting.", "wellness_note": "Stretch first."}
+    ],
+    "unscheduled_tasks": [{"task": "Code review", "estimated_duration": "1 hour 30 minutes"}]
+}
+
+# Primary key attributes per table
+TABLE_KEYS = {
+    'moodflow_schedules': ('user_id', 'schedule_date'),
+    'moodflow_response_cache': ('cache_key',),
+    'moodflow_sessions': ('session_id', 'timestamp'),
+    'moodflow_rate_limits': ('limit_key',),
+    'moodflow_jobs': ('batch_id', 'job_key'),
+}
+
+UPDATE_SECTION_PATTERN = re.compile(r'\b(SET|REMOVE|ADD)\s+')
+PATH_STEP_PATTERN = re.compile(r'([#\w]+)|\[(\d+)\]')
+KEY_CONDITION_PATTERN = re.compile(r'=\s*(:\w+)\s+AND\s+\S+\s+BETWEEN\s+(:\w+)\s+AND\s+(:\w+)')
+CLAUSE_PATTERN = re.compile(r'(attribute_not_exists|attribute_exists)\((\S+?)\)|(\S+)\s*(<=|>=|<>|=|<|>)\s*(\S+)')
+
+class Latency:
+    """Sleep for a base latency with +/- jitter (milliseconds)"""
+
+    def __init__(self, mean_ms, jitter=0.2):
+        self.mean_ms = mean_ms
+        self.jitter = jitter
+
+    def wait(self, scale=1.0):
+        if self.mean_ms > 0:
+            spread = 1 + random.uniform(-self.jitter, self.jitter)
+            time.sleep(self.mean_ms * scale * spread / 1000)
+
+class ConditionalCheckFailed(Exception):
+    """Carries the same error code botocore's ClientError does"""
+
+    def __init__(self):
+        super().__init__('The conditional request failed')
+        self.response = {'Error': {'Code': 'ConditionalCheckFailedException'}}
+
+class TransactionCanceled(Exception):
+    """botocore's TransactionCanceledException, with one reason per item"""
+
+    def __init__(self, reasons):
+        super().__init__('Transaction cancelled')
+        self.response = {'Error': {'Code': 'TransactionCanceledException'},
+                         'CancellationReasons': [{'Code': code} for code in reasons]}
+
+class Throttled(Exception):
+    """botocore's ThrottlingException"""
+
+    def __init__(self):
+        super().__init__('Too many requests, please wait before trying again.')
+        self.response = {'Error': {'Code': 'ThrottlingException'}}
+
+class FakeBedrockRuntime:
+    """invoke_model / invoke_model_with_response_stream with canned JSON output.
+
+    With `max_concurrent`, calls beyond that many in flight are throttled,
+    like a model's provisioned throughput. A stream counts as in flight
+    until its first token.
+    """
+
+    def __init__(self, latency_ms=2500, first_token_ms=600, chunk_chars=40, max_concurrent=None):
+        self.latency = Latency(latency_ms)
+        self.first_token = Latency(first_token_ms)
+        self.chunk_chars = chunk_chars
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def _enter(self):
+        with self.lock:
+            self.calls += 1
+            if self.max_concurrent is not None and self.in_flight >= self.max_concurrent:
+                self.throttled += 1
+                raise Throttled()
+            self.in_flight += 1
+
+    def _exit(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def _output(self, body):
+        request = json.loads(body)
+        system = ''.join(block['text'] for block in request.get('system', []))
+        # Only the local engine's output spec asks for a task difficulty
+        marker = '"difficulty": "easy|medium|hard"'
+        local_engine = marker in system or marker in request['messages'][0]['content']
+        return json.dumps(LOCAL_ENGINE_OUTPUT if local_engine else MODEL_ENGINE_OUTPUT, indent=2)
+
+    def _usage(self, body, text):
+        return {'input_tokens': len(body) // 4, 'output_tokens': len(text) // 4}
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self._enter()
+        try:
+            text = self._output(body)
+            self.latency.wait()
+        finally:
+            self._exit()
+        payload = {'content': [{'type': 'text', 'text': text}], 'usage': self._usage(body, text)}
+        return {'body': io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self._enter()
+        try:
+            text = self._output(body)
+            self.first_token.wait()
+        finally:
+            self._exit()
+        return {'body': self._stream(body, text)}
+
+    def _stream(self, body, text):
+        usage = self._usage(body, text)
+        yield self._event({'type': 'message_start', 'message': {'usage': {'input_tokens': usage['input_tokens']}}})
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        remaining = max(self.latency.mean_ms - self.first_token.mean_ms, 0)
+        for chunk in chunks:
+            time.sleep(remaining / len(chunks) / 1000)
+            yield self._event({'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': chunk}})
+        yield self._event({'type': 'message_delta', 'usage': {'output_tokens': usage['output_tokens']}})
+
+    def _event(self, payload):
+        return {'chunk': {'bytes': json.dumps(payload).encode()}}
+
+class FakeAgentRuntime:
+    """Knowledge Base retrieve answered from the bundled documents"""
+
+    def __init__(self, latency_ms=350):
+        self.latency = Latency(latency_ms)
+        self.calls = 0
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration=None, **kwargs):
+        self.calls += 1
+        k = (retrievalConfiguration or {}).get('vectorSearchConfiguration', {}).get('numberOfResults', 3)
+        texts = local_kb.retrieve(retrievalQuery['text'], k)
+        self.latency.wait()
+        return {'retrievalResults': [{'content': {'text': text}, 'score': 0.5} for text in texts]}
+
+class FakeDynamoDB:
+    """Low-level DynamoDB client over in-memory tables (items kept in wire format)"""
+
+    def __init__(self, latency_ms=8, page_size=100):
+        self.latency = Latency(latency_ms)
+        self.page_size = page_size
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _table(self, name):
+        return self.tables.setdefault(name, {})
+
+    def _key(self, table, key):
+        return tuple(aws_clients.from_attribute(key[name]) for name in TABLE_KEYS[table])
+
+    def _value(self, item, token, names, values):
+        if token.startswith(':'):
+            return aws_clients.from_attribute(values[token])
+        attribute = item.get(names.get(token, token))
+        return None if attribute is None else aws_clients.from_attribute(attribute)
+
+    def _check(self, item, condition, names, values):
+        """Evaluate simple AND/OR conditions (no parentheses) against an item"""
+        if not condition:
+            return True
+        item = item or {}
+        for alternative in re.split(r'\s+OR\s+', condition):
+            results = []
+            for clause in re.split(r'\s+AND\s+', alternative):
+                match = CLAUSE_PATTERN.fullmatch(clause.strip())
+                function, path, left, operator, right = match.groups()
+                if function:
+                    exists = names.get(path, path) in item
+                    results.append(exists if function == 'attribute_exists' else not exists)
+                    continue
+                a, b = self._value(item, left, names, values), self._value(item, right, names, values)
+                if a is None or b is None:
+                    results.append(False)
+                    continue
+                results.append({
+                    '=': a == b, '<>': a != b, '<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b
+                }[operator])
+            if all(results):
+                return True
+        return False
+
+    def _call(self):
+        self.calls += 1
+        self.latency.wait()
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._call()
+        with self.lock:
+            item = self._table(TableName).get(self._key(TableName, Key))
+        return {'Item': item} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None,
+                 ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self._call()
+        key = self._key(TableName, Item)
+        with self.lock:
+            table = self._table(TableName)
+            if not self._check(table.get(key), ConditionExpression,
+                               ExpressionAttributeNames or {}, ExpressionAttributeValues or {}):
+                raise ConditionalCheckFailed()
+            table[key] = Item
+        return {}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        """Puts only; every item is processed"""
+        self._call()
+        with self.lock:
+            for table_name, requests in RequestItems.items():
+                for request in requests:
+                    item = request['PutRequest']['Item']
+                    self._table(table_name)[self._key(table_name, item)] = item
+        return {'UnprocessedItems': {}}
+
+    def delete_item(self, TableName, Key, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self._call()
+        key = self._key(TableName, Key)
+        with self.lock:
+            table = self._table(TableName)
+            if not self._check(table.get(key), ConditionExpression,
+                               ExpressionAttributeNames or {}, ExpressionAttributeValues or {}):
+                raise ConditionalCheckFailed()
+            table.pop(key, None)
+        return {}
+
+    def _path(self, path, names):
+        """Attribute names and list indexes of a document path, e.g. #l[2].#f0"""
+        return [int(index) if index else names.get(name, name) for name, index in PATH_STEP_PATTERN.findall(path)]
+
+    def _resolve(self, item, steps):
+        """(container, key) holding the attribute a path points at, in wire format"""
+        container, key = item, steps[0]
+        for step in steps[1:]:
+            value = container[key]
+            container, key = (value['L'], step) if isinstance(step, int) else (value['M'], step)
+        return container, key
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None, ReturnValues=None, **kwargs):
+        """Supports SET (paths, list_append), REMOVE (paths, list indexes) and ADD on numbers"""
+        self._call()
+        with self.lock:
+            if not self._passes(TableName, Key, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+                raise ConditionalCheckFailed()
+            item, touched = self._update(TableName, Key, UpdateExpression,
+                                         ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+        if ReturnValues == 'UPDATED_NEW':
+            return {'Attributes': {name: item[name] for name in touched if name in item}}
+        return {}
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        """All-or-nothing Update items: every condition is checked before any is applied"""
+        self._call()
+        updates = [entry['Update'] for entry in TransactItems]
+        with self.lock:
+            reasons = [
+                'None' if self._passes(u['TableName'], u['Key'], u.get('ConditionExpression'),
+                                       u.get('ExpressionAttributeNames'), u.get('ExpressionAttributeValues'))
+                else 'ConditionalCheckFailed'
+                for u in updates
+            ]
+            if 'ConditionalCheckFailed' in reasons:
+                raise TransactionCanceled(reasons)
+            for u in updates:
+                self._update(u['TableName'], u['Key'], u['UpdateExpression'],
+                             u.get('ExpressionAttributeNames') or {}, u.get('ExpressionAttributeValues') or {})
+        return {}
+
+    def _passes(self, table_name, key, condition, names, values):
+        return self._check(self._table(table_name).get(self._key(table_name, key)), condition, names or {}, values or {})
+
+    def _update(self, table_name, key_attributes, update_expression, names, values):
+        """Apply an update expression (caller holds the lock); returns (item, top-level names touched)"""
+        key = self._key(table_name, key_attributes)
+        parts = UPDATE_SECTION_PATTERN.split(update_expression)[1:]
+        sections = dict(zip(parts[::2], (part.strip() for part in parts[1::2])))
+        table = self._table(table_name)
+        item = json.loads(json.dumps(table.get(key) or dict(key_attributes)))
+        touched = set()
+        for clause in re.split(r',\s*(?![^(]*\))', sections.get('SET', '')) if 'SET' in sections else []:
+            path, expression = (side.strip() for side in clause.split('=', 1))
+            steps = self._path(path, names)
+            touched.add(steps[0])
+            append = re.fullmatch(r'list_append\((\S+),\s*(\S+)\)', expression)
+            container, name = self._resolve(item, steps)
+            if append:
+                container[name] = {'L': container[name]['L'] + values[append.group(2)]['L']}
+            else:
+                container[name] = values[expression]
+        # List indexes refer to the item before the update, so remove from the back
+        removals = [self._path(path.strip(), names) for path in sections.get('REMOVE', '').split(',') if path.strip()]
+        for steps in sorted(removals, key=lambda steps: steps[-1] if isinstance(steps[-1], int) else -1, reverse=True):
+            touched.add(steps[0])
+            container, name = self._resolve(item, steps)
+            if isinstance(name, int):
+                container.pop(name)
+            else:
+                container.pop(name, None)
+        for clause in filter(None, (part.strip() for part in sections.get('ADD', '').split(','))):
+            path, token = clause.split()
+            name = names.get(path, path)
+            touched.add(name)
+            current = aws_clients.from_attribute(item[name]) if name in item else 0
+            item[name] = aws_clients.to_attribute(current + aws_clients.from_attribute(values[token]))
+        table[key] = item
+        return item, touched
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues,
+              ExpressionAttributeNames=None, ProjectionExpression=None, ExclusiveStartKey=None, **kwargs):
+        """Supports `pk = :v AND sk BETWEEN :a AND :b` on tables with a sort key"""
+        self._call()
+        values = {name: aws_clients.from_attribute(value) for name, value in ExpressionAttributeValues.items()}
+        partition, sort = TABLE_KEYS[TableName]
+        value, low, high = (values[token] for token in KEY_CONDITION_PATTERN.search(KeyConditionExpression).groups())
+        with self.lock:
+            matches = sorted(
+                (key, item) for key, item in self._table(TableName).items()
+                if key[0] == value and low <= key[1] <= high
+            )
+        if ExclusiveStartKey:
+            start = self._key(TableName, ExclusiveStartKey)
+            matches = [(key, item) for key, item in matches if key > start]
+
+        page = matches[:self.page_size]
+        names = ExpressionAttributeNames or {}
+        projection = None
+        if ProjectionExpression:
+            projection = {names.get(name.strip(), name.strip()) for name in ProjectionExpression.split(',')}
+        items = [
+            {name: value for name, value in item.items() if projection is None or name in projection}
+            for _, item in page
+        ]
+        response = {'Items': items, 'Count': len(items)}
+        if len(matches) > self.page_size:
+            last = page[-1][1]
+            response['LastEvaluatedKey'] = {partition: last[partition], sort: last[sort]}
+        return response
+
+class FakeSQS:
+    """send_message(_batch) into an in-memory list; drain() hands the messages out as an SQS event"""
+
+    def __init__(self, latency_ms=10):
+        self.latency = Latency(latency_ms)
+        self.messages = []
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.calls += 1
+        self.latency.wait()
+        with self.lock:
+            message_id = str(len(self.messages))
+            self.messages.append({'messageId': message_id, 'body': MessageBody})
+        return {'MessageId': message_id}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        self.calls += 1
+        self.latency.wait()
+        successful = []
+        with self.lock:
+            for entry in Entries:
+                message_id = str(len(self.messages))
+                self.messages.append({'messageId': message_id, 'body': entry['MessageBody']})
+                successful.append({'Id': entry['Id'], 'MessageId': message_id})
+        return {'Successful': successful, 'Failed': []}
+
+    def drain(self):
+        """The queued messages as a Lambda SQS event, emptying the queue"""
+        with self.lock:
+            records, self.messages = self.messages, []
+        return {'Records': records}
+
+def install(bedrock_ms=2500, first_token_ms=600, kb_ms=350, dynamodb_ms=8, sqs_ms=10, model_concurrency=None):
+    """Inject fakes for every client; returns them by service name"""
+    fakes = {
+        'bedrock-runtime': FakeBedrockRuntime(bedrock_ms, first_token_ms, max_concurrent=model_concurrency),
+        'bedrock-agent-runtime': FakeAgentRuntime(kb_ms),
+        'dynamodb': FakeDynamoDB(dynamodb_ms),
+        'sqs': FakeSQS(sqs_ms),
+    }
+    for service, fake in fakes.items():
+        aws_clients.set_client(service, fake)
+    return fakes
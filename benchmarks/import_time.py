@@ -0,0 +1,121 @@
+"""Cold-start import cost of the Lambda handler.
+
+Each run starts a fresh interpreter with `python -X importtime` and imports
+the handler module, as a new Lambda container does. Reports the median
+wall time, the handler's cumulative import time, the most expensive
+modules, and whether boto3/botocore were pulled in at import.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --record baseline.json
+    python benchmarks/import_time.py --baseline baseline.json --max-regression 20
+
+    # Also time creating the first AWS client in a fresh interpreter (needs boto3)
+    python benchmarks/import_time.py --clients
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLIENT_SNIPPET = """
+import time
+import aws_clients
+start = time.perf_counter()
+for service in aws_clients.CLIENT_CONFIGS:
+    aws_clients.client(service)
+print((time.perf_counter() - start) * 1000)
+"""
+
+def run_import(module):
+    """(wall ms, {module: cumulative us}) for one import in a fresh interpreter"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        cumulative[name] = max(cumulative.get(name, 0), int(cumulative_us))
+    return wall_ms, cumulative
+
+def run_clients():
+    """Milliseconds to create every configured AWS client in a fresh interpreter"""
+    result = subprocess.run([sys.executable, '-c', CLIENT_SNIPPET], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout)
+
+def measure(module, runs):
+    """Median wall and handler import time over several cold imports"""
+    walls, handler_us, modules = [], [], {}
+    for _ in range(runs):
+        wall_ms, cumulative = run_import(module)
+        walls.append(wall_ms)
+        handler_us.append(cumulative.get(module, 0))
+        for name, us in cumulative.items():
+            modules.setdefault(name, []).append(us)
+    return {
+        'module': module,
+        'runs': runs,
+        'wall_ms': statistics.median(walls),
+        'import_ms': statistics.median(handler_us) / 1000,
+        'modules_ms': {name: statistics.median(values) / 1000 for name, values in modules.items()},
+        'boto3_at_import': 'boto3' in modules or 'botocore' in modules,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='lambda_function')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Number of most expensive modules to list')
+    parser.add_argument('--clients', action='store_true', help='Also time first creation of the AWS clients')
+    parser.add_argument('--record', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results recorded with --record')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='Percent slower than the baseline import time that fails the run')
+    args = parser.parse_args()
+
+    results = measure(args.module, args.runs)
+    if args.clients:
+        results['clients_ms'] = statistics.median(run_clients() for _ in range(args.runs))
+
+    print(f"{args.module}: import {results['import_ms']:.1f} ms, "
+          f"interpreter + import {results['wall_ms']:.1f} ms (median of {args.runs})")
+    print(f"boto3/botocore imported at module load: {'yes' if results['boto3_at_import'] else 'no'}")
+    if 'clients_ms' in results:
+        print(f"first AWS client creation: {results['clients_ms']:.1f} ms")
+
+    print(f"\n{'cumulative ms':>13}  module")
+    top = sorted(results['modules_ms'].items(), key=lambda item: -item[1])[:args.top]
+    for name, ms in top:
+        print(f"{ms:>13.1f}  {name}")
+
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        change = (results['import_ms'] - baseline['import_ms']) / baseline['import_ms'] * 100
+        print(f"\nvs baseline: {baseline['import_ms']:.1f} ms -> {results['import_ms']:.1f} ms ({change:+.1f}%)")
+        if change > args.max_regression:
+            print(f"Import time regressed by more than {args.max_regression:.0f}%")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Load test of lambda_handler against in-process service fakes.
+
+Synthetic API Gateway events carry the same versioned JSON envelope app.py
+sends, or with --legacy the old text envelope
+("... [Planning for <date> | Start: ... | End by: ...]"). Bedrock, the
+Knowledge Base and DynamoDB are replaced by the fakes in fakes.py with the
+given latencies. For each concurrency level the run reports throughput and
+p50/p95/p99 of the whole request and of every stage the tracer records
+(see metrics.py).
+
+Requests are spread round-robin over --users authenticated users, each
+with their own schedules and rate/concurrency caps (rate_limits.py); use
+--users 1 to see one heavy user being throttled.
+
+Threads share one module state, so a concurrency level behaves like that
+many warm containers sharing caches; use --cache off to measure the
+uncached pipeline.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 1 4 16 --requests 200 --bedrock-ms 3000
+    python benchmarks/load_test.py --repeat 0.3 --cache memory   # 30% re-submitted messages
+    python benchmarks/load_test.py --stream                       # drive iter_plan_events
+    python benchmarks/load_test.py --persist queue                # write behind through SQS
+    python benchmarks/load_test.py --model-concurrency 4 --model-rate 8   # throttling Bedrock, client limiter
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import fakes
+
+import lambda_function
+import metrics
+import model_client
+import persistence
+import response_cache
+
+MESSAGES = [
+    "I'm feeling stressed. I need to finish the dashboard (3 hours) and prepare slides (1 hour)",
+    "I'm so tired today, just emails (1 hour) and a code review (90 minutes)",
+    "Feeling energized! Refactor the backend (3h), system design doc (2h), team sync at 2pm for 30 min",
+    "I'm anxious about my client presentation at 11, also need to rehearse (1 hour) and update the deck (2 hours)",
+    "Need to write documentation (2 hours) and fix some bugs (2 hours)",
+    "Happy and motivated, brainstorming session (1h) and learning a new framework (3h)",
+    "Focused today: deep debugging of the payment service for 3 hours, then standup notes (30 min)",
+    "Can you move the code review to the afternoon?",
+]
+STAGE_SUFFIX = '_ms'
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def make_event(message, day, user_id, legacy=False):
+    """API Gateway proxy event with the app.py request envelope from an authenticated user"""
+    if legacy:
+        text = f"{message}\n\n[Planning for {day.strftime('%A, %B %d, %Y')} | Start: 09:00 AM | End by: 05:00 PM]"
+        body = {'message': text}
+    else:
+        body = {'version': 1, 'action': 'plan', 'message': message, 'date': day.isoformat(),
+                'start': '09:00', 'end': '17:00'}
+    return {'body': json.dumps(body), 'queryStringParameters': {'session_id': 'bench'},
+            'requestContext': {'authorizer': {'claims': {'sub': user_id}}}}
+
+def make_events(count, repeat, seed, users, legacy=False):
+    """`count` events over distinct dates; a `repeat` fraction re-sends an earlier event"""
+    rng = random.Random(seed)
+    first_day = date.today() + timedelta(days=1)
+    events = []
+    for i in range(count):
+        if events and rng.random() < repeat:
+            events.append(rng.choice(events))
+        else:
+            events.append(make_event(rng.choice(MESSAGES), first_day + timedelta(days=i % 365),
+                                     f'user-{i % users}', legacy))
+    return events
+
+def run_level(events, concurrency, stream):
+    """Drive all events at one concurrency level; returns (wall seconds, traces, errors)"""
+    traces = []
+    lock = threading.Lock()
+
+    def sink(document):
+        with lock:
+            traces.append(document)
+    metrics.set_sink(sink)
+
+    def call(event):
+        if stream:
+            last = None
+            for last in lambda_function.iter_plan_events(json.loads(event['body']), event['queryStringParameters'],
+                                                         event['requestContext']):
+                pass
+            return last['event'] != 'error'
+        return lambda_function.lambda_handler(event, None)['statusCode'] == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, events))
+    wall = time.perf_counter() - started
+    return wall, traces, results.count(False)
+
+def summarize(traces):
+    """{stage: [ms, ...]} over all traces"""
+    stages = {}
+    for trace in traces:
+        for name, value in trace.items():
+            if name.endswith(STAGE_SUFFIX):
+                stages.setdefault(name[:-len(STAGE_SUFFIX)], []).append(value)
+    return stages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=64, help='Requests per concurrency level')
+    parser.add_argument('--repeat', type=float, default=0.0, help='Fraction of re-submitted identical requests')
+    parser.add_argument('--cache', choices=['off', 'memory', 'shared'], default='off')
+    parser.add_argument('--stream', action='store_true', help='Use the streaming pipeline (iter_plan_events)')
+    parser.add_argument('--legacy', action='store_true', help='Send the old text envelope instead of JSON fields')
+    parser.add_argument('--persist', choices=['sync', 'queue'], default='sync',
+                        help='Write schedules in the request or behind it through SQS (drained after each level)')
+    parser.add_argument('--users', type=int, default=64, help='Distinct users the requests are spread over')
+    parser.add_argument('--bedrock-ms', type=float, default=2500)
+    parser.add_argument('--first-token-ms', type=float, default=600)
+    parser.add_argument('--model-concurrency', type=int, help='Throttle model calls beyond this many in flight')
+    parser.add_argument('--model-rate', type=float, default=1000,
+                        help='Client-side model calls per second (MODEL_RATE); the default leaves it unlimited')
+    parser.add_argument('--kb-ms', type=float, default=350)
+    parser.add_argument('--dynamodb-ms', type=float, default=8)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    response_cache.MODE = args.cache
+    persistence.MODE = args.persist
+    model_client.RATE = args.model_rate
+    model_client.BURST = max(1, int(args.model_rate))
+    persistence.QUEUE_URL = 'bench.fifo'
+    results = []
+    for concurrency in args.concurrency:
+        # Fresh fakes and cache per level so levels do not warm each other
+        services = fakes.install(args.bedrock_ms, args.first_token_ms, args.kb_ms, args.dynamodb_ms,
+                                 model_concurrency=args.model_concurrency)
+        response_cache._memory.clear()
+        model_client._buckets.clear()
+        events = make_events(args.requests, args.repeat, args.seed, args.users, args.legacy)
+
+        wall, traces, errors = run_level(events, concurrency, args.stream)
+        persist_failures = len(persistence.persist_handler(services['sqs'].drain(), None)['batchItemFailures'])
+        stages = summarize(traces)
+        level = {
+            'concurrency': concurrency,
+            'requests': len(events),
+            'errors': errors,
+            'persist_failures': persist_failures,
+            'throughput_rps': len(events) / wall,
+            'model_calls': services['bedrock-runtime'].calls,
+            'model_throttles': services['bedrock-runtime'].throttled,
+            'kb_calls': services['bedrock-agent-runtime'].calls,
+            'dynamodb_calls': services['dynamodb'].calls,
+            'stages': {
+                name: {'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                       'p99': percentile(values, 99), 'count': len(values)}
+                for name, values in stages.items()
+            }
+        }
+        results.append(level)
+
+        print(f"\nconcurrency {concurrency}: {level['throughput_rps']:.2f} req/s, {errors} errors, "
+              f"{persist_failures} failed queued writes, "
+              f"{level['model_calls']} model ({level['model_throttles']} throttled) / {level['kb_calls']} KB / "
+              f"{level['dynamodb_calls']} DynamoDB calls")
+        print(f"  {'stage':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'n':>5}")
+        for name, row in sorted(level['stages'].items(), key=lambda item: -item[1]['p50']):
+            print(f"  {name:<22} {row['p50']:>9.1f} {row['p95']:>9.1f} {row['p99']:>9.1f} {row['count']:>5}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
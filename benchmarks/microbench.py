@@ -0,0 +1,74 @@
+"""Microbenchmarks for the hot pure-Python helpers.
+
+Times response parsing (whole-text and incremental), the request envelope
+parsing and the time/date helpers with timeit, reporting the best
+per-call time over several repeats.
+
+    python benchmarks/microbench.py
+    python benchmarks/microbench.py --number 20000 --filter parse
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes
+
+import json_stream
+import lambda_function
+import scheduler
+
+MODEL_TEXT = json.dumps(fakes.MODEL_ENGINE_OUTPUT, indent=2)
+FENCED_TEXT = f"Here is your plan:\n```json\n{MODEL_TEXT}\n```\nLet me know if you want changes."
+TRUNCATED_TEXT = MODEL_TEXT[:len(MODEL_TEXT) * 2 // 3]
+ENVELOPE_BODY = {
+    'version': 1, 'action': 'plan', 'message': "I'm stressed, finish the proposal (3 hours) and emails (1 hour)",
+    'date': '2025-10-06', 'start': '09:00', 'end': '17:00'
+}
+LEGACY_BODY = {
+    'message': "I'm stressed, finish the proposal (3 hours) and emails (1 hour)\n\n"
+               "[Planning for Monday, October 06, 2025 | Start: 09:00 AM | End by: 05:00 PM]"
+}
+
+def parse_streamed(text, chunk_chars=40):
+    parser = json_stream.IncrementalJSONParser(stream_arrays=('schedule', 'tasks'))
+    for i in range(0, len(text), chunk_chars):
+        parser.feed(text[i:i + chunk_chars])
+    return parser.result()
+
+CASES = {
+    'parse_response (plain JSON)': lambda: lambda_function.parse_response(MODEL_TEXT),
+    'parse_response (fenced + preamble)': lambda: lambda_function.parse_response(FENCED_TEXT),
+    'parse_response (truncated, repaired)': lambda: lambda_function.parse_response(TRUNCATED_TEXT),
+    'IncrementalJSONParser (40-char chunks)': lambda: parse_streamed(MODEL_TEXT),
+    'parse_planning_request (JSON envelope)': lambda: lambda_function.parse_planning_request(ENVELOPE_BODY),
+    'parse_planning_request (legacy text)': lambda: lambda_function.parse_planning_request(LEGACY_BODY),
+    'resolve_retrieval_date': lambda: lambda_function.resolve_retrieval_date('show my schedule for oct 8', '2025-10-06'),
+    'scheduler.parse_window': lambda: scheduler.parse_window('09:00 AM', '5:00'),
+    'scheduler.parse_time_range': lambda: scheduler.parse_time_range('11:30 AM-12:30 PM'),
+    'scheduler.parse_duration_minutes': lambda: scheduler.parse_duration_minutes('1 hour 30 minutes'),
+    'scheduler.build_schedule': lambda: scheduler.build_schedule(
+        fakes.LOCAL_ENGINE_OUTPUT['tasks'], 9 * 60, 17 * 60,
+        {'ordering': 'warmup', 'break_every_minutes': 45, 'break_minutes': 10}
+    ),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=2000, help='Calls per repeat')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this text')
+    args = parser.parse_args()
+
+    print(f"{'case':<42} {'best us/call':>12}")
+    for name, func in CASES.items():
+        if args.filter not in name:
+            continue
+        best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+        print(f"{name:<42} {best / args.number * 1e6:>12.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Incremental parser for the model's JSON output.
+
+Text is fed in chunks as it streams from Bedrock. The parser tracks
+strings, escapes and bracket depth in a single pass and emits an event as
+soon as an element of a streamed top-level array (e.g. one "schedule"
+entry) or a top-level field (e.g. "response_message") is complete, so rows
+can be rendered before the whole response has been generated.
+
+extract_object() runs the same single pass over a complete response and,
+when the output was cut off (e.g. at max_tokens), repairs it by closing
+the open brackets after the last complete value.
+"""
+import json
+
+class IncrementalJSONParser:
+    """Single-pass, bracket-aware parser for one top-level JSON object.
+
+    Anything before the first "{" (preamble, code fences) and after the
+    matching "}" is ignored.
+    """
+
+    def __init__(self, stream_arrays=('schedule',)):
+        self.stream_arrays = frozenset(stream_arrays)
+        self.text = ''
+        self.pos = 0
+        self.started = False
+        self.done = False
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect_key = False
+        self.key = None
+        self.value_start = None
+        self.item_start = None
+        # Last point where the text so far, plus closing brackets, is valid
+        # JSON: (end offset, open brackets, top-level key being written)
+        self.safe_cut = None
+
+    def feed(self, chunk):
+        """Consume more text; return the events completed by it"""
+        events = []
+        if self.done:
+            return events
+        self.text += chunk
+        text = self.text
+
+        while self.pos < len(text) and not self.done:
+            char = text[self.pos]
+            i = self.pos
+            self.pos += 1
+
+            if not self.started:
+                if char == '{':
+                    self.started = True
+                    self.stack.append('{')
+                    self.expect_key = True
+                    self.safe_cut = (i + 1, ['{'], None)
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1 and self.expect_key:
+                        self.key = json.loads(text[self.string_start:i + 1])
+                    elif len(self.stack) == 1:
+                        self.safe_cut = (i + 1, ['{'], None)
+                continue
+
+            depth = len(self.stack)
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+                if depth == 1 and not self.expect_key and self.value_start is None:
+                    self.value_start = i
+            elif char == ':' and depth == 1:
+                self.expect_key = False
+            elif char in '{[':
+                if depth == 1 and self.value_start is None:
+                    self.value_start = i
+                elif depth == 2 and char == '{' and self.stack[1] == '[' and self.key in self.stream_arrays:
+                    self.item_start = i
+                self.stack.append(char)
+                self.safe_cut = (i + 1, list(self.stack), self.key)
+            elif char in '}]':
+                self.stack.pop()
+                depth = len(self.stack)
+                if depth:
+                    self.safe_cut = (i + 1, list(self.stack), self.key if depth > 1 else None)
+                if depth == 0:
+                    self._close_value(i, events)
+                    self.done = True
+                elif depth == 2 and self.item_start is not None:
+                    events.append({
+                        'event': 'item',
+                        'name': self.key,
+                        'data': json.loads(text[self.item_start:i + 1])
+                    })
+                    self.item_start = None
+            elif char == ',' and depth == 1:
+                self.safe_cut = (i, ['{'], None)
+                self._close_value(i, events)
+                self.expect_key = True
+            elif char == ',':
+                self.safe_cut = (i, list(self.stack), self.key)
+            elif depth == 1 and not self.expect_key and self.value_start is None and not char.isspace():
+                # Start of a number, true/false/null
+                self.value_start = i
+
+        return events
+
+    def _close_value(self, end, events):
+        """Emit the top-level field whose value ends just before `end`"""
+        if self.key is not None and self.value_start is not None:
+            raw = self.text[self.value_start:end].strip()
+            try:
+                value = json.loads(raw)
+            except json.JSONDecodeError:
+                value = None
+            if value is not None or raw == 'null':
+                events.append({'event': 'field', 'name': self.key, 'data': value})
+        self.key = None
+        self.value_start = None
+
+    def result(self):
+        """The complete object, once the top-level "}" has been seen"""
+        if not self.done:
+            raise ValueError('JSON object is incomplete')
+        start = self.text.index('{')
+        return json.loads(self.text[start:self.pos])
+
+    def repair(self):
+        """(object, key) for output cut off mid-object.
+
+        The text is cut after the last complete value and the open brackets
+        are closed. `key` is the top-level field whose value was still being
+        written at the cut (now incomplete), or None. Raises ValueError if
+        nothing usable was seen.
+        """
+        if self.safe_cut is None:
+            raise ValueError('No JSON object found')
+        end, stack, key = self.safe_cut
+        closers = ''.join('}' if bracket == '{' else ']' for bracket in reversed(stack))
+        start = self.text.index('{')
+        return json.loads(self.text[start:end] + closers), key
+
+def extract_object(text):
+    """(object, incomplete_key, repaired) for the first JSON object in model output.
+
+    Preamble, code fences and trailing text are ignored. If the object was
+    cut off it is repaired (see IncrementalJSONParser.repair) and `repaired`
+    is True. A "{" in the preamble that does not start valid JSON is
+    skipped. Raises ValueError when no object can be recovered.
+    """
+    start = text.find('{')
+    while start != -1:
+        parser = IncrementalJSONParser(stream_arrays=())
+        parser.feed(text[start:])
+        try:
+            if parser.done:
+                return parser.result(), None, False
+            obj, key = parser.repair()
+            return obj, key, True
+        except ValueError:
+            start = text.find('{', start + 1)
+    raise ValueError('No JSON object found')
@@ -1,333 +1,1121 @@
-import boto3
 import json
-import uuid
+import os
 import re
-from datetime import datetime
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
-bedrock_agent = boto3.client('bedrock-agent-runtime', region_name='us-east-1')
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+import aws_clients
+import batch
+import json_stream
+import local_kb
+import metrics
+import model_client
+import mood_rules
+import output_schema
+import persistence
+import prompts
+import rate_limits
+import request_envelope
+import response_cache
+import router
+import schedule_patch
+import scheduler
+import sessions
 
-# Tables
-sessions_table = dynamodb.Table('moodflow_sessions')
-schedules_table = dynamodb.Table('moodflow_schedules')
+# AWS clients are created on first use (see aws_clients.py)
+SCHEDULES_TABLE = 'moodflow_schedules'
+
+# Reused across warm invocations for the pre-model fetches
+prefetch_pool = ThreadPoolExecutor(max_workers=4)
 
 # Constants
 KB_ID = 'YOUR_KNOWLEDGE_BASE_ID'
 GUARDRAIL_ID = 'YOUR_GUARDRAIL_ID'
 GUARDRAIL_VERSION = 'DRAFT'
-MODEL_ID = 'us.anthropic.claude-3-5-sonnet-20241022-v2:0'
-USER_ID = 'default_user'
+MODEL_ID = os.environ.get('MODEL_ID', 'us.anthropic.claude-3-5-sonnet-20241022-v2:0')
+
+# Knowledge Base backend: 'bedrock' (remote KB) or 'local' (in-process BM25 index)
+KB_BACKEND = os.environ.get('KB_BACKEND', 'bedrock')
+KB_NUM_RESULTS = 3
+
+# Prompt knowledge: 'rules' (compact per-mood rule table, KB only when the mood
+# is unknown) or 'kb' (raw Knowledge Base chunks on every request)
+PROMPT_KNOWLEDGE = os.environ.get('PROMPT_KNOWLEDGE', 'rules')
+
+# Chunk and index the bundled documents at cold start when serving locally
+if KB_BACKEND == 'local':
+    local_kb.get_index()
+if PROMPT_KNOWLEDGE == 'rules':
+    mood_rules.load_rules()
+
+# Scheduling engine: 'local' (model extracts tasks, scheduler.py lays out the
+# times) or 'model' (model generates every time slot itself)
+SCHEDULING_ENGINE = os.environ.get('SCHEDULING_ENGINE', 'local')
+MAX_TOKENS = {'local': 1500, 'model': 2500}
+
+# Cache the static system prompt between calls (Bedrock prompt caching)
+PROMPT_CACHING = os.environ.get('PROMPT_CACHING', 'true') == 'true'
+
+# Calendar overview: only the fields the week/month view renders
+CALENDAR_ATTRIBUTES = ('schedule_date', 'mood', 'schedule', 'unscheduled_tasks', 'free_minutes')
+MAX_CALENDAR_DAYS = 62
+
+# Reschedule suggestions read only the capacity kept on each schedule item
+CAPACITY_ATTRIBUTES = ('schedule_date', 'free_minutes')
+SUGGESTION_LOOKAHEAD_DAYS = 30
+DEFAULT_SUGGESTION_COUNT = 3
+
+# Shared KB query for the batch jobs of one mood
+BATCH_KB_QUERY = "Task planning and wellness strategies for a {mood} mood"
+
+PARSE_ERROR_MESSAGE = "Error parsing schedule. Please try again."
+DEGRADED_MESSAGE = ("MoodFlow is very busy right now, so your schedule was not changed. "
+                    "Please try again in a minute.")
+
+# Retrieval detection
+RETRIEVAL_PHRASES = [
+    'show me', 'show my', 'what is my', 'display', 'view my', 'see my',
+    'show', 'view', 'display my', 'what\'s my', 'check my'
+]
+# The whole message must be the request, optionally naming one date; anything more goes to the model
+VIEW_REQUEST_PATTERN = re.compile(
+    r"\s*(?:please\s+)?(?:show|view|display|see|check|what is|what's|whats)(?:\s+me)?(?:\s+(?:my|the))?"
+    r"\s+(?:schedule|plan|day)"
+    r"(?:(?:\s+(?:for|on))?\s+(?:today|tomorrow|(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?))?"
+    r"(?:,?\s+please)?\s*[.!?]*\s*",
+    re.IGNORECASE
+)
+MONTH_DAY_PATTERN = re.compile(
+    r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})'
+)
+MONTH_MAP = {
+    'jan': '01', 'january': '01',
+    'feb': '02', 'february': '02',
+    'mar': '03', 'march': '03',
+    'apr': '04', 'april': '04',
+    'may': '05',
+    'jun': '06', 'june': '06',
+    'jul': '07', 'july': '07',
+    'aug': '08', 'august': '08',
+    'sep': '09', 'september': '09',
+    'oct': '10', 'october': '10',
+    'nov': '11', 'november': '11',
+    'dec': '12', 'december': '12'
+}
 
-def get_schedule_for_date(date_str):
-    """Retrieve existing schedule for a specific date"""
+@metrics.timed('schedule_get')
+def get_schedule_for_date(user_id, date_str, consistent=False):
+    """Retrieve a user's existing schedule for a specific date"""
     try:
-        response = schedules_table.get_item(
-            Key={
-                'user_id': USER_ID,
+        response = aws_clients.client('dynamodb').get_item(
+            TableName=SCHEDULES_TABLE,
+            Key=aws_clients.serialize_item({
+                'user_id': user_id,
                 'schedule_date': date_str
-            }
+            }),
+            ConsistentRead=consistent
         )
-        return response.get('Item', None)
+        item = response.get('Item')
+        return aws_clients.deserialize_item(item) if item else None
     except Exception as e:
         print(f"DynamoDB get error: {e}")
         return None
 
-def save_schedule_for_date(date_str, schedule_data, unscheduled_tasks, mood):
-    """Save schedule to DynamoDB"""
-    try:
-        schedules_table.put_item(Item={
-            'user_id': USER_ID,
-            'schedule_date': date_str,
-            'schedule': schedule_data,
-            'unscheduled_tasks': unscheduled_tasks,
-            'mood': mood,
-            'last_updated': datetime.utcnow().isoformat()
+def schedule_update(user_id, date_str, schedule_data, unscheduled_tasks, mood, window=None,
+                    expected_version=None, stored_schedule=None):
+    """UpdateItem arguments that save a date's schedule with its booked/free minutes in the same item.
+
+    With `stored_schedule` (the list currently stored) only the changed
+    entries are written (see schedule_patch.list_update). With
+    `expected_version` the write is conditioned on the stored version (0 for
+    a date never saved). Returns (update arguments, last_updated stamp).
+    """
+    start_minutes, end_minutes = window or (scheduler.DEFAULT_START_MINUTES, scheduler.DEFAULT_END_MINUTES)
+    last_updated = datetime.utcnow().isoformat()
+    
+    if stored_schedule is None:
+        sets, removes, names, values = ['#l = :l0'], [], {'#l': 'schedule'}, {':l0': schedule_data}
+    else:
+        sets, removes, names, values = schedule_patch.list_update('schedule', stored_schedule, schedule_data)
+    names.update({'#u': 'unscheduled_tasks', '#m': 'mood', '#b': 'booked_minutes',
+                  '#fm': 'free_minutes', '#t': 'last_updated', '#v': 'version'})
+    values.update({
+        ':u': unscheduled_tasks,
+        ':m': mood,
+        ':b': scheduler.booked_minutes(schedule_data, start_minutes, end_minutes),
+        ':fm': scheduler.free_minutes(schedule_data, start_minutes, end_minutes),
+        ':t': last_updated,
+        ':one': 1
+    })
+    sets += ['#u = :u', '#m = :m', '#b = :b', '#fm = :fm', '#t = :t']
+    update = {
+        'TableName': SCHEDULES_TABLE,
+        'Key': aws_clients.serialize_item({'user_id': user_id, 'schedule_date': date_str}),
+        'UpdateExpression': f"SET {', '.join(sets)}" + (f" REMOVE {', '.join(removes)}" if removes else '') + ' ADD #v :one',
+        'ExpressionAttributeNames': names
+    }
+    if expected_version is not None:
+        if expected_version:
+            update['ConditionExpression'] = '#v = :expected'
+            values[':expected'] = expected_version
+        else:
+            update['ConditionExpression'] = 'attribute_not_exists(#v)'
+    update['ExpressionAttributeValues'] = aws_clients.serialize_item(values)
+    return update, last_updated
+
+@metrics.timed('schedule_save')
+def save_schedules(writes):
+    """Persist (update, last_updated) pairs from schedule_update as one unit.
+
+    Returns [{'last_updated', 'version'}] in the same order. Raises
+    VersionConflict if any date changed since it was read, and any other
+    write error as is.
+    """
+    updates = [update for update, _ in writes]
+    versions = persistence.submit(updates)
+    metrics.record('schedule_write_chars', sum(len(json.dumps(update['ExpressionAttributeValues'])) for update in updates))
+    return [{'last_updated': stamp, 'version': version} for (_, stamp), version in zip(writes, versions)]
+
+def save_schedule_for_date(user_id, date_str, schedule_data, unscheduled_tasks, mood, window=None,
+                           expected_version=None, stored_schedule=None):
+    """Save one date's schedule (see schedule_update); returns {'last_updated', 'version'}"""
+    return save_schedules([schedule_update(
+        user_id, date_str, schedule_data, unscheduled_tasks, mood, window, expected_version, stored_schedule
+    )])[0]
+
+@metrics.timed('schedule_query')
+def get_schedules_in_range(user_id, start_date, end_date, attributes):
+    """Schedules between two ISO dates (inclusive), projected to `attributes`, with one paginated Query"""
+    names = {f'#a{i}': attribute for i, attribute in enumerate(attributes)}
+    query_args = {
+        'TableName': SCHEDULES_TABLE,
+        'KeyConditionExpression': 'user_id = :user AND schedule_date BETWEEN :start AND :end',
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': aws_clients.serialize_item({
+            ':user': user_id,
+            ':start': start_date,
+            ':end': end_date
         })
-    except Exception as e:
-        print(f"DynamoDB save error: {e}")
+    }
+    items = []
+    while True:
+        response = aws_clients.client('dynamodb').query(**query_args)
+        items.extend(aws_clients.deserialize_item(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def retrieve_bedrock_chunks(query):
+    """Retrieve the top chunk texts from the Bedrock Knowledge Base"""
+    response = aws_clients.client('bedrock-agent-runtime').retrieve(
+        knowledgeBaseId=KB_ID,
+        retrievalQuery={'text': query},
+        retrievalConfiguration={
+            'vectorSearchConfiguration': {'numberOfResults': KB_NUM_RESULTS}
+        }
+    )
+    results = []
+    for result in response['retrievalResults']:
+        results.append(result['content']['text'])
+    return results
 
+@metrics.timed('kb_query')
 def query_knowledge_base(query):
-    """Query Bedrock Knowledge Base"""
+    """Query the configured Knowledge Base backend"""
     try:
-        response = bedrock_agent.retrieve(
-            knowledgeBaseId=KB_ID,
-            retrievalQuery={'text': query},
-            retrievalConfiguration={
-                'vectorSearchConfiguration': {'numberOfResults': 3}
-            }
-        )
-        results = []
-        for result in response['retrievalResults']:
-            results.append(result['content']['text'])
+        if KB_BACKEND == 'local':
+            results = local_kb.retrieve(query, KB_NUM_RESULTS)
+        else:
+            results = retrieve_bedrock_chunks(query)
         return '\n\n'.join(results)
     except Exception as e:
         print(f"KB Error: {e}")
         return ""
 
-def invoke_bedrock(user_message, date_str, start_time, end_time, kb_results):
-    """Invoke Bedrock with context"""
-    # Check if schedule exists for this date
-    existing_schedule = get_schedule_for_date(date_str)
+def is_retrieval_query(user_message):
+    """Loosely detect whether the user wants to see a schedule (prompt hint)"""
+    return any(phrase in user_message.lower() for phrase in RETRIEVAL_PHRASES)
+
+def is_view_request(user_message):
+    """Strictly detect a pure "show my schedule" request that needs no model call"""
+    message = request_envelope.LEGACY_ENVELOPE_PATTERN.sub('', user_message)
+    return VIEW_REQUEST_PATTERN.fullmatch(message) is not None
+
+def resolve_retrieval_date(user_message, date_str, upcoming=False):
+    """Use a date mentioned in the message (e.g. "show my schedule for oct 8") if any.
+
+    The year is the planning date's; with `upcoming`, a month and day before
+    the planning date mean their next occurrence (on Dec 30, "jan 3" is next year's).
+    """
+    date_in_message = MONTH_DAY_PATTERN.search(user_message.lower())
+    if not date_in_message:
+        if re.search(r'\btomorrow\b', user_message, re.IGNORECASE):
+            return (date.fromisoformat(date_str) + timedelta(days=1)).isoformat()
+        return date_str
+
+    month = MONTH_MAP[date_in_message.group(1)]
+    day = date_in_message.group(2).zfill(2)
+    year = date_str.split('-')[0]
+    resolved = f"{year}-{month}-{day}"
+    if upcoming and resolved < date_str:
+        resolved = f"{int(year) + 1}-{month}-{day}"
+    return resolved
+
+def build_view_response(user_id, date_str):
+    """Build a planning-shaped response straight from the stored schedule; "date" is the date shown"""
+    existing_schedule = get_schedule_for_date(user_id, date_str)
+
+    if existing_schedule is None:
+        return {
+            "mood_detected": "unknown",
+            "conversation_state": "viewing",
+            "schedule": [],
+            "unscheduled_tasks": [],
+            "response_message": "No schedule found for this date.",
+            "schedule_version": 0,
+            "date": date_str
+        }
+
+    return {
+        "mood_detected": existing_schedule.get('mood', 'unknown'),
+        "conversation_state": "viewing",
+        "schedule": existing_schedule.get('schedule', []),
+        "unscheduled_tasks": existing_schedule.get('unscheduled_tasks', []),
+        "response_message": f"Here is your schedule for {date_str}.",
+        "schedule_version": existing_schedule.get('version', 0),
+        "date": date_str
+    }
+
+def parse_calendar_range(body):
+    """Validated (start_date, end_date) ISO strings for a calendar request"""
+    try:
+        start = date.fromisoformat(body.get('start_date', ''))
+        end = date.fromisoformat(body.get('end_date', ''))
+    except (TypeError, ValueError):
+        raise ValueError('start_date and end_date must be YYYY-MM-DD dates')
+    if end < start:
+        raise ValueError('end_date must not be before start_date')
+    if (end - start).days >= MAX_CALENDAR_DAYS:
+        raise ValueError(f'Calendar range is limited to {MAX_CALENDAR_DAYS} days')
+    return start.isoformat(), end.isoformat()
+
+def build_calendar_response(user_id, start_date, end_date):
+    """Overview of every stored schedule in the range, keyed by date"""
+    days = {}
+    for item in get_schedules_in_range(user_id, start_date, end_date, CALENDAR_ATTRIBUTES):
+        days[item['schedule_date']] = {
+            'mood': item.get('mood', 'unknown'),
+            'schedule': [
+                {'time': entry.get('time', ''), 'task': entry.get('task', '')}
+                for entry in item.get('schedule', [])
+            ],
+            'unscheduled_count': len(item.get('unscheduled_tasks', [])),
+            'free_minutes': item.get('free_minutes')
+        }
+    return {'start_date': start_date, 'end_date': end_date, 'days': days}
+
+def suggest_dates(user_id, tasks, after_date, count=DEFAULT_SUGGESTION_COUNT):
+    """The next `count` dates after `after_date` with enough free minutes for `tasks`.
+
+    Dates without a stored schedule have the whole default window free.
+    Items saved before capacity was tracked have no free_minutes and are
+    skipped rather than guessed.
+    """
+    needed = sum(scheduler.entry_minutes(task) or 0 for task in tasks)
+    first = date.fromisoformat(after_date) + timedelta(days=1)
+    last = first + timedelta(days=SUGGESTION_LOOKAHEAD_DAYS - 1)
+    stored = {
+        item['schedule_date']: item
+        for item in get_schedules_in_range(user_id, first.isoformat(), last.isoformat(), CAPACITY_ATTRIBUTES)
+    }
+    empty_day = scheduler.DEFAULT_END_MINUTES - scheduler.DEFAULT_START_MINUTES
     
-    has_existing = existing_schedule is not None
-    existing_tasks = existing_schedule.get('schedule', []) if has_existing else []
-    unscheduled = existing_schedule.get('unscheduled_tasks', []) if has_existing else []
-    previous_mood = existing_schedule.get('mood', 'unknown') if has_existing else 'unknown'
+    suggestions = []
+    for offset in range(SUGGESTION_LOOKAHEAD_DAYS):
+        day = (first + timedelta(days=offset)).isoformat()
+        item = stored.get(day)
+        if item is None:
+            free = empty_day
+        elif 'free_minutes' in item:
+            free = item['free_minutes']
+        else:
+            continue
+        if free >= needed:
+            suggestions.append({'date': day, 'free_minutes': free})
+            if len(suggestions) == count:
+                break
+    return {'needed_minutes': needed, 'dates': suggestions}
+
+def suggestions_response(user_id, body):
+    """Free dates for the given unscheduled tasks, or those stored for body['date']"""
+    try:
+        date_str = date.fromisoformat(body.get('date', '')).isoformat()
+        count = int(body.get('count', DEFAULT_SUGGESTION_COUNT))
+    except (TypeError, ValueError):
+        raise ValueError('date must be a YYYY-MM-DD date and count an integer')
     
-    # Detect if this is a retrieval query
-    is_retrieval = any(phrase in user_message.lower() for phrase in [
-        'show me', 'show my', 'what is my', 'display', 'view my', 'see my',
-        'show', 'view', 'display my', 'what\'s my', 'check my'
-    ])
+    tasks = body.get('unscheduled_tasks')
+    if tasks is None:
+        existing_schedule = get_schedule_for_date(user_id, date_str) or {}
+        tasks = existing_schedule.get('unscheduled_tasks', [])
+    return suggest_dates(user_id, tasks, date_str, count)
+
+def select_planning_knowledge(user_message, existing_schedule, kb_results):
+    """Compact rules for the stated or previous mood, falling back to KB chunks"""
+    if PROMPT_KNOWLEDGE != 'rules':
+        return kb_results
+
+    mood = mood_rules.detect_mood(user_message)
+    if mood is None and existing_schedule is not None:
+        mood = existing_schedule.get('mood')
+    return mood_rules.format_rules(mood) or kb_results
+
+@metrics.timed('prompt_build')
+def build_model_body(user_message, date_str, start_time, end_time, kb_results, existing_schedule, conversation=''):
+    """Build the Bedrock request body: cacheable static system prompt plus per-request context"""
+    # Parse times to calculate available hours
+    start_minutes, end_minutes = scheduler.parse_window(start_time, end_time)
+    available_hours = (end_minutes - start_minutes) / 60
     
-    # Check if user is asking about a different date
-    date_in_message = re.search(r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})', user_message.lower())
+    system_block = {"type": "text", "text": prompts.STATIC_PROMPTS[SCHEDULING_ENGINE]}
+    if PROMPT_CACHING:
+        system_block["cache_control"] = {"type": "ephemeral"}
     
-    if date_in_message and is_retrieval:
-        month_str = date_in_message.group(1)
-        day = date_in_message.group(2).zfill(2)
-        year = date_str.split('-')[0]
-        
-        # Map month name to number
-        month_map = {
-            'jan': '01', 'january': '01',
-            'feb': '02', 'february': '02',
-            'mar': '03', 'march': '03',
-            'apr': '04', 'april': '04',
-            'may': '05',
-            'jun': '06', 'june': '06',
-            'jul': '07', 'july': '07',
-            'aug': '08', 'august': '08',
-            'sep': '09', 'september': '09',
-            'oct': '10', 'october': '10',
-            'nov': '11', 'november': '11',
-            'dec': '12', 'december': '12'
-        }
-        
-        month = month_map.get(month_str, '10')
-        date_str = f"{year}-{month}-{day}"
-        
-        # Re-fetch schedule for the correct date
-        existing_schedule = get_schedule_for_date(date_str)
-        has_existing = existing_schedule is not None
-        existing_tasks = existing_schedule.get('schedule', []) if has_existing else []
-        unscheduled = existing_schedule.get('unscheduled_tasks', []) if has_existing else []
+    dynamic_prompt = prompts.build_dynamic_prompt(
+        user_message, date_str, start_time, end_time, available_hours,
+        existing_schedule, kb_results, is_retrieval_query(user_message), conversation
+    )
+    metrics.record('system_prompt_chars', len(system_block['text']))
+    metrics.record('dynamic_prompt_chars', len(dynamic_prompt))
     
-    # Parse times to calculate available hours
-    start_match = re.search(r'(\d{1,2}):(\d{2})\s+([AP]M)', start_time)
-    end_match = re.search(r'(\d{1,2}):(\d{2})\s*([AP]M)?', end_time)
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": MAX_TOKENS[SCHEDULING_ENGINE],
+        "system": [system_block],
+        "messages": [{"role": "user", "content": dynamic_prompt}]
+    }
+
+def token_usage(usage):
+    """Normalize Anthropic usage counters into the fields we record per request"""
+    return {
+        'input_tokens': usage.get('input_tokens', 0),
+        'output_tokens': usage.get('output_tokens', 0),
+        'cache_read_input_tokens': usage.get('cache_read_input_tokens', 0),
+        'cache_write_input_tokens': usage.get('cache_creation_input_tokens', 0)
+    }
+
+def record_token_usage(usage):
+    """Add token counts to the request's metrics so prompt-cache savings can be verified"""
+    metrics.set_property('model_id', MODEL_ID)
+    for name, count in usage.items():
+        metrics.record(name, count)
+
+def record_cache_stats(status):
+    """Add the response cache outcome and this container's hit/miss counters"""
+    metrics.set_property('cache_status', status)
+    metrics.set_property('cache_stats', response_cache.stats())
+    metrics.record('cache_hit', 0 if status == 'miss' else 1)
+
+def invoke_bedrock(user_message, date_str, start_time, end_time, kb_results, existing_schedule, conversation=''):
+    """Invoke Bedrock with context; returns (text, token usage)"""
+    body = build_model_body(user_message, date_str, start_time, end_time, kb_results, existing_schedule, conversation)
+    return invoke_model_body(body)
+
+def invoke_model_body(body, stage='model_invoke'):
+    """Send a built request body to the model; returns (text, token usage)"""
+    with metrics.stage(stage):
+        response = model_client.invoke(
+            'invoke_model', MODEL_ID,
+            guardrailIdentifier=GUARDRAIL_ID,
+            guardrailVersion=GUARDRAIL_VERSION,
+            body=json.dumps(body)
+        )
+        response_body = json.loads(response['body'].read())
     
-    available_hours = 8.0  # default fallback
-    if start_match and end_match:
-        start_hour = int(start_match.group(1))
-        start_min = int(start_match.group(2))
-        start_ampm = start_match.group(3)
-        
-        end_hour = int(end_match.group(1))
-        end_min = int(end_match.group(2))
-        end_ampm = end_match.group(3) if end_match.group(3) else 'PM'
-        
-        # Convert to 24h format
-        if start_ampm == 'PM' and start_hour != 12:
-            start_hour += 12
-        elif start_ampm == 'AM' and start_hour == 12:
-            start_hour = 0
-        
-        if end_ampm == 'PM' and end_hour != 12:
-            end_hour += 12
-        elif end_ampm == 'AM' and end_hour == 12:
-            end_hour = 0
-            
-        available_hours = (end_hour * 60 + end_min - start_hour * 60 - start_min) / 60
+    text = response_body['content'][0]['text']
+    metrics.record('response_chars', len(text))
+    if response_body.get('stop_reason') == 'max_tokens':
+        metrics.record('max_tokens_stops', 1)
+    return text, token_usage(response_body.get('usage', {}))
+
+def reask_missing_fields(model_args, response_text, missing, usage):
+    """Ask the model again for only the fields its reply lacked; returns the new text.
+
+    The first reply goes back as the assistant turn so the model continues
+    from it instead of planning again. Tokens are added to `usage`.
+    """
+    body = build_model_body(*model_args)
+    reask = prompts.REASK_TEMPLATE.format(fields=', '.join(missing))
+    partial = response_text.strip()
+    if partial:
+        body['messages'] += [{"role": "assistant", "content": partial}, {"role": "user", "content": reask}]
     else:
-        print(f"Warning: Could not parse times. Start: {start_time}, End: {end_time}")
+        body['messages'][0]['content'] += f"\n\n{reask}"
     
-    system_prompt = f"""You are MoodFlow, an empathetic AI schedule planner.
-
-Planning date: {date_str}
-Start time: {start_time}
-End time: {end_time}
-Available hours: {available_hours:.1f}
-
-EXISTING SCHEDULE FOR THIS DATE:
-{json.dumps(existing_tasks) if has_existing else "No existing schedule"}
-
-PREVIOUSLY DETECTED MOOD: {previous_mood}
-
-PREVIOUSLY UNSCHEDULED TASKS:
-{json.dumps(unscheduled) if unscheduled else "None"}
-
-User's message: {user_message}
-
-Planning knowledge from database:
-{kb_results}
-
-SPECIAL INSTRUCTION - RETRIEVAL QUERY:
-{"User is asking to VIEW an existing schedule, not create a new one. Return ONLY the existing schedule without modifications. If no schedule exists for this date, return empty schedule array with message 'No schedule found for this date.' DO NOT attempt to create a new schedule." if is_retrieval else ""}
-
-MOOD DETECTION RULES:
-- If the user explicitly mentions their emotional state (e.g., "I'm tired", "feeling stressed", "I'm energized"), detect and use that new mood
-- If the user does NOT mention their emotional state in this message, use the PREVIOUSLY DETECTED MOOD: {previous_mood}
-- Only change mood when user explicitly expresses a different emotion
-- Maintain mood continuity across conversation turns
-
-CRITICAL SCHEDULING CONSTRAINTS:
-1. The FIRST task in the schedule MUST start at or immediately after {start_time}
-2. ALL tasks must fall between {start_time} and {end_time}
-3. Schedule FORWARDS from start time, not backwards from end time or interruptions
-4. If user mentions appointments/meetings (like "class at X"), incorporate them as BLOCKS within the schedule, not endpoints
-5. Use ALL available time between start and end - do not leave large gaps at the beginning
-
-WORKFLOW LOGIC:
-1. If existing schedule exists and user just selected this date:
-   - Show the existing schedule
-   - Ask: "You have existing tasks for this day. Would you like to edit this schedule or start fresh?"
-   - Set conversation_state to "awaiting_confirmation"
-   
-2. If user confirms editing (says yes/edit/continue):
-   - Apply their requested changes (add/remove/reorder tasks)
-   - Keep unscheduled_tasks intact unless they schedule them
-   
-3. If user provides NEW tasks:
-   - Detect their mood from the message
-   - Consult the planning knowledge from database to determine optimal scheduling for this mood
-   - Parse tasks with durations
-   - Apply emotion-aware patterns: task ordering, time blocks, break frequency based on knowledge base
-   - Calculate if they fit in available time
-   - Move overflow to unscheduled_tasks array
-   - Ask: "These tasks don't fit today: [list]. Which date would you like to schedule them for?"
-   
-4. If user specifies a date for unscheduled tasks (e.g., "Oct 08"):
-   - Extract the date
-   - Return those tasks in reschedule_for_date object
-   - Clear them from unscheduled_tasks
-   
-5. If user says "drop X" or "remove X":
-   - Remove that task from schedule
-   - Do NOT add to unscheduled
-
-MANDATORY: Your scheduling decisions MUST be informed by the planning knowledge provided. Explain the reasoning in terms of benefits to the user, not which strategy you applied. Focus on WHY this schedule helps them given their emotional state.
-
-OUTPUT JSON:
-{{
-  "mood_detected": "stressed|energized|anxious|focused|sad|tired|happy",
-  "conversation_state": "awaiting_confirmation|editing|scheduling_new|asking_for_date",
-  "schedule": [
-    {{"time": "9:00-11:00 AM", "task": "Task name", "reasoning": "Natural explanation of why this time/order helps the user", "wellness_note": "Actionable tip"}}
-  ],
-  "unscheduled_tasks": [
-    {{"task": "Task name", "estimated_duration": "2 hours"}}
-  ],
-  "reschedule_for_date": {{
-    "date": "2025-10-08",
-    "tasks": [{{"task": "Demo", "time": "9:00-11:00 AM"}}]
-  }},
-  "response_message": "Conversational response based on conversation_state"
-}}"""
-
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 2500,
-        "messages": [{"role": "user", "content": system_prompt}]
-    }
+    text, reask_usage = invoke_model_body(body, 'model_reask')
+    record_token_usage(reask_usage)
+    for name, count in reask_usage.items():
+        usage[name] = usage.get(name, 0) + count
+    return text
+
+def stream_bedrock(user_message, date_str, start_time, end_time, kb_results, existing_schedule, conversation, usage):
+    """Invoke Bedrock with a response stream, yielding text deltas as they arrive.
+
+    Token counts from the stream's message_start/message_delta events are
+    collected into the `usage` dict as they arrive.
+    """
+    body = build_model_body(user_message, date_str, start_time, end_time, kb_results, existing_schedule, conversation)
     
-    response = bedrock_runtime.invoke_model(
-        modelId=MODEL_ID,
+    started = time.perf_counter()
+    response = model_client.invoke(
+        'invoke_model_with_response_stream', MODEL_ID,
         guardrailIdentifier=GUARDRAIL_ID,
         guardrailVersion=GUARDRAIL_VERSION,
         body=json.dumps(body)
     )
     
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+    first_token = True
+    response_chars = 0
+    for event in model_client.iter_events(response['body']):
+        chunk = json.loads(event['chunk']['bytes'])
+        if chunk.get('type') == 'content_block_delta':
+            text = chunk['delta'].get('text', '')
+            if first_token:
+                metrics.record('model_first_token_ms', (time.perf_counter() - started) * 1000, 'Milliseconds')
+                first_token = False
+            response_chars += len(text)
+            yield text
+        elif chunk.get('type') == 'message_start':
+            usage.update(token_usage(chunk['message'].get('usage', {})))
+        elif chunk.get('type') == 'message_delta':
+            usage['output_tokens'] = chunk.get('usage', {}).get('output_tokens', 0)
+            if chunk.get('delta', {}).get('stop_reason') == 'max_tokens':
+                metrics.record('max_tokens_stops', 1)
+    
+    # Includes the time the caller spent between chunks
+    metrics.record('model_invoke_ms', (time.perf_counter() - started) * 1000, 'Milliseconds')
+    metrics.record('response_chars', response_chars)
 
+@metrics.timed('parse_response')
 def parse_response(text):
-    """Extract JSON from Claude's response"""
-    text = text.replace('```json', '').replace('```', '').strip()
-    
+    """Extract and validate the JSON in Claude's response; returns (data, missing fields).
+
+    Preamble and trailing text are skipped and output cut off at max_tokens
+    is repaired; the field that was cut off is reported missing.
+    """
     try:
-        start = text.index('{')
-        end = text.rindex('}') + 1
-        json_only = text[start:end]
-        return json.loads(json_only)
-    except (ValueError, json.JSONDecodeError) as e:
+        data, incomplete, repaired = json_stream.extract_object(text)
+    except ValueError as e:
         print(f"JSON parse error: {e}")
         print(f"Raw text: {text}")
-        return {
-            "mood_detected": "unknown",
-            "schedule": [],
-            "response_message": "Error parsing schedule. Please try again."
-        }
+        data, incomplete, repaired = {}, None, False
+    if repaired:
+        metrics.record('parse_repaired', 1)
+    return data, output_schema.validate(data, SCHEDULING_ENGINE, incomplete)
 
-def lambda_handler(event, context):
+def parse_error_response(existing_schedule, date_str):
+    """Answer for an unusable model reply: the stored schedule for `date_str`, unchanged.
+
+    "date" names that date, so a client planning another one does not take it
+    for the planning date's schedule.
+    """
+    existing_schedule = existing_schedule or {}
+    return {
+        "date": date_str,
+        "mood_detected": existing_schedule.get('mood', 'unknown'),
+        "schedule": existing_schedule.get('schedule', []),
+        "unscheduled_tasks": existing_schedule.get('unscheduled_tasks', []),
+        "response_message": PARSE_ERROR_MESSAGE,
+        "schedule_version": existing_schedule.get('version', 0)
+    }
+
+def degraded_response(existing_schedule, date_str, error):
+    """Answer for a model that is throttled or out of time: the stored schedule, unchanged"""
+    print(f"Degraded response: {error}")
+    metrics.record('model_degraded', 1)
+    response = parse_error_response(existing_schedule, date_str)
+    response.update(response_message=DEGRADED_MESSAGE, degraded=True, retry_after=error.retry_after,
+                    meta={'usage': {}})
+    return response
+
+@metrics.timed('scheduler')
+def apply_scheduling_engine(schedule_data, window):
+    """Lay out the model's extracted tasks with the deterministic scheduler"""
+    tasks = schedule_data.pop('tasks', None)
+    if not tasks:
+        return schedule_data
+
+    start_minutes, end_minutes = window
+    rules = mood_rules.load_rules().get(schedule_data.get('mood_detected'))
+    schedule, overflow = scheduler.build_schedule(tasks, start_minutes, end_minutes, rules)
+
+    schedule_data['schedule'] = schedule
+    schedule_data['unscheduled_tasks'] = overflow
+    if overflow:
+        names = ', '.join(task['task'] for task in overflow)
+        schedule_data['conversation_state'] = 'asking_for_date'
+        schedule_data['response_message'] = (
+            f"{schedule_data.get('response_message', '')} These tasks don't fit today: {names}. "
+            "Which date would you like to schedule them for?"
+        ).strip()
+    return schedule_data
+
+def api_response(status_code, payload, headers=None):
+    """Wrap a payload in an API Gateway proxy response"""
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json',
+            **(headers or {})
+        },
+        'body': json.dumps(payload)
+    }
+
+@metrics.timed('parse_request')
+def parse_planning_request(body, query_params=None, request_context=None):
+    """Validated request (message, date, time window, action, session, user) from a body"""
+    return request_envelope.parse_request(body, query_params, request_context)
+
+def view_response_for(request):
+    """Serve view requests straight from DynamoDB; None when the model is needed"""
+    if request['action'] == 'view':
+        return build_view_response(request['user_id'], request['date_str'])
+    if is_view_request(request['user_message']):
+        return build_view_response(request['user_id'], resolve_retrieval_date(request['user_message'], request['date_str']))
+    return None
+
+def caught_up_schedule(request, stored):
+    """The stored schedule for the planning date, once it has the version the client last saw.
+
+    In PERSIST_MODE=queue a response reports the version its queued write
+    will produce, so a follow-up can arrive before the write is applied. Wait
+    for it with consistent reads for up to persistence.CATCH_UP_SECONDS; if
+    it never lands (the queued write failed), expected_version answers 409
+    and the client reloads what was actually saved.
+    """
+    wanted = request['schedule_version']
+    if persistence.MODE != 'queue' or wanted is None:
+        return stored
+    deadline = time.monotonic() + persistence.CATCH_UP_SECONDS
+    while (stored or {}).get('version', 0) < wanted:
+        if time.monotonic() >= deadline:
+            metrics.record('persist_catch_up_timeouts', 1)
+            break
+        time.sleep(persistence.CATCH_UP_POLL_SECONDS)
+        stored = get_schedule_for_date(request['user_id'], request['date_str'], consistent=True)
+    return stored
+
+def expected_version(request, stored):
+    """The version a write must find: the one just read, which must be the one the client last saw"""
+    version = (stored or {}).get('version', 0)
+    if request['schedule_version'] is not None and request['schedule_version'] != version:
+        raise schedule_patch.VersionConflict(request['date_str'])
+    return version
+
+def direct_response(request, decision):
+    """Answer a confirm, drop or reschedule against the stored schedule; None when the model is needed"""
+    if decision['intent'] not in ('confirm', 'drop', 'reschedule'):
+        return None
+    date_str = request['date_str']
+    existing_schedule = caught_up_schedule(request, get_schedule_for_date(request['user_id'], date_str))
+    if existing_schedule is None:
+        return None
+    schedule = stored_schedule = existing_schedule.get('schedule', [])
+    unscheduled = existing_schedule.get('unscheduled_tasks', [])
+    mood = decision['mood'] or existing_schedule.get('mood', 'unknown')
+    version = expected_version(request, existing_schedule)
+    state = 'editing'
+    
+    if decision['intent'] == 'confirm':
+        message = "Great, your schedule is saved. Tell me if you'd like to change anything."
+    elif decision['intent'] == 'drop':
+        # No match, or several different tasks, is left to the model
+        names = router.matching_tasks(schedule + unscheduled, decision['task'])
+        if len(names) != 1:
+            return None
+        dropped, schedule = router.split_entries(schedule, names[0])
+        schedule = router.tidy_breaks(schedule)
+        dropped_unscheduled, unscheduled = router.split_entries(unscheduled, names[0])
+        version = save_schedule_for_date(request['user_id'], date_str, schedule, unscheduled, mood, request['window'],
+                                         version, stored_schedule)['version']
+        message = f"Removed {router.describe_tasks(dropped + dropped_unscheduled)} from your schedule."
+    else:
+        # Tasks move forward: never to a date before the one being planned
+        target_date = resolve_retrieval_date(decision['date_text'], date_str, upcoming=True)
+        try:
+            target_day = date.fromisoformat(target_date)
+        except ValueError:
+            return None
+        if target_date == date_str:
+            return None
+        if router.refers_to_overflow(decision['task']):
+            moving, unscheduled = unscheduled, []
+        else:
+            names = router.matching_tasks(schedule + unscheduled, decision['task'])
+            if len(names) != 1:
+                return None
+            moving, unscheduled = router.split_entries(unscheduled, names[0])
+            moved_entries, schedule = router.split_entries(schedule, names[0])
+            schedule = router.tidy_breaks(schedule)
+            moving += moved_entries
+        if not moving:
+            return None
+        # Both dates change together or not at all
+        saved = save_schedules([
+            schedule_update(request['user_id'], date_str, schedule, unscheduled, mood, request['window'],
+                            version, stored_schedule),
+            reschedule_update(request['user_id'], target_date, moving, mood)
+        ])
+        version = saved[0]['version']
+        message = f"Moved {router.describe_tasks(moving)} to {target_day.strftime('%A, %b %d')}."
+        state = 'editing' if schedule or unscheduled else 'scheduling_new'
+    
+    return {
+        "mood_detected": mood,
+        "conversation_state": state,
+        "schedule": schedule,
+        "unscheduled_tasks": unscheduled,
+        "response_message": message,
+        "schedule_version": version
+    }
+
+@metrics.timed('router')
+def route_request(request):
+    """Classify the message and answer view and simple edit intents without the planning model.
+
+    Returns (router metadata, response or None); the metadata (intent, mood,
+    who handled it, classifier latency) is returned in meta.router.
+    """
+    started = time.perf_counter()
+    if request['action'] == 'view' or is_view_request(request['user_message']):
+        decision = {'intent': 'view', 'mood': None}
+    else:
+        decision = router.classify(request['user_message'])
+    classify_ms = (time.perf_counter() - started) * 1000
+    
+    if decision['intent'] == 'view':
+        response = view_response_for(request)
+    else:
+        response = direct_response(request, decision)
+    meta = {
+        'intent': decision['intent'],
+        'mood': decision['mood'],
+        'handled_by': 'model' if response is None else 'router',
+        'classify_ms': round(classify_ms, 3)
+    }
+    metrics.set_property('router', meta)
+    if response is not None:
+        response['meta'] = {'router': meta}
+    return meta, response
+
+def start_prefetch(request):
+    """Resolve the context date and start fetching its schedule, the session memory and the KB results.
+
+    All run concurrently on the prefetch pool; the KB is skipped when the
+    message names a mood, since the rule table covers it.
+    """
+    user_message = request['user_message']
+    
+    # Resolve which date's schedule the prompt needs before fetching it
+    context_date = request['date_str']
+    if is_retrieval_query(user_message):
+        context_date = resolve_retrieval_date(user_message, context_date)
+    
+    need_kb = PROMPT_KNOWLEDGE != 'rules' or mood_rules.detect_mood(user_message) is None
+    return {
+        'context_date': context_date,
+        'kb': metrics.submit(prefetch_pool, query_knowledge_base, user_message) if need_kb else None,
+        'schedule': metrics.submit(prefetch_pool, get_schedule_for_date, request['user_id'], context_date),
+        'session': metrics.submit(prefetch_pool, sessions.load, request['user_id'], request['session_id'])
+    }
+
+def plan_cache_key(request, prefetch, version):
+    """Response cache key for this user's request against a schedule version"""
+    return response_cache.make_key(
+        request['user_message'], prefetch['context_date'], request['start_time'], request['end_time'],
+        version, MODEL_ID, SCHEDULING_ENGINE, request['user_id']
+    )
+
+def prepare_model_args(request, prefetch, existing_schedule):
+    """Wait for the planning knowledge and session memory and build the model call arguments"""
+    kb_results = prefetch['kb'].result() if prefetch['kb'] else ""
+    knowledge = select_planning_knowledge(request['user_message'], existing_schedule, kb_results)
+    conversation = sessions.format_context(prefetch['session'].result())
+    
+    return (request['user_message'], prefetch['context_date'], request['start_time'], request['end_time'],
+            knowledge, existing_schedule, conversation)
+
+def remember_turn(request, response, session_state=None):
+    """Add a plan message and its answer to the session memory (failed and degraded answers are left out)"""
+    if request['action'] != 'plan' or response.get('response_message') in (PARSE_ERROR_MESSAGE, DEGRADED_MESSAGE):
+        return
+    sessions.remember(request['user_id'], request['session_id'], session_state, request['date_str'],
+                      request_envelope.LEGACY_ENVELOPE_PATTERN.sub('', request['user_message']), response)
+
+def cache_keys_after_save(request, prefetch, schedule_data):
+    """Also file a response under the schedule version it just saved, so a
+    retry that arrives after the save still finds it"""
+    version = schedule_data.pop('_saved_version', None)
+    if schedule_data.get('response_message') == PARSE_ERROR_MESSAGE:
+        return None
+    if version is None or prefetch['context_date'] != request['date_str']:
+        return []
+    return [plan_cache_key(request, prefetch, version)]
+
+def reschedule_update(user_id, date_str, tasks, mood):
+    """The write that merges tasks into the free time of a date, keeping what is already booked there"""
+    existing_schedule = get_schedule_for_date(user_id, date_str) or {}
+    schedule, overflow = scheduler.merge_tasks(existing_schedule.get('schedule', []), tasks)
+    return schedule_update(
+        user_id,
+        date_str,
+        schedule,
+        existing_schedule.get('unscheduled_tasks', []) + overflow,
+        existing_schedule.get('mood', mood),
+        expected_version=existing_schedule.get('version', 0),
+        stored_schedule=existing_schedule.get('schedule')
+    )
+
+def complete_plan(request, response_text, reask=None, existing_schedule=None, context_date=None):
+    """Parse the model output, lay out extracted tasks or apply patch operations, and persist the result.
+
+    Fields missing from the reply are requested once with `reask(missing)`.
+    If the plan itself is still missing nothing is saved, so a bad reply
+    never overwrites the stored schedule. `existing_schedule` is the stored
+    item for `context_date`; when that is the planning date, the write is
+    conditioned on its version and only changed entries are written.
+    """
+    schedule_data, missing = parse_response(response_text)
+    if missing and reask is not None:
+        metrics.record('parse_reask', 1)
+        try:
+            reask_data, _ = parse_response(reask(missing))
+        except Exception as e:
+            print(f"Re-ask error: {e}")
+            reask_data = {}
+        schedule_data.update({field: reask_data[field] for field in missing if field in reask_data})
+        missing = output_schema.validate(schedule_data, SCHEDULING_ENGINE)
+    
+    if output_schema.plan_missing(missing):
+        metrics.record('parse_failed', 1)
+        return parse_error_response(existing_schedule, context_date or request['date_str'])
+    
+    same_date = (context_date or request['date_str']) == request['date_str']
+    stored = existing_schedule if same_date else None
+    if 'patch' in schedule_data:
+        # Edit mode: apply the operations to the stored schedule
+        ops = schedule_data.pop('patch')
+        try:
+            if stored is None:
+                raise schedule_patch.PatchError('There is no stored schedule to edit')
+            schedule_data['schedule'] = schedule_patch.apply(stored.get('schedule', []), ops)
+        except schedule_patch.PatchError as e:
+            print(f"Patch error: {e}")
+            metrics.record('patch_failed', 1)
+            return parse_error_response(existing_schedule, context_date or request['date_str'])
+        schedule_data.setdefault('unscheduled_tasks', stored.get('unscheduled_tasks', []))
+        metrics.record('patch_ops', len(ops))
+    output_schema.fill_defaults(schedule_data, (existing_schedule or {}).get('mood', 'unknown'))
+    
+    if SCHEDULING_ENGINE == 'local':
+        schedule_data = apply_scheduling_engine(schedule_data, request['window'])
+    
+    # Save to DynamoDB, conditioned on the version this plan was based on
+    writes = [schedule_update(
+        request['user_id'],
+        request['date_str'],
+        schedule_data.get('schedule', []),
+        schedule_data.get('unscheduled_tasks', []),
+        schedule_data.get('mood_detected', 'unknown'),
+        request['window'],
+        expected_version(request, stored) if same_date else request['schedule_version'],
+        (stored or {}).get('schedule')
+    )]
+    # Rescheduled tasks (validated to have a date and tasks) are saved in the same transaction
+    reschedule_info = schedule_data.get('reschedule_for_date')
+    if reschedule_info and reschedule_info['date'] != request['date_str']:
+        writes.append(reschedule_update(request['user_id'], reschedule_info['date'], reschedule_info['tasks'], schedule_data['mood_detected']))
+    saved = save_schedules(writes)[0]
+    schedule_data['_saved_version'] = saved['last_updated']
+    schedule_data['schedule_version'] = saved['version']
+    
+    # Offer dates that have room for the overflow instead of asking the user to guess
+    if schedule_data.get('unscheduled_tasks'):
+        try:
+            suggestions = suggest_dates(request['user_id'], schedule_data['unscheduled_tasks'], request['date_str'])['dates']
+        except Exception as e:
+            print(f"Date suggestion error: {e}")
+            suggestions = []
+        schedule_data['suggested_dates'] = suggestions
+        if suggestions:
+            names = ', '.join(datetime.strptime(s['date'], '%Y-%m-%d').strftime('%b %d') for s in suggestions)
+            schedule_data['response_message'] = (
+                f"{schedule_data.get('response_message', '')} Dates with enough free time: {names}."
+            ).strip()
+    
+    return schedule_data
+
+def iter_plan_events(body, query_params=None, request_context=None):
+    """Run the planning pipeline with a streamed model call, yielding events.
+
+    Each completed "schedule" entry (or extracted task, with the local
+    scheduling engine) and each top-level field is yielded as soon as the
+    model closes it; the final "done" event carries the full response, after
+    it has been persisted.
+    """
+    with metrics.trace_request('stream'):
+        yield from _plan_events(body, query_params, request_context)
+
+def _plan_events(body, query_params, request_context):
+    model_client.start_deadline()
     try:
-        body = json.loads(event['body'])
-        user_message = body['message']
+        request = parse_planning_request(body, query_params, request_context)
+        route, routed = route_request(request)
+        if routed is not None:
+            metrics.set_route('view' if route['intent'] == 'view' else 'direct')
+            remember_turn(request, routed)
+            yield {'event': 'done', 'data': routed}
+            return
         
-        # Extract date: "Planning for Sunday, October 05, 2025"
-        date_match = re.search(r'Planning for [^,]+, ([A-Za-z]+) (\d{1,2}), (\d{4})', user_message)
+        prefetch = start_prefetch(request)
+        existing_schedule = prefetch['schedule'].result()
+        # A client editing an older version than the stored one gets its 409 before any model call
+        if prefetch['context_date'] == request['date_str']:
+            existing_schedule = caught_up_schedule(request, existing_schedule)
+            expected_version(request, existing_schedule)
+        key = plan_cache_key(request, prefetch, (existing_schedule or {}).get('last_updated'))
+        cached = response_cache.lookup(key)
+        if cached is not None:
+            cached['meta'].update(cache='hit', router=route)
+            record_cache_stats('hit')
+            remember_turn(request, cached, prefetch['session'].result())
+            yield {'event': 'done', 'data': cached}
+            return
         
-        if date_match:
-            month_name = date_match.group(1)
-            day = date_match.group(2).zfill(2)
-            year = date_match.group(3)
+        parser = json_stream.IncrementalJSONParser(stream_arrays=('schedule', 'tasks'))
+        chunks = []
+        usage = {}
+        with rate_limits.admit(request['user_id']):
+            model_args = prepare_model_args(request, prefetch, existing_schedule)
+            try:
+                for text in stream_bedrock(*model_args, usage):
+                    chunks.append(text)
+                    yield from parser.feed(text)
+            except model_client.ModelUnavailable as e:
+                yield {'event': 'done', 'data': degraded_response(existing_schedule, prefetch['context_date'], e)}
+                return
+            record_token_usage(usage)
             
-            month_num = datetime.strptime(month_name, '%B').strftime('%m')
-            date_str = f"{year}-{month_num}-{day}"
-        else:
-            date_str = datetime.now().strftime('%Y-%m-%d')
+            response_text = ''.join(chunks)
+            schedule_data = complete_plan(
+                request, response_text,
+                lambda missing: reask_missing_fields(model_args, response_text, missing, usage),
+                existing_schedule, prefetch['context_date']
+            )
+        schedule_data['meta'] = {'usage': usage}
+        extra_keys = cache_keys_after_save(request, prefetch, schedule_data)
+        if extra_keys is not None:
+            response_cache.store([key, *extra_keys], schedule_data)
+        schedule_data['meta'].update(cache='miss', router=route)
+        record_cache_stats('miss')
+        remember_turn(request, schedule_data, prefetch['session'].result())
+        yield {'event': 'done', 'data': schedule_data}
+    except (json.JSONDecodeError, request_envelope.RequestError) as e:
+        yield {'event': 'error', 'data': {'error': str(e), 'status': 400}}
+    except request_envelope.Unauthorized as e:
+        yield {'event': 'error', 'data': {'error': str(e), 'status': 401}}
+    except schedule_patch.VersionConflict as e:
+        yield {'event': 'error', 'data': {'error': str(e), 'status': 409}}
+    except rate_limits.RateLimited as e:
+        yield {'event': 'error', 'data': {'error': str(e), 'status': 429, 'retry_after': e.retry_after}}
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        traceback.print_exc()
+        yield {'event': 'error', 'data': {'error': str(e)}}
+
+def plan_job(request, kb_results):
+    """Plan one batch job like a plan request, without the response cache, rate limits or session memory"""
+    # A copied context per job thread, so each job gets its own deadline
+    model_client.start_deadline(batch.JOB_SECONDS)
+    existing_schedule = get_schedule_for_date(request['user_id'], request['date_str'])
+    knowledge = select_planning_knowledge(request['user_message'], existing_schedule, kb_results)
+    model_args = (request['user_message'], request['date_str'], request['start_time'], request['end_time'],
+                  knowledge, existing_schedule)
+    response_text, usage = invoke_bedrock(*model_args)
+    record_token_usage(usage)
+    schedule_data = complete_plan(
+        request, response_text,
+        lambda missing: reask_missing_fields(model_args, response_text, missing, usage),
+        existing_schedule
+    )
+    schedule_data.pop('_saved_version', None)
+    if schedule_data.get('response_message') == PARSE_ERROR_MESSAGE:
+        raise ValueError('The model reply could not be parsed; nothing was saved')
+    schedule_data['meta'] = {'usage': usage}
+    return schedule_data
+
+async def run_batch_jobs(jobs):
+    """Plan batch jobs concurrently, at most batch.CONCURRENCY at a time; returns one result per job.
+
+    boto3 is synchronous, so each job's calls run in a worker thread. Jobs
+    that need the KB share one retrieval per mood instead of one each.
+    """
+    # Imported here: only the batch consumer needs it, not the API's cold start
+    import asyncio
+    semaphore = asyncio.Semaphore(batch.CONCURRENCY)
+    retrievals = {}
+    
+    def knowledge_for(mood):
+        if mood not in retrievals:
+            query = BATCH_KB_QUERY.format(mood=mood or 'any')
+            retrievals[mood] = asyncio.ensure_future(asyncio.to_thread(query_knowledge_base, query))
+        return retrievals[mood]
+    
+    async def run(job):
+        async with semaphore:
+            try:
+                request = batch.job_request(job)
+                mood = mood_rules.detect_mood(request['user_message'])
+                need_kb = PROMPT_KNOWLEDGE != 'rules' or mood is None
+                kb_results = await knowledge_for(mood) if need_kb else ""
+                response = await asyncio.to_thread(plan_job, request, kb_results)
+            except Exception as e:
+                # One failed job is reported in its result, not retried with the whole message
+                print(f"Batch job {job.get('index')} error: {e}")
+                metrics.record('batch_jobs_failed', 1)
+                return batch.job_result(job, error=e)
+            metrics.record('batch_jobs_done', 1)
+            return batch.job_result(job, response)
+    
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+def batch_handler(event, context):
+    """SQS consumer for batch planning (see batch.py); messages whose results were not written are returned for retry"""
+    import asyncio
+    with metrics.trace_request('batch'):
+        failures = []
+        messages = []
+        for record in event.get('Records', []):
+            try:
+                message = json.loads(record['body'])
+                messages.append((record['messageId'], message['batch_id'], message['jobs']))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Batch message error for {record['messageId']}: {e}")
+                failures.append({'itemIdentifier': record['messageId']})
         
-        # Extract times
-        start_time_match = re.search(r'Start:\s+([^|]+)', user_message)
-        end_time_match = re.search(r'End by:\s+([^\]]+)', user_message)
+        # Every job of the delivery fans out together, so messages do not wait on each other
+        results = iter(asyncio.run(run_batch_jobs([job for _, _, jobs in messages for job in jobs])))
+        for message_id, batch_id, jobs in messages:
+            message_results = [next(results) for _ in jobs]
+            try:
+                batch.write_results(batch_id, message_results)
+            except Exception as e:
+                print(f"Batch result write error for {message_id}: {e}")
+                failures.append({'itemIdentifier': message_id})
+        return {'batchItemFailures': failures}
+
+def lambda_handler(event, context):
+    with metrics.trace_request():
+        response = handle_event(event)
+        metrics.record('response_bytes', len(response['body']), 'Bytes')
+        metrics.set_property('status_code', response['statusCode'])
+        return response
+
+def handle_event(event):
+    """Route one API Gateway event and build its proxy response"""
+    model_client.start_deadline()
+    try:
+        metrics.record('request_bytes', len(event['body'] or ''), 'Bytes')
+        body = json.loads(event['body'])
+        request = parse_planning_request(body, event.get('queryStringParameters'), event.get('requestContext'))
         
-        start_time = start_time_match.group(1).strip() if start_time_match else "9:00 AM"
-        end_time = end_time_match.group(1).strip() if end_time_match else "5:00 PM"
+        # Week/month overview: one range Query, no model call
+        if request['action'] == 'calendar':
+            metrics.set_route('calendar')
+            try:
+                start_date, end_date = parse_calendar_range(body)
+            except ValueError as e:
+                return api_response(400, {'error': str(e)})
+            return api_response(200, build_calendar_response(request['user_id'], start_date, end_date))
         
-        # Query Knowledge Base
-        kb_results = query_knowledge_base(user_message)
+        # Batch planning: queue the jobs and answer with the batch id; progress is polled
+        if request['action'] == 'batch_submit':
+            metrics.set_route('batch_submit')
+            return api_response(202, batch.submit(request['user_id'], body.get('jobs')))
+        if request['action'] == 'batch_status':
+            metrics.set_route('batch_status')
+            try:
+                return api_response(200, batch.status(request['user_id'], body.get('batch_id'),
+                                                      body.get('include_results') is True))
+            except batch.BatchNotFound as e:
+                return api_response(404, {'error': str(e)})
         
-        # Call Bedrock
-        response_text = invoke_bedrock(user_message, date_str, start_time, end_time, kb_results)
+        # Free dates for overflow tasks: one capacity Query, no model call
+        if request['action'] == 'suggest_dates':
+            metrics.set_route('suggest_dates')
+            try:
+                return api_response(200, suggestions_response(request['user_id'], body))
+            except ValueError as e:
+                return api_response(400, {'error': str(e)})
         
-        # Parse response
-        schedule_data = parse_response(response_text)
+        # Serve views, confirmations and single drops/moves straight from DynamoDB, no KB or model call
+        route, routed = route_request(request)
+        if routed is not None:
+            metrics.set_route('view' if route['intent'] == 'view' else 'direct')
+            remember_turn(request, routed)
+            return api_response(200, routed)
         
-        # Save to DynamoDB
-        save_schedule_for_date(
-            date_str,
-            schedule_data.get('schedule', []),
-            schedule_data.get('unscheduled_tasks', []),
-            schedule_data.get('mood_detected', 'unknown')
-        )
+        # Start the KB and schedule fetches; the schedule's version is part of the cache key
+        prefetch = start_prefetch(request)
+        existing_schedule = prefetch['schedule'].result()
+        # A client editing an older version than the stored one gets its 409 before any model call
+        if prefetch['context_date'] == request['date_str']:
+            existing_schedule = caught_up_schedule(request, existing_schedule)
+            expected_version(request, existing_schedule)
+        key = plan_cache_key(request, prefetch, (existing_schedule or {}).get('last_updated'))
         
-        # Handle rescheduled tasks
-        if 'reschedule_for_date' in schedule_data and schedule_data['reschedule_for_date']:
-            reschedule_info = schedule_data['reschedule_for_date']
-            future_date = reschedule_info.get('date')
-            future_tasks = reschedule_info.get('tasks', [])
-            
-            if future_date and future_tasks:
-                save_schedule_for_date(
-                    future_date,
-                    future_tasks,
-                    [],
-                    schedule_data.get('mood_detected', 'unknown')
+        def plan():
+            # Call Bedrock within the user's rate and concurrency caps, then parse, lay out and save
+            with rate_limits.admit(request['user_id']):
+                model_args = prepare_model_args(request, prefetch, existing_schedule)
+                try:
+                    response_text, usage = invoke_bedrock(*model_args)
+                except model_client.ModelUnavailable as e:
+                    # Answer inside the client's timeout with the stored schedule; not cached
+                    return degraded_response(existing_schedule, prefetch['context_date'], e), None
+                record_token_usage(usage)
+                schedule_data = complete_plan(
+                    request, response_text,
+                    lambda missing: reask_missing_fields(model_args, response_text, missing, usage),
+                    existing_schedule, prefetch['context_date']
                 )
+            schedule_data['meta'] = {'usage': usage}
+            # None for a failed parse: answered, but not cached
+            return schedule_data, cache_keys_after_save(request, prefetch, schedule_data)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps(schedule_data)
-        }
+        schedule_data, status = response_cache.get_or_compute(key, plan)
+        schedule_data['meta'].update(cache=status, router=route)
+        record_cache_stats(status)
+        remember_turn(request, schedule_data, prefetch['session'].result())
+        
+        return api_response(200, schedule_data)
         
+    except (json.JSONDecodeError, request_envelope.RequestError) as e:
+        return api_response(400, {'error': str(e)})
+    except request_envelope.Unauthorized as e:
+        return api_response(401, {'error': str(e)})
+    except schedule_patch.VersionConflict as e:
+        # Optimistic concurrency: the client reloads the schedule and retries
+        return api_response(409, {'error': str(e)})
+    except rate_limits.RateLimited as e:
+        return api_response(429, {'error': str(e), 'retry_after': e.retry_after},
+                            {'Retry-After': str(e.retry_after)})
     except Exception as e:
         print(f"Error: {str(e)}")
-        import traceback
         traceback.print_exc()
         return {
             'statusCode': 500,
@@ -0,0 +1,128 @@
+"""In-process BM25 index over the bundled knowledge base documents.
+
+The three strategy documents are small enough to chunk and index at cold
+start, which lets query_knowledge_base answer without a Bedrock Knowledge
+Base round trip when KB_BACKEND=local.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+KB_DOCUMENTS = (
+    'mood-planning-strategies.txt',
+    'task-completion-patterns.txt',
+    'wellness-guidelines.txt'
+)
+DOCS_DIR = os.environ.get('KB_DOCS_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have i if in into is it its
+me my of on or so that the their then there these this to was were when will
+with you your
+""".split())
+
+# Crude suffix stripping so "stressed"/"stress" and "tired"/"tiredness" match
+SUFFIXES = ('ness', 'ing', 'ed', 'es', 's')
+
+_index = None
+
+def stem(word):
+    """Strip common suffixes until none applies"""
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) > len(suffix) + 2:
+                word = word[:-len(suffix)]
+                stripped = True
+                break
+    return word
+
+def tokenize(text):
+    """Lowercase, stemmed word tokens without stopwords"""
+    return [stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def chunk_document(text, source):
+    """Split a document into paragraph chunks.
+
+    Follow-up paragraphs ("When tired: ..." under "Code Review Tasks:", or
+    "Recommended interventions:" under an upper-case section heading) only
+    make sense together with their heading, so the heading is carried into
+    those chunks.
+    """
+    chunks = []
+    topic = ''
+    for paragraph in re.split(r'\n\s*\n', text.replace('\r\n', '\n')):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        first_line = paragraph.split('\n', 1)[0]
+        is_follow_up = topic and (
+            paragraph.startswith('When ') or (topic.isupper() and not first_line.isupper())
+        )
+        if is_follow_up:
+            paragraph = f"{topic}\n{paragraph}"
+        else:
+            topic = first_line
+
+        chunks.append({'source': source, 'text': paragraph})
+    return chunks
+
+def load_chunks(docs_dir=DOCS_DIR):
+    """Chunk every bundled knowledge base document"""
+    chunks = []
+    for name in KB_DOCUMENTS:
+        with open(os.path.join(docs_dir, name), encoding='utf-8') as f:
+            chunks.extend(chunk_document(f.read(), name))
+    return chunks
+
+class LocalKnowledgeIndex:
+    """BM25 index with per-chunk term weights precomputed at build time"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        doc_terms = [Counter(tokenize(chunk['text'])) for chunk in chunks]
+        doc_lengths = [sum(terms.values()) for terms in doc_terms]
+        avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+        doc_freq = Counter()
+        for terms in doc_terms:
+            doc_freq.update(terms.keys())
+
+        n_docs = len(chunks)
+        # Inverted index: term -> [(chunk index, BM25 weight)]
+        self.postings = {}
+        for i, terms in enumerate(doc_terms):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[i] / avg_length)
+            for term, tf in terms.items():
+                idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                weight = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                self.postings.setdefault(term, []).append((i, weight))
+
+    def search(self, query, k=3):
+        """Return the top-k (score, chunk) pairs for a query"""
+        scores = {}
+        for term in set(tokenize(query)):
+            for i, weight in self.postings.get(term, ()):
+                scores[i] = scores.get(i, 0.0) + weight
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score, self.chunks[i]) for i, score in ranked]
+
+def get_index():
+    """Build the index on first use and reuse it for the container's lifetime"""
+    global _index
+    if _index is None:
+        _index = LocalKnowledgeIndex(load_chunks())
+    return _index
+
+def retrieve(query, k=3):
+    """Top-k chunk texts for a query, same shape as the Bedrock KB results"""
+    return [chunk['text'] for _, chunk in get_index().search(query, k)]
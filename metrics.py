@@ -0,0 +1,130 @@
+"""Per-request stage timings, sizes and token counts.
+
+A trace is opened per request with trace_request(); stages inside it are
+timed with the stage() context manager or the @timed decorator, and sizes
+or counts are added with record(). When the request ends, one JSON log
+line in the CloudWatch embedded metric format (EMF) is printed, which
+CloudWatch turns into metrics under METRICS_NAMESPACE, dimensioned by
+route.
+
+The current trace lives in a context variable. Work submitted to a thread
+pool must run in a copy of the caller's context (see submit()) to be
+attributed to the request. METRICS=false turns every call into a no-op.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('METRICS', 'true') == 'true'
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'MoodFlow')
+
+_current = contextvars.ContextVar('moodflow_trace', default=None)
+
+# Where finished traces go; benchmarks collect them instead of printing
+_sink = lambda document: print(json.dumps(document))
+
+class Trace:
+    """Stage durations (ms, summed over repeats), counts and sizes for one request"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.metrics = {}
+        self.units = {}
+        self.properties = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, value, unit):
+        with self.lock:
+            self.metrics[name] = self.metrics.get(name, 0) + value
+            self.units[name] = unit
+
+    def to_emf(self):
+        """CloudWatch embedded metric format document for this request"""
+        self.add('request_ms', (time.perf_counter() - self.started) * 1000, 'Milliseconds')
+        with self.lock:
+            values = {name: round(value, 2) for name, value in self.metrics.items()}
+            units = dict(self.units)
+            properties = dict(self.properties)
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Route']],
+                    'Metrics': [{'Name': name, 'Unit': units[name]} for name in values]
+                }]
+            },
+            'Route': self.route,
+            **properties,
+            **values
+        }
+
+@contextmanager
+def trace_request(route='plan'):
+    """Collect metrics for one request and print them as an EMF line at the end"""
+    if not ENABLED:
+        yield None
+        return
+    trace = Trace(route)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _sink(trace.to_emf())
+
+def set_sink(sink):
+    """Send each finished request's EMF document to `sink` instead of stdout"""
+    global _sink
+    _sink = sink
+
+def set_route(route):
+    """Name the route of the current request (the metric dimension)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.route = route
+
+def set_property(name, value):
+    """Attach a searchable, non-metric value to the current request's log line"""
+    trace = _current.get()
+    if trace is not None:
+        with trace.lock:
+            trace.properties[name] = value
+
+def record(name, value, unit='Count'):
+    """Add a size or count to the current request (summed if recorded twice)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, value, unit)
+
+@contextmanager
+def stage(name):
+    """Time a block as `<name>_ms` on the current request"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(f'{name}_ms', (time.perf_counter() - start) * 1000, 'Milliseconds')
+
+def timed(name):
+    """Decorator form of stage()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def submit(pool, func, *args):
+    """pool.submit that keeps the caller's trace for the worker thread"""
+    return pool.submit(contextvars.copy_context().run, func, *args)
@@ -0,0 +1,225 @@
+"""Bedrock model calls under a client-side rate limit, adaptive retry and a deadline.
+
+botocore's own retries are off for bedrock-runtime (aws_clients); every call
+goes through invoke() instead, which:
+
+- takes a token from a per-container token bucket per target (MODEL_RATE
+  calls a second, bursts of MODEL_BURST), sized so all warm containers
+  together stay within the account's model throughput
+- halves that target's rate on a throttling error and wins it back
+  gradually on successes (additive increase, multiplicative decrease)
+- retries retryable errors up to MODEL_MAX_ATTEMPTS times with full-jitter
+  exponential backoff
+- then moves to the fallback target, if one is configured
+  (MODEL_FALLBACK_ID and/or MODEL_FALLBACK_REGION)
+- never waits, sleeps or starts a call past the request's deadline
+  (MODEL_DEADLINE_SECONDS after start_deadline(), less MODEL_MIN_CALL_SECONDS,
+  the time a call needs), and stops waiting for a call that is still running
+  at the deadline itself, raising ModelUnavailable early enough for the
+  handler to return a degraded answer inside the client's 30 s timeout
+
+A call under a deadline runs on a worker thread so it can be abandoned:
+botocore's read timeout only bounds each socket read, not the whole call.
+The abandoned call finishes (or times out) in the background. Streamed
+responses are read through iter_events(), which applies the same deadline
+to every event.
+"""
+import contextvars
+import io
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import aws_clients
+import metrics
+
+FALLBACK_MODEL_ID = os.environ.get('MODEL_FALLBACK_ID', '')
+FALLBACK_REGION = os.environ.get('MODEL_FALLBACK_REGION', '')
+FALLBACK_GUARDRAIL_ID = os.environ.get('MODEL_FALLBACK_GUARDRAIL_ID', '')
+RATE = float(os.environ.get('MODEL_RATE', '2'))
+BURST = int(os.environ.get('MODEL_BURST', '4'))
+MAX_ATTEMPTS = int(os.environ.get('MODEL_MAX_ATTEMPTS', '3'))
+DEADLINE_SECONDS = float(os.environ.get('MODEL_DEADLINE_SECONDS', '25'))
+# Do not start a call with less time left than a plan takes (about the p99 of model_invoke_ms)
+MIN_CALL_SECONDS = float(os.environ.get('MODEL_MIN_CALL_SECONDS', '10'))
+
+BACKOFF_BASE_SECONDS = 0.25
+BACKOFF_CAP_SECONDS = 4.0
+# Adaptive rate bounds and recovery step, as fractions of RATE
+MIN_RATE_FRACTION = 0.1
+RECOVERY_FRACTION = 0.05
+RETRY_AFTER_SECONDS = 30
+# Threads that run calls under a deadline, including abandoned ones still finishing
+CALL_WORKERS = 32
+
+THROTTLE_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+RETRYABLE_CODES = THROTTLE_CODES + ('ServiceUnavailableException', 'ModelNotReadyException',
+                                    'InternalServerException', 'ModelTimeoutException')
+# botocore exceptions, matched by name so botocore is not imported here
+TIMEOUT_ERRORS = ('ReadTimeoutError', 'ConnectTimeoutError')
+
+_deadline = contextvars.ContextVar('moodflow_model_deadline', default=None)
+_call_pool = ThreadPoolExecutor(max_workers=CALL_WORKERS, thread_name_prefix='model-call')
+_END = object()
+
+class ModelUnavailable(Exception):
+    """The model could not answer in time (throttled or out of time); answered with a degraded response"""
+
+    def __init__(self, message, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Thread-safe token bucket whose refill rate adapts to throttling"""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline):
+        """Take a token, waiting at most until `deadline`; returns the seconds waited"""
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise ModelUnavailable('Model rate limit: no capacity before the deadline')
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def _bucket(target):
+    with _buckets_lock:
+        if target not in _buckets:
+            _buckets[target] = TokenBucket(RATE, BURST)
+        return _buckets[target]
+
+def start_deadline(seconds=None):
+    """Start the current request's model deadline"""
+    _deadline.set(time.monotonic() + (DEADLINE_SECONDS if seconds is None else seconds))
+
+def targets(model_id):
+    """(model id, region) pairs to try in order"""
+    primary = (model_id, aws_clients.REGION)
+    if not FALLBACK_MODEL_ID and not FALLBACK_REGION:
+        return [primary]
+    return [primary, (FALLBACK_MODEL_ID or model_id, FALLBACK_REGION or aws_clients.REGION)]
+
+def _error_code(e):
+    return getattr(e, 'response', {}).get('Error', {}).get('Code')
+
+def _until(future, deadline, what):
+    """The future's result, or ModelUnavailable once the deadline passes"""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        metrics.record('model_timeouts', 1)
+        metrics.record('model_deadline_exceeded', 1)
+        raise ModelUnavailable(f'{what} did not finish before the deadline')
+
+def _read_whole(client, operation, kwargs):
+    response = getattr(client, operation)(**kwargs)
+    if operation == 'invoke_model':
+        # Read the body on the worker too, so the deadline covers the whole reply
+        response['body'] = io.BytesIO(response['body'].read())
+    return response
+
+def _call(client, operation, deadline, **kwargs):
+    """One call; under a deadline it runs on a worker and is abandoned when the deadline passes"""
+    if deadline is None:
+        return getattr(client, operation)(**kwargs)
+    future = _call_pool.submit(contextvars.copy_context().run, _read_whole, client, operation, kwargs)
+    return _until(future, deadline, 'The model call')
+
+def iter_events(events):
+    """Iterate a response stream, giving up when the next event has not arrived by the deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        yield from events
+        return
+    iterator = iter(events)
+    while True:
+        event = _until(_call_pool.submit(next, iterator, _END), deadline, 'The model stream')
+        if event is _END:
+            return
+        yield event
+
+def _backoff(attempt):
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def invoke(operation, model_id, **kwargs):
+    """Call a bedrock-runtime operation (invoke_model or invoke_model_with_response_stream).
+
+    Returns the operation's response. Raises ModelUnavailable when every
+    target stayed throttled or the deadline leaves no time for another
+    call, and any non-retryable error as is.
+    """
+    deadline = _deadline.get()
+    last_error = None
+    for index, (target_model, region) in enumerate(targets(model_id)):
+        if index:
+            metrics.record('model_fallbacks', 1)
+            metrics.set_property('model_fallback', {'model_id': target_model, 'region': region})
+            if FALLBACK_GUARDRAIL_ID and 'guardrailIdentifier' in kwargs:
+                kwargs['guardrailIdentifier'] = FALLBACK_GUARDRAIL_ID
+        bucket = _bucket((target_model, region))
+        for attempt in range(MAX_ATTEMPTS):
+            call_deadline = None if deadline is None else deadline - MIN_CALL_SECONDS
+            if call_deadline is not None and time.monotonic() > call_deadline:
+                metrics.record('model_deadline_exceeded', 1)
+                raise ModelUnavailable('Not enough time left for a model call')
+            waited = bucket.acquire(call_deadline)
+            metrics.record('model_limiter_wait_ms', waited * 1000, 'Milliseconds')
+            if attempt:
+                metrics.record('model_retries', 1)
+            try:
+                response = _call(aws_clients.client('bedrock-runtime', region), operation, deadline,
+                                 modelId=target_model, **kwargs)
+            except Exception as e:
+                if type(e).__name__ in TIMEOUT_ERRORS:
+                    # A timed-out call used up the time a retry would need
+                    metrics.record('model_timeouts', 1)
+                    last_error = e
+                    break
+                code = _error_code(e)
+                if code not in RETRYABLE_CODES:
+                    raise
+                last_error = e
+                if code in THROTTLE_CODES:
+                    metrics.record('model_throttles', 1)
+                    bucket.throttled()
+                print(f"Model {code} from {target_model} in {region} (attempt {attempt + 1})")
+                pause = _backoff(attempt)
+                if call_deadline is not None and time.monotonic() + pause > call_deadline:
+                    break
+                time.sleep(pause)
+                continue
+            bucket.succeeded()
+            return response
+    metrics.record('model_unavailable', 1)
+    raise ModelUnavailable(f'Model unavailable: {last_error}')
@@ -0,0 +1,217 @@
+"""Per-mood scheduling rule table built from the bundled strategy documents.
+
+Run `python mood_rules.py` after editing any of the knowledge base documents
+to regenerate mood_rules.json, which the Lambda loads once per container.
+Only the compact rule block for a single mood is put into the prompt,
+instead of three free-text Knowledge Base chunks.
+"""
+import json
+import os
+import re
+
+DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_PATH = os.path.join(DOCS_DIR, 'mood_rules.json')
+
+MOODS = ('stressed', 'energized', 'anxious', 'focused', 'sad', 'tired', 'happy')
+
+# Wellness guideline sections that apply to each mood
+WELLNESS_SECTIONS = {
+    'STRESS INDICATORS AND INTERVENTIONS': ('stressed',),
+    'ANXIETY MANAGEMENT IN SCHEDULING': ('anxious',),
+    'TIREDNESS AND FATIGUE MANAGEMENT': ('tired',),
+    'SADNESS AND LOW MOOD SUPPORT': ('sad',),
+    'POSITIVE MOOD OPTIMIZATION': ('happy', 'energized'),
+}
+MAX_WELLNESS_NOTES = 4
+
+# Words that signal a mood in the user's message, checked in order of appearance
+MOOD_KEYWORDS = {
+    'stressed': ('stressed', 'stress', 'overwhelmed', 'swamped', 'under pressure'),
+    'energized': ('energized', 'energetic', 'pumped', 'motivated'),
+    'anxious': ('anxious', 'anxiety', 'nervous', 'worried'),
+    'focused': ('focused', 'in the zone', 'locked in'),
+    'sad': ('sad', 'feeling down', 'unmotivated', 'depressed', 'feeling blue'),
+    'tired': ('tired', 'exhausted', 'sleepy', 'drained', 'fatigued', 'burned out', 'burnt out'),
+    'happy': ('happy', 'feeling great', 'excited', 'cheerful'),
+}
+MOOD_PATTERN = re.compile(
+    r'\b(' + '|'.join(
+        re.escape(keyword) for keywords in MOOD_KEYWORDS.values() for keyword in keywords
+    ) + r')\b',
+    re.IGNORECASE
+)
+KEYWORD_TO_MOOD = {
+    keyword: mood for mood, keywords in MOOD_KEYWORDS.items() for keyword in keywords
+}
+
+BLOCK_PATTERN = re.compile(r'(\d+)(?:-(\d+))?[- ]minute')
+BREAK_PATTERN = re.compile(r'(\d+)(?:-\d+)?[- ]minute breaks? every (\d+)(?:-\d+)? minutes')
+
+_rules = None
+
+def _read(name):
+    with open(os.path.join(DOCS_DIR, name), encoding='utf-8') as f:
+        return f.read().replace('\r\n', '\n')
+
+def _paragraphs(text):
+    return [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+
+def _field_key(label):
+    return re.sub(r'[^a-z]+', '_', label.lower()).strip('_')
+
+def _first_sentence(text):
+    return re.split(r'(?<=\.)\s', text.strip(), maxsplit=1)[0]
+
+def classify_ordering(task_ordering):
+    """Reduce a free-text ordering rule to a key the scheduling engine understands"""
+    text = task_ordering.lower()
+    if 'mix' in text:
+        return 'mixed'
+    steps = [step.strip() for step in re.split(r'→|->', text)]
+    if len(steps) < 2:
+        return 'easiest_first' if 'low-effort' in text else 'as_given'
+    if steps[0].startswith('hard'):
+        return 'hardest_first'
+    if steps[0].startswith('easy') and steps[-1].startswith('easy') and len(steps) > 2:
+        return 'warmup'
+    if steps[0].startswith('easy'):
+        return 'easiest_first'
+    return 'as_given'
+
+def parse_strategies(text):
+    """Parse "<MOOD> STATE PLANNING:" sections into field dictionaries"""
+    strategies = {}
+    for paragraph in _paragraphs(text):
+        lines = paragraph.split('\n')
+        heading = re.match(r'([A-Z]+) STATE PLANNING:', lines[0])
+        if not heading:
+            continue
+
+        fields = {}
+        for line in lines[1:]:
+            label, _, value = line.partition(':')
+            if value:
+                fields[_field_key(label)] = value.strip()
+        strategies[heading.group(1).lower()] = fields
+    return strategies
+
+def parse_wellness(text):
+    """Map each mood to its recommended interventions and break activities"""
+    notes = {mood: [] for mood in MOODS}
+    break_tips = {}
+    section = None
+    for paragraph in _paragraphs(text):
+        lines = paragraph.split('\n')
+        if lines[0].isupper():
+            section = lines[0].rstrip(':')
+
+        if section == 'MOOD-SPECIFIC BREAK RECOMMENDATIONS':
+            for line in lines[1:]:
+                label, _, value = line.partition(':')
+                if value:
+                    break_tips[label.strip().lower()] = value.strip()
+        elif section in WELLNESS_SECTIONS and lines[0] == 'Recommended interventions:':
+            bullets = [line.lstrip('- ').strip() for line in lines[1:] if line.startswith('-')]
+            for mood in WELLNESS_SECTIONS[section]:
+                notes[mood] = bullets[:MAX_WELLNESS_NOTES]
+    return notes, break_tips
+
+def parse_task_patterns(text):
+    """Map each mood to short per-task-type notes ("When tired: ...")"""
+    patterns = {mood: {} for mood in MOODS}
+    topic = None
+    for paragraph in _paragraphs(text):
+        match = re.match(r'When (\w+):\s*(.*)', paragraph, re.DOTALL)
+        if match and topic:
+            mood = match.group(1).lower()
+            if mood in patterns:
+                patterns[mood][topic] = _first_sentence(match.group(2))
+        else:
+            # "Administrative Tasks (Email, ...):" -> "Administrative"
+            heading = paragraph.split('\n', 1)[0].rstrip(':')
+            topic = re.sub(r'\s*\(.*\)|\s+Tasks$', '', heading)
+    return patterns
+
+def build_rules():
+    """Parse the three knowledge base documents into the per-mood rule table"""
+    strategies = parse_strategies(_read('mood-planning-strategies.txt'))
+    wellness, break_tips = parse_wellness(_read('wellness-guidelines.txt'))
+    task_patterns = parse_task_patterns(_read('task-completion-patterns.txt'))
+
+    rules = {}
+    for mood in MOODS:
+        fields = strategies.get(mood, {})
+        block = BLOCK_PATTERN.search(fields.get('time_block_duration', ''))
+        breaks = BREAK_PATTERN.search(fields.get('break_frequency', ''))
+        rules[mood] = {
+            'strategy': fields.get('primary_strategy', ''),
+            'ordering': classify_ordering(fields.get('task_ordering', '')),
+            'ordering_text': fields.get('task_ordering', ''),
+            'block_text': fields.get('time_block_duration', ''),
+            'block_min_minutes': int(block.group(1)) if block else None,
+            'block_max_minutes': int(block.group(2) or block.group(1)) if block else None,
+            'break_text': fields.get('break_frequency', ''),
+            'break_minutes': int(breaks.group(1)) if breaks else None,
+            'break_every_minutes': int(breaks.group(2)) if breaks else None,
+            'avoid': fields.get('avoid', ''),
+            'best_for': fields.get('best_for', '') or fields.get('optimize_for', ''),
+            'include': fields.get('include', '') or fields.get('critical', ''),
+            'break_activities': break_tips.get(mood, fields.get('break_activities', '')),
+            'wellness_notes': wellness[mood],
+            'task_notes': task_patterns[mood],
+        }
+    return rules
+
+def load_rules():
+    """Load the rule table once per container (built on the fly if the JSON is missing)"""
+    global _rules
+    if _rules is None:
+        try:
+            with open(RULES_PATH, encoding='utf-8') as f:
+                _rules = json.load(f)
+        except FileNotFoundError:
+            _rules = build_rules()
+    return _rules
+
+def detect_mood(text):
+    """Mood explicitly named in a message, or None"""
+    match = MOOD_PATTERN.search(text)
+    return KEYWORD_TO_MOOD[match.group(1).lower()] if match else None
+
+def format_rules(mood):
+    """Compact prompt block with the rules for one mood, or '' for an unknown mood"""
+    rules = load_rules().get(mood)
+    if not rules:
+        return ''
+
+    lines = [
+        f"MOOD RULES ({mood}):",
+        f"- Strategy: {rules['strategy']}",
+        f"- Task ordering: {rules['ordering_text']}",
+        f"- Time blocks: {rules['block_text']}",
+        f"- Breaks: {rules['break_text']} ({rules['break_activities']})",
+    ]
+    if rules['avoid']:
+        lines.append(f"- Avoid: {rules['avoid']}")
+    if rules['best_for']:
+        lines.append(f"- Best for: {rules['best_for']}")
+    if rules['include']:
+        lines.append(f"- Include: {rules['include']}")
+    if rules['wellness_notes']:
+        lines.append(f"- Wellness: {'; '.join(rules['wellness_notes'])}")
+    for task_type, note in rules['task_notes'].items():
+        lines.append(f"- {task_type}: {note}")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    table = build_rules()
+    with open(RULES_PATH, 'w', encoding='utf-8') as f:
+        json.dump(table, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    _rules = table
+
+    print(f"Wrote {RULES_PATH}")
+    print(f"{'mood':<10} {'rule chars':>10} {'~tokens':>8}")
+    for mood in MOODS:
+        block = format_rules(mood)
+        print(f"{mood:<10} {len(block):>10} {len(block) // 4:>8}")
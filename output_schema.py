@@ -0,0 +1,110 @@
+"""Validation of the planning model's JSON output.
+
+The fields and types follow the OUTPUT JSON spec in prompts.py. validate()
+normalizes a parsed reply in place (dropping malformed list entries) and
+returns the fields that are missing or unusable, so the caller can ask the
+model for just those. Only the field that carries the plan itself is
+required to save; the others fall back to defaults (see fill_defaults).
+"""
+from datetime import date
+
+import mood_rules
+import schedule_patch
+
+CONVERSATION_STATES = ('awaiting_confirmation', 'editing', 'scheduling_new', 'asking_for_date')
+DEFAULT_RESPONSE_MESSAGE = "Here's your updated schedule."
+# Fields that can carry the plan; without the one a reply needs, nothing is saved
+PLAN_FIELDS = ('patch', 'tasks', 'schedule')
+
+def plan_field(data, engine):
+    """The field holding the plan: "patch" operations for an edit, extracted
+    "tasks" for a new local-engine plan, else "schedule\""""
+    if 'patch' in data:
+        return 'patch'
+    if engine != 'local':
+        return 'schedule'
+    state = data.get('conversation_state')
+    if state == 'scheduling_new' or data.get('tasks'):
+        return 'tasks'
+    return 'schedule' if state in CONVERSATION_STATES else 'tasks'
+
+def _entries(value, *fields):
+    """The dict entries of a list that have every field as text, or None if not a list"""
+    if not isinstance(value, list):
+        return None
+    return [
+        entry for entry in value
+        if isinstance(entry, dict) and all(isinstance(entry.get(field), str) and entry[field] for field in fields)
+    ]
+
+def _reschedule(value):
+    """A reschedule_for_date object with a valid date and tasks, or None"""
+    if not isinstance(value, dict):
+        return None
+    try:
+        date.fromisoformat(value.get('date'))
+    except (TypeError, ValueError):
+        return None
+    tasks = _entries(value.get('tasks'), 'task')
+    return {'date': value['date'], 'tasks': tasks} if tasks else None
+
+def validate(data, engine, incomplete=None):
+    """Normalize a parsed reply in place; returns the missing or invalid fields in schema order.
+
+    `incomplete` names a field whose value was cut off (see
+    json_stream.extract_object); it is dropped and reported missing.
+    """
+    # Decided before dropping a cut-off field, so the re-ask asks for that field
+    required_plan = plan_field(data, engine)
+    if incomplete is not None:
+        data.pop(incomplete, None)
+
+    mood = data.get('mood_detected')
+    if isinstance(mood, str) and mood.strip().lower() in mood_rules.MOODS:
+        data['mood_detected'] = mood.strip().lower()
+    else:
+        data.pop('mood_detected', None)
+    if data.get('conversation_state') not in CONVERSATION_STATES:
+        data.pop('conversation_state', None)
+    if not isinstance(data.get('response_message'), str):
+        data.pop('response_message', None)
+
+    for field, required in (('schedule', ('time', 'task')), ('tasks', ('task',)), ('unscheduled_tasks', ('task',))):
+        entries = _entries(data.get(field), *required)
+        # A list whose every entry was malformed carries no plan: ask for it again
+        if entries is None or (field in PLAN_FIELDS and data[field] and not entries):
+            data.pop(field, None)
+        else:
+            data[field] = entries
+    # A new plan with no tasks extracted has nothing to schedule
+    if data.get('conversation_state') == 'scheduling_new' and data.get('tasks') == []:
+        data.pop('tasks')
+
+    if 'patch' in data:
+        ops = data['patch']
+        if isinstance(ops, list) and all(isinstance(op, dict) and op.get('op') in schedule_patch.OPS for op in ops):
+            required_plan = 'patch'
+        else:
+            data.pop('patch')
+
+    reschedule = _reschedule(data.get('reschedule_for_date'))
+    if reschedule is None:
+        data.pop('reschedule_for_date', None)
+    else:
+        data['reschedule_for_date'] = reschedule
+
+    required = ('mood_detected', 'conversation_state', 'response_message', required_plan)
+    return [field for field in required if field not in data]
+
+def plan_missing(missing):
+    """Whether the reply lacks its plan, so it must not be saved"""
+    return any(field in PLAN_FIELDS for field in missing)
+
+def fill_defaults(data, previous_mood='unknown'):
+    """Fill the fields a reply can be saved without"""
+    data.setdefault('mood_detected', previous_mood)
+    data.setdefault('conversation_state', 'editing')
+    data.setdefault('response_message', DEFAULT_RESPONSE_MESSAGE)
+    data.setdefault('schedule', [])
+    data.setdefault('unscheduled_tasks', [])
+    return data
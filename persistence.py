@@ -0,0 +1,106 @@
+"""Schedule writes: one atomic unit per request, optionally written behind the response.
+
+A request's writes (the planning date, plus a date tasks were moved to)
+are built as UpdateItem arguments by lambda_function and executed here
+together: a single date is one UpdateItem, several dates are one
+TransactWriteItems, so either every date changes or none does. Failures
+are raised, never printed and ignored; a version condition that fails
+raises VersionConflict.
+
+PERSIST_MODE=queue sends the writes to the SQS queue PERSIST_QUEUE_URL
+instead and returns at once, taking DynamoDB latency off the response.
+persist_handler is the queue's Lambda consumer: it performs each message's
+writes and reports the messages that failed in batchItemFailures, so SQS
+retries them (and moves them to the queue's dead-letter queue after its
+maxReceiveCount). Use a FIFO queue so one user's writes apply in order.
+
+A queued write's response reports the version it will produce before the
+write exists. A follow-up request that sends that version waits up to
+CATCH_UP_SECONDS for it to land (lambda_function.caught_up_schedule), so
+edits read their own writes; a queued write that failed never lands, and
+the follow-up gets the 409 that tells the client to reload.
+"""
+import hashlib
+import json
+import os
+
+import aws_clients
+import metrics
+from schedule_patch import VersionConflict
+
+MODE = os.environ.get('PERSIST_MODE', 'sync')
+QUEUE_URL = os.environ.get('PERSIST_QUEUE_URL', '')
+# How long a request waits for the queued write its client already saw
+CATCH_UP_SECONDS = float(os.environ.get('PERSIST_CATCH_UP_SECONDS', '3'))
+CATCH_UP_POLL_SECONDS = 0.1
+
+def _error_code(e):
+    return getattr(e, 'response', {}).get('Error', {}).get('Code')
+
+def _conflict(updates):
+    return VersionConflict(*(aws_clients.from_attribute(update['Key']['schedule_date']) for update in updates))
+
+def write(updates):
+    """Perform UpdateItem argument dicts as one unit; returns the new version of each item.
+
+    Versions are read back for a single update; inside a transaction they are
+    the expected version plus one, or None for an unconditional write.
+    """
+    dynamodb = aws_clients.client('dynamodb')
+    if len(updates) == 1:
+        try:
+            response = dynamodb.update_item(**updates[0], ReturnValues='UPDATED_NEW')
+        except Exception as e:
+            if _error_code(e) == 'ConditionalCheckFailedException':
+                raise _conflict(updates)
+            raise
+        return [aws_clients.deserialize_item(response.get('Attributes', {})).get('version')]
+
+    try:
+        dynamodb.transact_write_items(TransactItems=[{'Update': update} for update in updates])
+    except Exception as e:
+        reasons = getattr(e, 'response', {}).get('CancellationReasons', [])
+        if _error_code(e) == 'TransactionCanceledException' and any(
+            reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons
+        ):
+            raise _conflict(updates)
+        raise
+    return [expected_next(update) for update in updates]
+
+def expected_next(update):
+    """The version an update will leave the item at, if it is conditioned on one"""
+    expected = update.get('ExpressionAttributeValues', {}).get(':expected')
+    if expected is not None:
+        return aws_clients.from_attribute(expected) + 1
+    return 1 if update.get('ConditionExpression') == 'attribute_not_exists(#v)' else None
+
+def enqueue(updates):
+    """Send the writes to the persistence queue; returns the versions they will produce"""
+    body = json.dumps({'updates': updates}, sort_keys=True)
+    message = {'QueueUrl': QUEUE_URL, 'MessageBody': body}
+    if QUEUE_URL.endswith('.fifo'):
+        # One ordered stream per user; identical retries of a request are sent once
+        message['MessageGroupId'] = aws_clients.from_attribute(updates[0]['Key']['user_id'])
+        message['MessageDeduplicationId'] = hashlib.sha256(body.encode()).hexdigest()
+    aws_clients.client('sqs').send_message(**message)
+    metrics.record('persist_queued', len(updates))
+    return [expected_next(update) for update in updates]
+
+def submit(updates):
+    """Write now, or hand the writes to the queue in PERSIST_MODE=queue"""
+    if MODE == 'queue':
+        return enqueue(updates)
+    return write(updates)
+
+def persist_handler(event, context):
+    """SQS consumer for PERSIST_MODE=queue; failed messages are returned for retry"""
+    failures = []
+    for record in event.get('Records', []):
+        try:
+            write(json.loads(record['body'])['updates'])
+        except Exception as e:
+            # Conflicting writes also fail until they reach the dead-letter queue,
+            # so an edit that lost a race is kept for inspection, not dropped
+            print(f"Persist error for {record['messageId']}: {e}")
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
@@ -0,0 +1,122 @@
+"""Per-user rate and concurrency caps in front of the planning model.
+
+Both are DynamoDB conditional counters in RATE_LIMIT_TABLE (partition key
+limit_key, TTL attribute expires_at), so they hold across containers:
+
+- rate: one item per user per minute ("rate#<user>#<minute>"), incremented
+  only while it is below PLANS_PER_MINUTE
+- concurrency: one item per user ("inflight#<user>"), incremented only
+  while it is below MAX_CONCURRENT_PLANS and decremented when the model
+  work ends. Every acquisition renews a lease; a counter whose lease ran out
+  (a container that died mid-request) is reset instead of locking the user
+  out.
+
+A request over either cap raises RateLimited (a 429 with Retry-After).
+Only model calls are counted: routed edits, views and cached answers never
+reach the limiter. Errors other than a failed condition let the request
+through, so the limiter cannot become an outage of its own.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import aws_clients
+import metrics
+
+# 'on' or 'off'
+MODE = os.environ.get('RATE_LIMITS', 'on')
+TABLE = os.environ.get('RATE_LIMIT_TABLE', 'moodflow_rate_limits')
+PLANS_PER_MINUTE = int(os.environ.get('PLANS_PER_MINUTE', '10'))
+MAX_CONCURRENT_PLANS = int(os.environ.get('MAX_CONCURRENT_PLANS', '2'))
+
+WINDOW_SECONDS = 60
+# Longer than any request can run (API Gateway stops waiting after 29 s)
+LEASE_SECONDS = 60
+BUSY_RETRY_SECONDS = 5
+ATTRIBUTE_NAMES = {'#c': 'count', '#l': 'lease_until', '#e': 'expires_at'}
+
+class RateLimited(Exception):
+    """The user is over a cap; answered with a 429"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after))
+
+def _failed_condition(e):
+    return getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+def _update(key, expression, condition, values):
+    aws_clients.client('dynamodb').update_item(
+        TableName=TABLE,
+        Key={'limit_key': {'S': key}},
+        UpdateExpression=expression,
+        ConditionExpression=condition,
+        # DynamoDB rejects names the expressions do not use
+        ExpressionAttributeNames={token: name for token, name in ATTRIBUTE_NAMES.items()
+                                  if token in expression or token in condition},
+        ExpressionAttributeValues=aws_clients.serialize_item(values)
+    )
+
+def _count_plan(user_id, now):
+    """Count one plan in the current minute; raises RateLimited past the cap"""
+    window = int(now // WINDOW_SECONDS) * WINDOW_SECONDS
+    try:
+        _update(
+            f'rate#{user_id}#{window}',
+            'SET #e = :expires ADD #c :one',
+            'attribute_not_exists(#c) OR #c < :limit',
+            {':one': 1, ':limit': PLANS_PER_MINUTE, ':expires': window + 2 * WINDOW_SECONDS}
+        )
+    except Exception as e:
+        if not _failed_condition(e):
+            print(f"Rate limit error: {e}")
+            return
+        metrics.record('rate_limited', 1)
+        raise RateLimited(f'More than {PLANS_PER_MINUTE} plans a minute. Try again shortly.',
+                          window + WINDOW_SECONDS - now)
+
+def _acquire(user_id, now):
+    """Take one of the user's concurrent plan slots; False if the limiter is unavailable"""
+    key = f'inflight#{user_id}'
+    lease = {':lease': int(now) + LEASE_SECONDS, ':expires': int(now) + LEASE_SECONDS + 3600}
+    try:
+        try:
+            _update(key, 'SET #l = :lease, #e = :expires ADD #c :one',
+                    'attribute_not_exists(#c) OR #c < :max', {**lease, ':one': 1, ':max': MAX_CONCURRENT_PLANS})
+        except Exception as e:
+            if not _failed_condition(e):
+                raise
+            # Every holder's lease ran out: they died without releasing
+            _update(key, 'SET #c = :one, #l = :lease, #e = :expires', '#l < :now',
+                    {**lease, ':one': 1, ':now': int(now)})
+        return True
+    except Exception as e:
+        if not _failed_condition(e):
+            print(f"Concurrency limit error: {e}")
+            return False
+        metrics.record('concurrency_limited', 1)
+        raise RateLimited(f'You already have {MAX_CONCURRENT_PLANS} plans in progress. Try again when one finishes.',
+                          BUSY_RETRY_SECONDS)
+
+def _release(user_id):
+    try:
+        _update(f'inflight#{user_id}', 'ADD #c :minus', '#c > :zero', {':minus': -1, ':zero': 0})
+    except Exception as e:
+        if not _failed_condition(e):
+            print(f"Concurrency release error: {e}")
+
+@contextmanager
+def admit(user_id):
+    """Hold one of the user's plan slots for the body of the with block, or raise RateLimited"""
+    if MODE == 'off':
+        yield
+        return
+    with metrics.stage('rate_limit'):
+        now = time.time()
+        _count_plan(user_id, now)
+        acquired = _acquire(user_id, now)
+    try:
+        yield
+    finally:
+        if acquired:
+            _release(user_id)
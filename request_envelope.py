@@ -0,0 +1,159 @@
+"""Request envelope parsing and validation.
+
+The Streamlit client sends a versioned JSON envelope:
+
+    {"version": 1, "action": "plan", "message": "I'm stressed, ...",
+     "date": "2025-10-06", "start": "09:00", "end": "17:00", "session_id": "..."}
+
+Times are 24-hour "HH:MM". An optional "schedule_version" is the version of
+the stored schedule the client last saw; edits based on an older version
+are rejected with a 409 instead of overwriting newer changes. parse_request validates it once and returns the
+request dict the rest of the pipeline uses. Bodies without "version" take
+the legacy path: the date and window are read from the
+"[Planning for <weekday>, <Month> <DD>, <YYYY> | Start: ... | End by: ...]"
+text appended to the message, with one compiled pattern.
+
+The user comes from the API Gateway authorizer, never from the body:
+Cognito user-pool claims (REST API), JWT claims (HTTP API), a Lambda
+authorizer's principalId, or the IAM caller of a Function URL. Without an
+authorizer every request is DEFAULT_USER_ID, unless REQUIRE_AUTH is set.
+"""
+import os
+import re
+from datetime import date
+
+import scheduler
+
+ENVELOPE_VERSION = 1
+ACTIONS = ('plan', 'view', 'calendar', 'suggest_dates', 'batch_submit', 'batch_status')
+# Actions that plan or read a single date
+DATED_ACTIONS = ('plan', 'view')
+MAX_MESSAGE_CHARS = 4000
+MAX_USER_ID_CHARS = 128
+
+DEFAULT_USER_ID = os.environ.get('DEFAULT_USER_ID', 'default_user')
+REQUIRE_AUTH = os.environ.get('REQUIRE_AUTH', 'false') == 'true'
+
+CLOCK_24H_PATTERN = re.compile(r'([01]?\d|2[0-3]):([0-5]\d)')
+LEGACY_ENVELOPE_PATTERN = re.compile(
+    r'\[Planning for [^,\]]+, ([A-Za-z]+) (\d{1,2}), (\d{4})'
+    r'(?:\s*\|\s*Start:\s*([^|\]]+?))?(?:\s*\|\s*End by:\s*([^\]]+?))?\s*\]'
+)
+MONTH_NUMBERS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12
+}
+
+class RequestError(ValueError):
+    """The request body is malformed; answered with a 400"""
+
+class Unauthorized(Exception):
+    """No authenticated user while REQUIRE_AUTH is set; answered with a 401"""
+
+def user_id_from_context(request_context):
+    """The authenticated user of an API Gateway / Function URL request context"""
+    authorizer = (request_context or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or (authorizer.get('jwt') or {}).get('claims') or {}
+    user_id = (claims.get('sub') or authorizer.get('principalId')
+               or (authorizer.get('iam') or {}).get('userId'))
+    if isinstance(user_id, str) and 0 < len(user_id) <= MAX_USER_ID_CHARS:
+        return user_id
+    if REQUIRE_AUTH:
+        raise Unauthorized('Sign in to use MoodFlow')
+    return DEFAULT_USER_ID
+
+def _parse_clock_24h(value, field):
+    match = CLOCK_24H_PATTERN.fullmatch(str(value).strip())
+    if not match:
+        raise RequestError(f'{field} must be a 24-hour HH:MM time')
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+def _parse_date(value, field):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise RequestError(f'{field} must be a YYYY-MM-DD date')
+
+def _parse_version(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise RequestError('schedule_version must be a non-negative integer')
+    return value
+
+def _request(action, message, date_str, window, session_id, legacy, schedule_version=None):
+    start_minutes, end_minutes = window
+    return {
+        'action': action,
+        'user_message': message,
+        'date_str': date_str,
+        'start_time': scheduler.format_clock(start_minutes),
+        'end_time': scheduler.format_clock(end_minutes),
+        'window': window,
+        'session_id': session_id,
+        'schedule_version': schedule_version,
+        'legacy': legacy
+    }
+
+def parse_envelope(body, session_id):
+    """Validate a versioned envelope"""
+    if body.get('version') != ENVELOPE_VERSION:
+        raise RequestError(f"Unsupported request version: {body.get('version')!r}")
+
+    action = body.get('action', 'plan')
+    if action not in ACTIONS:
+        raise RequestError(f"action must be one of {', '.join(ACTIONS)}")
+
+    message = body.get('message', '')
+    if not isinstance(message, str) or len(message) > MAX_MESSAGE_CHARS:
+        raise RequestError(f'message must be text of at most {MAX_MESSAGE_CHARS} characters')
+    if action == 'plan' and not message.strip():
+        raise RequestError('message is required to plan')
+
+    if action not in DATED_ACTIONS:
+        return _request(action, message, None, (scheduler.DEFAULT_START_MINUTES, scheduler.DEFAULT_END_MINUTES),
+                        session_id, False)
+
+    date_str = _parse_date(body.get('date'), 'date')
+    start_minutes = _parse_clock_24h(body.get('start', '09:00'), 'start')
+    end_minutes = _parse_clock_24h(body.get('end', '17:00'), 'end')
+    if end_minutes <= start_minutes:
+        raise RequestError('end must be after start')
+    return _request(action, message, date_str, (start_minutes, end_minutes), session_id, False,
+                    _parse_version(body.get('schedule_version')))
+
+def parse_legacy(body, session_id):
+    """Read the date and window from the text envelope appended to the message"""
+    message = body.get('message', '')
+    action = body.get('action', 'plan')
+    date_str = None
+    start_text = end_text = None
+
+    match = LEGACY_ENVELOPE_PATTERN.search(message)
+    if match:
+        month_name, day, year, start_text, end_text = match.groups()
+        month = MONTH_NUMBERS.get(month_name.lower())
+        try:
+            date_str = date(int(year), month, int(day)).isoformat() if month else None
+        except ValueError:
+            date_str = None
+    if action == 'view' and body.get('date'):
+        date_str = _parse_date(body['date'], 'date')
+    if date_str is None:
+        date_str = date.today().isoformat()
+
+    window = scheduler.parse_window(start_text, end_text)
+    return _request(action, message, date_str, window, session_id, True)
+
+def parse_request(body, query_params=None, request_context=None):
+    """The validated request for an API body (versioned or legacy text envelope) and its user"""
+    user_id = user_id_from_context(request_context)
+    if not isinstance(body, dict):
+        raise RequestError('Request body must be a JSON object')
+    session_id = body.get('session_id') or (query_params or {}).get('session_id')
+    if 'version' in body:
+        request = parse_envelope(body, session_id)
+    else:
+        request = parse_legacy(body, session_id)
+    request['user_id'] = user_id
+    return request
@@ -0,0 +1,242 @@
+"""Cache of planning responses for repeated identical requests.
+
+Streamlit reruns, double clicks and retries after a client timeout send the
+same message again. The key hashes the normalized message, planning date,
+time window and the version stamp (last_updated) of the schedule the
+response was planned against, so any change to that schedule is a miss.
+
+Two tiers:
+- a bounded LRU per container
+- optionally a shared DynamoDB table with a TTL attribute, which also
+  carries a short "pending" lease so identical requests landing on other
+  containers wait for the first one instead of calling the model again
+
+Identical requests in flight in the same container (stream_server threads)
+are coalesced onto one computation. Responses are held as JSON text, so
+every hit returns a fresh dict.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import aws_clients
+
+# 'off', 'memory' (per-container LRU) or 'shared' (LRU + DynamoDB tier)
+MODE = os.environ.get('RESPONSE_CACHE', 'memory')
+MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_SIZE', '128'))
+TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL', '900'))
+TABLE = os.environ.get('RESPONSE_CACHE_TABLE', 'moodflow_response_cache')
+
+# How long a claimed computation may run before others take over, and how
+# long an identical request waits for it
+LEASE_SECONDS = 30
+WAIT_SECONDS = 25
+POLL_SECONDS = 0.25
+
+_memory = OrderedDict()
+_inflight = {}
+_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'shared_hits': 0, 'coalesced': 0, 'misses': 0, 'errors': 0}
+
+def make_key(user_message, date_str, start_time, end_time, version, *extra):
+    """Stable key for a request planned against a given schedule version"""
+    normalized = ' '.join(user_message.lower().split())
+    parts = [normalized, date_str, start_time.strip().upper(), end_time.strip().upper(), version or 'none', *extra]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+def stats():
+    """Hit/miss counters for this container"""
+    with _lock:
+        counts = dict(_stats)
+        counts['entries'] = len(_memory)
+    lookups = counts['memory_hits'] + counts['shared_hits'] + counts['coalesced'] + counts['misses']
+    counts['hit_rate'] = round((lookups - counts['misses']) / lookups, 3) if lookups else 0.0
+    return counts
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+def _remember(key, text):
+    with _lock:
+        _memory[key] = (time.time() + TTL_SECONDS, text)
+        _memory.move_to_end(key)
+        while len(_memory) > MAX_ENTRIES:
+            _memory.popitem(last=False)
+
+def _recall(key):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return entry[1]
+
+def _shared_get(key, consistent=False):
+    """The shared item for a key, or None (errors count as a miss)"""
+    try:
+        response = aws_clients.client('dynamodb').get_item(
+            TableName=TABLE,
+            Key={'cache_key': {'S': key}},
+            ConsistentRead=consistent
+        )
+    except Exception as e:
+        print(f"Response cache read error: {e}")
+        _count('errors')
+        return None
+    item = response.get('Item')
+    if item is None:
+        return None
+    item = aws_clients.deserialize_item(item)
+    # DynamoDB deletes expired items lazily
+    return item if item['expires_at'] >= time.time() else None
+
+def _claim(key):
+    """Take the shared lease for computing a key; False if someone else holds it"""
+    now = int(time.time())
+    try:
+        aws_clients.client('dynamodb').put_item(
+            TableName=TABLE,
+            Item=aws_clients.serialize_item({
+                'cache_key': key,
+                'status': 'pending',
+                'expires_at': now + LEASE_SECONDS
+            }),
+            ConditionExpression='attribute_not_exists(cache_key) OR expires_at < :now',
+            ExpressionAttributeValues={':now': {'N': str(now)}}
+        )
+        return True
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        print(f"Response cache claim error: {e}")
+        _count('errors')
+        return True
+
+def _drop_claim(key):
+    """Give up an unfinished lease so waiters stop waiting"""
+    try:
+        aws_clients.client('dynamodb').delete_item(
+            TableName=TABLE,
+            Key={'cache_key': {'S': key}},
+            ConditionExpression='#status = :pending',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':pending': {'S': 'pending'}}
+        )
+    except Exception as e:
+        print(f"Response cache release error: {e}")
+
+def _wait_shared(key):
+    """Poll for another container's result until its lease ends; None if it never arrives"""
+    deadline = time.time() + WAIT_SECONDS
+    while time.time() < deadline:
+        item = _shared_get(key, consistent=True)
+        if item is None:
+            return None
+        if item['status'] == 'done':
+            return item['response']
+        time.sleep(POLL_SECONDS)
+    return None
+
+def _lookup(key):
+    """Cached response for a key from either tier, counting hits"""
+    text = _recall(key)
+    if text is not None:
+        _count('memory_hits')
+        return json.loads(text)
+    if MODE == 'shared':
+        item = _shared_get(key)
+        if item is not None and item['status'] == 'done':
+            _remember(key, item['response'])
+            _count('shared_hits')
+            return json.loads(item['response'])
+    return None
+
+def lookup(key):
+    """Cached response for a key, or None (counted as a miss)"""
+    if MODE == 'off':
+        return None
+    response = _lookup(key)
+    if response is None:
+        _count('misses')
+    return response
+
+def store(keys, response):
+    """Cache a response under every key that should find it"""
+    if MODE == 'off':
+        return
+    text = json.dumps(response)
+    for key in keys:
+        _remember(key, text)
+        if MODE != 'shared':
+            continue
+        try:
+            aws_clients.client('dynamodb').put_item(
+                TableName=TABLE,
+                Item=aws_clients.serialize_item({
+                    'cache_key': key,
+                    'status': 'done',
+                    'response': text,
+                    'expires_at': int(time.time()) + TTL_SECONDS
+                })
+            )
+        except Exception as e:
+            print(f"Response cache write error: {e}")
+            _count('errors')
+
+def get_or_compute(key, compute):
+    """Return (response, status) for a key, computing it at most once.
+
+    `compute` returns (response, extra_keys): the response is also filed
+    under extra_keys, and is not cached at all when extra_keys is None.
+    Status is 'hit', 'coalesced' (waited for an identical request) or 'miss'.
+    """
+    if MODE == 'off':
+        return compute()[0], 'miss'
+
+    response = _lookup(key)
+    if response is not None:
+        return response, 'hit'
+
+    with _lock:
+        event = _inflight.get(key)
+        if event is None:
+            _inflight[key] = threading.Event()
+    if event is not None:
+        # Same request already running in this container
+        event.wait(WAIT_SECONDS)
+        text = _recall(key)
+        if text is not None:
+            _count('coalesced')
+            return json.loads(text), 'coalesced'
+        _count('misses')
+        return compute()[0], 'miss'
+
+    claimed = stored = False
+    try:
+        if MODE == 'shared':
+            claimed = _claim(key)
+            if not claimed:
+                # Same request running in another container
+                text = _wait_shared(key)
+                if text is not None:
+                    _remember(key, text)
+                    _count('coalesced')
+                    return json.loads(text), 'coalesced'
+        _count('misses')
+        response, extra_keys = compute()
+        if extra_keys is not None:
+            store([key, *extra_keys], response)
+            stored = True
+        return response, 'miss'
+    finally:
+        if claimed and not stored:
+            _drop_claim(key)
+        with _lock:
+            _inflight.pop(key).set()
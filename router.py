@@ -0,0 +1,109 @@
+"""Local intent classifier that runs before the planning model.
+
+Most turns are confirmations and small edits ("yes", "drop the demo",
+"move them to Oct 8") that do not need the large model and its full
+prompt. classify() sorts a message into one of INTENTS with compiled
+patterns and detects its mood with the mood rule keywords, in well under a
+millisecond. Only short messages that are a single simple instruction get a
+simple intent; anything else (new tasks, several changes, questions) is
+"plan" and goes to the model. ROUTER=off sends everything to the model.
+"""
+import os
+import re
+
+import mood_rules
+import schedule_patch
+
+MODE = os.environ.get('ROUTER', 'local')
+
+INTENTS = ('view', 'confirm', 'drop', 'reschedule', 'plan')
+MAX_DIRECT_CHARS = 120
+
+CONFIRM_PATTERN = re.compile(
+    r"(?:yes|yeah|yep|yup|sure|ok|okay|ok thanks|confirm|confirmed|looks good|sounds good|perfect|great|"
+    r"that works|keep it|keep it as is|edit|edit it|continue|go ahead|thanks|thank you)"
+    r"(?:,?\s+(?:please|thanks|thank you))?"
+)
+DROP_PATTERN = re.compile(
+    r"(?:please\s+)?(?:drop|remove|cancel|delete|skip)\s+(?:the\s+|my\s+)?(?P<task>.+?)"
+    r"(?:\s+(?:from|off)\s+(?:my|the|today'?s)\s+(?:schedule|plan|list|day))?"
+)
+RESCHEDULE_PATTERN = re.compile(
+    r"(?:please\s+)?(?:move|schedule|put|reschedule|push|do)\s+(?P<task>.+?)\s+(?:to|for|on)\s+"
+    r"(?P<date>(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2})(?:st|nd|rd|th)?"
+)
+# Several instructions or task details in one message need the model
+COMPOUND_PATTERN = re.compile(r",|;|\band\b|\bthen\b|\badd\b|\d+\s*(?:h|hr|hrs|hours?|m|mins?|minutes?)\b")
+# "them", "the rest", "the unscheduled tasks", ... refer to the overflow list
+OVERFLOW_REFERENCE_PATTERN = re.compile(
+    r"(?:them|those|these|it|the rest|(?:the\s+)?(?:remaining|unscheduled|leftover|overflow)(?:\s+tasks?)?)"
+)
+# Label scheduler.build_schedule adds to each block of a split task
+PART_SUFFIX_PATTERN = re.compile(r'\s*\(part \d+/\d+\)$')
+
+def _normalize(message):
+    return ' '.join(message.lower().split()).strip(' .!?')
+
+def classify(message):
+    """{"intent", "mood", "task", "date_text"} for a message; "task" and
+    "date_text" are the instruction's target for drop and reschedule"""
+    decision = {'intent': 'plan', 'mood': mood_rules.detect_mood(message), 'task': None, 'date_text': None}
+    if MODE == 'off':
+        return decision
+
+    text = _normalize(message)
+    if not text or len(text) > MAX_DIRECT_CHARS:
+        return decision
+    if CONFIRM_PATTERN.fullmatch(text):
+        decision['intent'] = 'confirm'
+        return decision
+
+    match = RESCHEDULE_PATTERN.fullmatch(text)
+    if match and not COMPOUND_PATTERN.search(match.group('task')):
+        decision.update(intent='reschedule', task=match.group('task'), date_text=match.group('date'))
+        return decision
+
+    # "drop it" needs the conversation to know what "it" is
+    match = DROP_PATTERN.fullmatch(text)
+    if match and not COMPOUND_PATTERN.search(match.group('task')) and not refers_to_overflow(match.group('task')):
+        decision.update(intent='drop', task=match.group('task'))
+    return decision
+
+def refers_to_overflow(target):
+    """Whether a reschedule target means all unscheduled tasks rather than a named task"""
+    return OVERFLOW_REFERENCE_PATTERN.fullmatch(target) is not None
+
+def task_name(entry):
+    """An entry's task name without the part label of a split task"""
+    return PART_SUFFIX_PATTERN.sub('', str(entry.get('task', '')))
+
+def matching_tasks(entries, target):
+    """Distinct task names a drop or move target means, matched like patch
+    operations (exact name first, else whole words); the blocks of a split
+    task are one task. More than one name is ambiguous and left to the model."""
+    target = re.sub(r'^(?:the|my)\s+', '', target.lower())
+    names = [task_name(entry) for entry in entries]
+    return list(dict.fromkeys(names[i].lower() for i in schedule_patch.match_names(names, target) if names[i]))
+
+def split_entries(entries, name):
+    """(matching, remaining) entries of the task `name` (as matching_tasks returns it)"""
+    matching, remaining = [], []
+    for entry in entries:
+        (matching if task_name(entry).lower() == name else remaining).append(entry)
+    return matching, remaining
+
+def describe_tasks(entries):
+    """Distinct task names in order, e.g. "Demo and Code review\""""
+    names = list(dict.fromkeys(PART_SUFFIX_PATTERN.sub('', entry['task']) for entry in entries))
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+def tidy_breaks(schedule):
+    """Drop breaks left at either end or next to another break after removing tasks"""
+    tidy = []
+    for i, entry in enumerate(schedule):
+        if entry.get('task') == 'Break':
+            following = schedule[i + 1] if i + 1 < len(schedule) else None
+            if not tidy or tidy[-1].get('task') == 'Break' or following is None or following.get('task') == 'Break':
+                continue
+        tidy.append(entry)
+    return tidy
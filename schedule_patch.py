@@ -0,0 +1,190 @@
+"""Patch operations on a stored schedule and the conditional UpdateItem that persists them.
+
+When editing, the model (or the router) returns a few operations instead of
+the whole day:
+
+    {"op": "add", "task": "Gym", "time": "5:00-6:00 PM", "reasoning": "...", "wellness_note": "..."}
+    {"op": "remove", "task": "Demo"}
+    {"op": "move", "task": "Demo", "start": "2:00 PM"}            (or "time": "2:00-3:00 PM")
+    {"op": "resize", "task": "Code review", "duration_minutes": 60}
+    {"op": "update_note", "task": "Demo", "wellness_note": "...", "reasoning": "..."}
+
+A task is matched by name (case-insensitive; a name that is part of several
+split blocks matches all of them, which only "remove" accepts) or by its
+0-based "index". apply() returns the new schedule, kept in time order.
+
+list_update() turns the old and new schedule into the smallest UpdateItem
+actions on the list attribute: per-index field SETs, REMOVEs of list
+indexes, a list_append, or (when entries were reordered) the whole list.
+Writes are conditioned on the item's version number so concurrent edits
+fail with VersionConflict instead of overwriting each other.
+"""
+import re
+
+import scheduler
+
+OPS = ('add', 'remove', 'move', 'resize', 'update_note')
+NOTE_FIELDS = ('reasoning', 'wellness_note')
+DAY_MINUTES = 24 * 60
+
+class PatchError(ValueError):
+    """A patch operation cannot be applied to the stored schedule"""
+
+class VersionConflict(Exception):
+    """The schedule changed since it was read; answered with a 409"""
+
+    def __init__(self, *dates):
+        super().__init__(
+            f"The schedule for {', '.join(dates)} was changed by another request. Reload it and try again."
+        )
+
+def match_names(names, target):
+    """Indexes of the names equal to the target (case-insensitive), or else of
+    those containing it as whole words"""
+    target = target.strip().lower()
+    exact = [i for i, name in enumerate(names) if name.lower() == target]
+    if exact:
+        return exact
+    pattern = re.compile(r'\b' + re.escape(target) + r'\b')
+    return [i for i, name in enumerate(names) if pattern.search(name.lower())]
+
+def _matches(schedule, op):
+    """Indexes of the entries an operation targets"""
+    if isinstance(op.get('index'), int):
+        if not 0 <= op['index'] < len(schedule):
+            raise PatchError(f"No schedule entry at index {op['index']}")
+        return [op['index']]
+
+    name = str(op.get('task') or '').strip().lower()
+    if not name:
+        raise PatchError(f"{op['op']} needs a task or an index")
+    found = match_names([entry.get('task', '') for entry in schedule], name)
+    if not found:
+        raise PatchError(f"No task named {op.get('task')!r} in the schedule")
+    return found
+
+def _single(schedule, op):
+    indexes = _matches(schedule, op)
+    if len(indexes) > 1:
+        raise PatchError(f"{op.get('task')!r} matches {len(indexes)} entries; give an index")
+    return indexes[0]
+
+def _span(op):
+    """(start, end) minutes from an operation's "time" range"""
+    span = scheduler.parse_time_range(op.get('time'))
+    if span is None or not 0 <= span[0] < span[1] <= DAY_MINUTES:
+        raise PatchError(f"{op['op']} needs a time range like \"2:00-3:00 PM\"")
+    return span
+
+def _start(entry):
+    span = scheduler.parse_time_range(entry.get('time'))
+    return span[0] if span else DAY_MINUTES
+
+def apply(schedule, ops):
+    """The schedule after applying patch operations in order (the input is not modified)"""
+    schedule = [dict(entry) for entry in schedule]
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in OPS:
+            raise PatchError(f"Unknown patch operation: {kind!r}")
+
+        if kind == 'add':
+            start, end = _span(op)
+            if not op.get('task'):
+                raise PatchError('add needs a task')
+            schedule.append({
+                'time': scheduler.format_range(start, end),
+                'task': op['task'],
+                'reasoning': op.get('reasoning', ''),
+                'wellness_note': op.get('wellness_note', '')
+            })
+        elif kind == 'remove':
+            removed = set(_matches(schedule, op))
+            schedule = [entry for i, entry in enumerate(schedule) if i not in removed]
+        elif kind == 'move':
+            entry = schedule[_single(schedule, op)]
+            if op.get('time'):
+                start, end = _span(op)
+            else:
+                start = scheduler.parse_clock(op.get('start'))
+                if start is None:
+                    raise PatchError('move needs a start time or a time range')
+                end = start + (scheduler.entry_minutes(entry) or 0)
+                if end > DAY_MINUTES:
+                    raise PatchError(f"{entry['task']} would run past midnight")
+            entry['time'] = scheduler.format_range(start, end)
+        elif kind == 'resize':
+            entry = schedule[_single(schedule, op)]
+            minutes = scheduler.parse_duration_minutes(op.get('duration_minutes'))
+            start = _start(entry)
+            if not minutes or minutes <= 0 or start + minutes > DAY_MINUTES:
+                raise PatchError('resize needs a positive duration_minutes that ends the same day')
+            entry['time'] = scheduler.format_range(start, start + minutes)
+        else:
+            entry = schedule[_single(schedule, op)]
+            notes = {field: op[field] for field in NOTE_FIELDS if isinstance(op.get(field), str)}
+            if not notes:
+                raise PatchError('update_note needs a reasoning or wellness_note')
+            entry.update(notes)
+
+    # Stable sort keeps the original order of entries that start together
+    return sorted(schedule, key=_start)
+
+def _removed_indexes(old, new):
+    """Indexes of `old` whose removal leaves `new`, or None if `new` is not a subsequence"""
+    removed = []
+    j = 0
+    for i, entry in enumerate(old):
+        if j < len(new) and new[j] == entry:
+            j += 1
+        else:
+            removed.append(i)
+    return removed if j == len(new) else None
+
+def list_update(attribute, old, new):
+    """UpdateItem actions that turn the list attribute `old` into `new`.
+
+    Returns (set_clauses, remove_clauses, names, values); values are plain
+    Python and still need serializing. All clauses are empty when nothing
+    changed.
+    """
+    names = {'#l': attribute}
+    values = {}
+    sets, removes = [], []
+
+    def value(v):
+        key = f':l{len(values)}'
+        values[key] = v
+        return key
+
+    fields = {}
+    def field(name):
+        if name not in fields:
+            fields[name] = f'#f{len(fields)}'
+            names[fields[name]] = name
+        return fields[name]
+
+    if old == new:
+        return sets, removes, {}, {}
+
+    if len(old) == len(new):
+        changed = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+        # Per-field writes only pay off while few entries changed
+        if len(changed) * 2 <= len(new):
+            for i in changed:
+                a, b = old[i], new[i]
+                for name in sorted(set(a) | set(b)):
+                    if name not in b:
+                        removes.append(f'#l[{i}].{field(name)}')
+                    elif a.get(name) != b[name]:
+                        sets.append(f'#l[{i}].{field(name)} = {value(b[name])}')
+            return sets, removes, names, values
+
+    removed = _removed_indexes(old, new) if len(new) < len(old) else None
+    if removed is not None:
+        removes.extend(f'#l[{i}]' for i in removed)
+    elif new[:len(old)] == old:
+        sets.append(f'#l = list_append(#l, {value(new[len(old):])})')
+    else:
+        sets.append(f'#l = {value(new)}')
+    return sets, removes, names, values
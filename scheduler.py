@@ -0,0 +1,308 @@
+"""Deterministic scheduling engine.
+
+The model extracts tasks (name, duration, difficulty, fixed start) and the
+mood; this module does the time arithmetic: it orders tasks by the mood's
+rules, packs them forward from the start time around fixed appointments,
+inserts breaks and returns the schedule plus the overflow that did not fit.
+All times are minutes since midnight.
+"""
+import re
+
+DEFAULT_START_MINUTES = 9 * 60
+DEFAULT_END_MINUTES = 17 * 60
+
+# Gaps shorter than this before an appointment are left empty rather than
+# filled with a sliver of a task
+MIN_BLOCK_MINUTES = 15
+
+DIFFICULTY_RANK = {'easy': 0, 'medium': 1, 'hard': 2}
+
+CLOCK_PATTERN = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*([AaPp])?\.?\s*[Mm]?\.?')
+RANGE_PATTERN = re.compile(
+    r'(\d{1,2}(?::\d{2})?)\s*([AaPp][Mm])?\s*[-–]\s*(\d{1,2}(?::\d{2})?)\s*([AaPp][Mm])?'
+)
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(h|hr|hrs|hour|hours|m|min|mins|minute|minutes)\b')
+# A bare number ("120"), as in a "duration_minutes" string, is minutes
+BARE_MINUTES_PATTERN = re.compile(r'\s*(\d+(?:\.\d+)?)\s*')
+
+def parse_clock(text):
+    """"9:00 AM", "5 pm" or "17:30" -> minutes since midnight, or None"""
+    match = CLOCK_PATTERN.search(text or '')
+    if not match:
+        return None
+
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    meridiem = (match.group(3) or '').upper()
+    if hour > 23 or minute > 59:
+        return None
+    if meridiem == 'P' and hour != 12:
+        hour += 12
+    elif meridiem == 'A' and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+def parse_window(start_text, end_text):
+    """Start/end minutes for a planning window, with 9-5 fallbacks.
+
+    An end time without AM/PM (e.g. "5:00") that would fall before the start
+    is read as PM.
+    """
+    start = parse_clock(start_text)
+    end = parse_clock(end_text)
+    if start is None:
+        start = DEFAULT_START_MINUTES
+    if end is None:
+        end = DEFAULT_END_MINUTES
+    if end <= start and end < 12 * 60:
+        end += 12 * 60
+    return start, end
+
+def format_clock(minutes, meridiem=True):
+    """Minutes since midnight -> "9:00 AM" (or "9:00" without meridiem)"""
+    hour, minute = divmod(int(minutes) % (24 * 60), 60)
+    display_hour = hour % 12 or 12
+    if not meridiem:
+        return f"{display_hour}:{minute:02d}"
+    return f"{display_hour}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+def format_range(start, end):
+    """"9:00-11:00 AM", or "11:30 AM-12:30 PM" when the meridiem changes"""
+    if (start < 12 * 60) == (end < 12 * 60) and end < 24 * 60:
+        return f"{format_clock(start, meridiem=False)}-{format_clock(end)}"
+    return f"{format_clock(start)}-{format_clock(end)}"
+
+def parse_time_range(text):
+    """"9:00-11:00 AM" or "11:30 AM-12:30 PM" -> (start, end) minutes, or None"""
+    match = RANGE_PATTERN.search(text or '')
+    if not match:
+        return None
+
+    start_text, start_meridiem, end_text, end_meridiem = match.groups()
+    end = parse_clock(f"{end_text} {end_meridiem or ''}")
+    start = parse_clock(f"{start_text} {start_meridiem or end_meridiem or ''}")
+    if start is None or end is None:
+        return None
+    # "11:00-1:00 PM": the start shares the end's meridiem only if that keeps it first
+    if start > end and not start_meridiem:
+        start -= 12 * 60
+    return start, end
+
+def parse_duration_minutes(value):
+    """"2 hours", "1 hour 30 minutes", "1.5h", "45 min", "45" or 45 -> minutes, or None"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    bare = BARE_MINUTES_PATTERN.fullmatch(value or '') if isinstance(value, str) else None
+    if bare:
+        return int(round(float(bare.group(1))))
+
+    total = 0.0
+    found = False
+    for amount, unit in DURATION_PATTERN.findall((value or '').lower()):
+        found = True
+        total += float(amount) * (60 if unit.startswith('h') else 1)
+    return int(round(total)) if found else None
+
+def format_duration(minutes):
+    """90 -> "1 hour 30 minutes", 120 -> "2 hours", 45 -> "45 minutes\""""
+    hours, mins = divmod(int(minutes), 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if mins or not hours:
+        parts.append(f"{mins} minute{'s' if mins != 1 else ''}")
+    return ' '.join(parts)
+
+def _rank(task):
+    return DIFFICULTY_RANK.get(str(task.get('difficulty', 'medium')).lower(), 1)
+
+def order_tasks(tasks, ordering):
+    """Order flexible tasks by a mood rule ordering key (see mood_rules.classify_ordering)"""
+    tasks = list(tasks)
+    if ordering == 'hardest_first':
+        return sorted(tasks, key=lambda task: -_rank(task))
+    if ordering == 'easiest_first':
+        return sorted(tasks, key=_rank)
+    if ordering == 'warmup':
+        # Easy warmup -> medium -> hardest -> easy cooldown
+        ordered = sorted(tasks, key=_rank)
+        if len(ordered) >= 3 and _rank(ordered[1]) == 0:
+            ordered.append(ordered.pop(1))
+        return ordered
+    if ordering == 'mixed':
+        # Alternate challenging and easier tasks
+        ordered = sorted(tasks, key=lambda task: -_rank(task))
+        mixed = []
+        while ordered:
+            mixed.append(ordered.pop(0))
+            if ordered:
+                mixed.append(ordered.pop())
+        return mixed
+    return tasks
+
+def build_schedule(tasks, start_minutes, end_minutes, rules=None):
+    """Pack tasks into the window and return (schedule, unscheduled_tasks).
+
+    Each task is a dict with "task", a duration ("duration_minutes" or
+    "estimated_duration"), and optionally "difficulty", "fixed_start",
+    "reasoning" and "wellness_note". Tasks with a fixed start are placed as
+    appointments; the rest are ordered by the mood rules and packed forward
+    from the start, splitting work into blocks of at most the mood's
+    continuous-work length with breaks in between. Whatever does not fit
+    before the end comes back as unscheduled tasks, and so does a task
+    without a usable duration, so no task is ever dropped.
+    """
+    rules = rules or {}
+    work_cap = rules.get('break_every_minutes') or rules.get('block_max_minutes')
+    break_minutes = rules.get('break_minutes') or 0
+
+    fixed, flexible, unscheduled = [], [], []
+    for task in tasks:
+        stated = task.get('duration_minutes', task.get('estimated_duration'))
+        duration = parse_duration_minutes(stated)
+        if not duration or duration <= 0:
+            unscheduled.append({'task': task['task'], 'estimated_duration': str(stated or 'unknown')})
+            continue
+        fixed_start = parse_clock(task['fixed_start']) if task.get('fixed_start') else None
+        if fixed_start is not None and start_minutes <= fixed_start < end_minutes:
+            fixed.append((fixed_start, min(fixed_start + duration, end_minutes), task))
+        elif fixed_start is not None:
+            unscheduled.append({'task': task['task'], 'estimated_duration': format_duration(duration)})
+        else:
+            flexible.append((task, duration))
+    fixed.sort(key=lambda block: block[0])
+
+    ordering = rules.get('ordering', 'as_given')
+    ordered = order_tasks([task for task, _ in flexible], ordering)
+    durations = {id(task): duration for task, duration in flexible}
+
+    entries = [(start, end, task, None) for start, end, task in fixed]
+    cursor = start_minutes
+    worked = 0
+
+    for task in ordered:
+        remaining = durations[id(task)]
+        segments = []
+        while remaining > 0 and cursor < end_minutes:
+            next_fixed = next((block for block in fixed if block[1] > cursor), None)
+            if next_fixed and next_fixed[0] <= cursor:
+                cursor = next_fixed[1]
+                continue
+            limit = next_fixed[0] if next_fixed else end_minutes
+
+            if work_cap and worked >= work_cap:
+                if break_minutes and cursor + break_minutes < limit:
+                    entries.append((cursor, cursor + break_minutes, None, 'break'))
+                    cursor += break_minutes
+                elif break_minutes:
+                    # No room for a break before the appointment: the gap is the rest
+                    cursor = limit
+                worked = 0
+                continue
+
+            available = limit - cursor
+            if work_cap:
+                available = min(available, work_cap - worked)
+            take = min(remaining, available)
+            if take < MIN_BLOCK_MINUTES and take < remaining:
+                cursor = limit
+                worked = 0
+                continue
+
+            segments.append((cursor, cursor + take))
+            cursor += take
+            worked += take
+            remaining -= take
+
+        for i, (start, end) in enumerate(segments):
+            label = f" (part {i + 1}/{len(segments)})" if len(segments) > 1 else ''
+            entries.append((start, end, task, label))
+        if remaining > 0:
+            unscheduled.append({'task': task['task'], 'estimated_duration': format_duration(remaining)})
+
+    entries.sort(key=lambda entry: entry[0])
+    # A break only makes sense between two blocks of work
+    while entries and entries[-1][3] == 'break':
+        entries.pop()
+    schedule = []
+    for start, end, task, label in entries:
+        if label == 'break':
+            schedule.append({
+                'time': format_range(start, end),
+                'task': 'Break',
+                'reasoning': 'A short recovery break keeps your energy steady for the next block.',
+                'wellness_note': rules.get('break_activities', 'Step away from the screen.')
+            })
+        else:
+            schedule.append({
+                'time': format_range(start, end),
+                'task': task['task'] + (label or ''),
+                'reasoning': task.get('reasoning', ''),
+                'wellness_note': task.get('wellness_note', '')
+            })
+    return schedule, unscheduled
+
+def entry_minutes(entry):
+    """Length of a schedule entry's time range, or of a task's stated duration"""
+    span = parse_time_range(entry.get('time'))
+    if span:
+        return span[1] - span[0]
+    return parse_duration_minutes(entry.get('duration_minutes', entry.get('estimated_duration')))
+
+def booked_minutes(schedule, start_minutes=DEFAULT_START_MINUTES, end_minutes=DEFAULT_END_MINUTES):
+    """Minutes of the planning window covered by a stored schedule's entries (breaks included)"""
+    booked = 0
+    for entry in schedule:
+        if not entry.get('time'):
+            continue
+        span = parse_time_range(entry['time'])
+        if span:
+            # Only the part of the entry inside the window takes up its time
+            booked += max(0, min(span[1], end_minutes) - max(span[0], start_minutes))
+        else:
+            booked += entry_minutes(entry) or 0
+    return booked
+
+def free_minutes(schedule, start_minutes=DEFAULT_START_MINUTES, end_minutes=DEFAULT_END_MINUTES):
+    """Unbooked minutes left in the planning window"""
+    return max(0, end_minutes - start_minutes - booked_minutes(schedule, start_minutes, end_minutes))
+
+def merge_tasks(schedule, tasks, start_minutes=DEFAULT_START_MINUTES, end_minutes=DEFAULT_END_MINUTES):
+    """Add tasks to an existing schedule without moving what is already booked.
+
+    Existing entries become appointments at their current times. A new task
+    keeps its own time range if that slot is still free; otherwise it is
+    packed into the first gaps; a task without a usable duration joins the
+    unscheduled tasks. Returns (schedule, unscheduled_tasks) like
+    build_schedule.
+    """
+    booked = []
+    merged = []
+    for entry in schedule:
+        span = parse_time_range(entry.get('time'))
+        if span is None:
+            continue
+        start_minutes = min(start_minutes, span[0])
+        end_minutes = max(end_minutes, span[1])
+        booked.append(span)
+        merged.append({**entry, 'duration_minutes': span[1] - span[0], 'fixed_start': format_clock(span[0])})
+
+    for task in tasks:
+        duration = entry_minutes(task)
+        if not duration:
+            # build_schedule returns a task it cannot size as unscheduled, so it still reaches this date
+            merged.append({'task': task['task'], 'estimated_duration': task.get('estimated_duration')})
+            continue
+        span = parse_time_range(task.get('time'))
+        overlaps = span is None or any(span[0] < end and start < span[1] for start, end in booked)
+        merged.append({
+            'task': task['task'],
+            'duration_minutes': duration,
+            'fixed_start': None if overlaps else format_clock(span[0]),
+            'reasoning': task.get('reasoning', ''),
+            'wellness_note': task.get('wellness_note', '')
+        })
+        if not overlaps:
+            booked.append(span)
+
+    return build_schedule(merged, start_minutes, end_minutes)
@@ -0,0 +1,147 @@
+"""Bounded conversation memory per session in the moodflow_sessions table.
+
+Each session is one item (partition key "<user_id>#<session_id>", sort key
+"current") holding the last MAX_TURNS
+turns and a rolling summary of the turns that slid out of that window. The
+summary is built without a model call: one clipped line per turn, oldest
+lines dropped after MAX_SUMMARY_LINES, so the same turns always give the
+same text. Only the summary and the window go into the prompt, so its size
+stays constant however long the conversation runs.
+
+The state is stored as zlib-compressed JSON in one Binary attribute, with
+a TTL attribute (expires_at) so idle sessions are deleted by DynamoDB, and
+trimmed to MAX_STATE_BYTES before every write so items stay far below the
+400 KB item limit. A write is conditioned on the turn count it read, so of
+two concurrent turns one is kept whole rather than both half-merged.
+
+Memory is best effort: read and write errors are printed and the request
+goes on without it.
+"""
+import json
+import os
+import time
+import zlib
+
+import aws_clients
+import metrics
+
+# 'on' or 'off'
+MODE = os.environ.get('SESSIONS', 'on')
+TABLE = os.environ.get('SESSIONS_TABLE', 'moodflow_sessions')
+TTL_SECONDS = int(os.environ.get('SESSION_TTL', str(7 * 24 * 3600)))
+MAX_TURNS = int(os.environ.get('SESSION_TURNS', '4'))
+
+CURRENT = 'current'
+MAX_TURN_CHARS = 300
+SUMMARY_LINE_CHARS = 120
+MAX_SUMMARY_LINES = 12
+MAX_STATE_BYTES = 16 * 1024
+
+def empty():
+    return {'summary': [], 'turns': [], 'count': 0}
+
+def _clip(text, limit):
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+def encode(state):
+    return zlib.compress(json.dumps(state, separators=(',', ':')).encode())
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob))
+
+def _key(user_id, session_id):
+    # Scoped to the user, so a session id alone never reads someone else's conversation
+    return aws_clients.serialize_item({'session_id': f'{user_id}#{session_id}', 'timestamp': CURRENT})
+
+@metrics.timed('session_get')
+def load(user_id, session_id):
+    """The stored state of a user's session, or an empty one"""
+    if MODE == 'off' or not session_id:
+        return empty()
+    try:
+        response = aws_clients.client('dynamodb').get_item(TableName=TABLE, Key=_key(user_id, session_id))
+    except Exception as e:
+        print(f"Session read error: {e}")
+        return empty()
+    item = response.get('Item')
+    if item is None:
+        return empty()
+    item = aws_clients.deserialize_item(item)
+    # DynamoDB deletes expired items lazily
+    if item.get('expires_at', 0) < time.time():
+        return empty()
+    return decode(item['state'])
+
+def make_turn(date_str, user_message, response):
+    """The compact record of one exchange"""
+    return {
+        'd': date_str,
+        'm': response.get('mood_detected', 'unknown'),
+        'u': _clip(user_message, MAX_TURN_CHARS),
+        'a': _clip(response.get('response_message', ''), MAX_TURN_CHARS)
+    }
+
+def summary_line(turn):
+    return _clip(f"{turn['d']} ({turn['m']}) user: {turn['u']} | reply: {turn['a']}", SUMMARY_LINE_CHARS)
+
+def _fold_oldest(state):
+    state['summary'] = (state['summary'] + [summary_line(state['turns'].pop(0))])[-MAX_SUMMARY_LINES:]
+
+def add_turn(state, turn):
+    """The state with a new turn, older turns folded into the summary and trimmed to the size cap"""
+    state = {'summary': list(state['summary']), 'turns': state['turns'] + [turn], 'count': state['count'] + 1}
+    while len(state['turns']) > MAX_TURNS:
+        _fold_oldest(state)
+    while len(encode(state)) > MAX_STATE_BYTES and (state['turns'] or state['summary']):
+        if len(state['turns']) > 1:
+            _fold_oldest(state)
+        else:
+            state['summary'] = state['summary'][1:]
+    return state
+
+@metrics.timed('session_save')
+def save(user_id, session_id, state, seen_count):
+    """Write the state unless another turn was recorded since it was read; returns whether it was"""
+    blob = encode(state)
+    metrics.record('session_bytes', len(blob), 'Bytes')
+    try:
+        aws_clients.client('dynamodb').put_item(
+            TableName=TABLE,
+            Item={
+                **_key(user_id, session_id),
+                **aws_clients.serialize_item({
+                    'state': blob,
+                    'turn_count': state['count'],
+                    'expires_at': int(time.time()) + TTL_SECONDS
+                })
+            },
+            ConditionExpression='attribute_not_exists(session_id) OR turn_count = :seen',
+            ExpressionAttributeValues={':seen': aws_clients.to_attribute(seen_count)}
+        )
+        return True
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            print(f"Session write error: {e}")
+        return False
+
+def remember(user_id, session_id, state, date_str, user_message, response):
+    """Record one exchange; `state` is what load() returned earlier in the request, or None to read it now"""
+    if MODE == 'off' or not session_id:
+        return
+    if state is None:
+        state = load(user_id, session_id)
+    save(user_id, session_id, add_turn(state, make_turn(date_str, user_message, response)), state['count'])
+
+def format_context(state):
+    """Prompt text for the summary and recent turns, or "" for a new session"""
+    lines = []
+    if state['summary']:
+        lines.append('Earlier:')
+        lines.extend(f'- {line}' for line in state['summary'])
+    if state['turns']:
+        lines.append('Recent turns (oldest first):')
+        for turn in state['turns']:
+            lines.append(f"[{turn['d']}, {turn['m']}] User: {turn['u']}")
+            lines.append(f"MoodFlow: {turn['a']}")
+    return '\n'.join(lines)
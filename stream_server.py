@@ -0,0 +1,60 @@
+"""Streaming front end for the planning pipeline.
+
+The Python Lambda runtime cannot stream a response by itself, so the
+streaming path runs this small stdlib HTTP server behind the AWS Lambda Web
+Adapter on a Function URL with InvokeMode RESPONSE_STREAM:
+
+    AWS_LWA_INVOKE_MODE=response_stream
+    handler/command: python stream_server.py
+
+Each POST takes the same JSON body as lambda_handler and answers with
+newline-delimited JSON events (see lambda_function.iter_plan_events),
+flushed one chunk per event.
+"""
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import lambda_function
+
+PORT = int(os.environ.get('AWS_LWA_PORT', os.environ.get('PORT', '8080')))
+
+class PlanStreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # Readiness check from the Lambda Web Adapter
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self.send_error(400, 'Request body must be JSON')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        query_params = dict(parse_qsl(urlsplit(self.path).query))
+        # The Lambda Web Adapter passes the invocation's request context (with the authorizer) as a header
+        request_context = json.loads(self.headers.get('x-amzn-request-context') or '{}')
+        for event in lambda_function.iter_plan_events(body, query_params, request_context):
+            line = (json.dumps(event) + '\n').encode()
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        print(format % args)
+
+if __name__ == '__main__':
+    ThreadingHTTPServer(('0.0.0.0', PORT), PlanStreamHandler).serve_forever()